@@ -2,11 +2,11 @@
 # Using different libraries and approaches
 
 import requests
-import re
-import json
 from urllib.parse import parse_qs, urlparse
 import base64
 
+from player_response import extract_player_response
+
 class AlternativeExtractor:
     """Alternative YouTube audio extractor using different methods"""
     
@@ -26,14 +26,12 @@ class AlternativeExtractor:
         """Extract using YouTube embed page (often bypasses restrictions)"""
         try:
             embed_url = f"https://www.youtube.com/embed/{video_id}"
-            response = self.session.get(embed_url)
             
-            # Look for player config in embed page
-            pattern = r'ytInitialPlayerResponse\s*=\s*({.+?});'
-            match = re.search(pattern, response.text)
+            # Look for player config in embed page, stop downloading once it has been read
+            with self.session.get(embed_url, stream=True, timeout=10) as response:
+                player_data = extract_player_response(response.iter_content(chunk_size=64 * 1024))
             
-            if match:
-                player_data = json.loads(match.group(1))
+            if player_data:
                 return self._extract_audio_url(player_data)
                 
         except Exception as e:
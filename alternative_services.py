@@ -4,12 +4,20 @@
 import requests
 import re
 import json
+import time
 from urllib.parse import quote
 
+from instance_registry import instance_registry
+
+# Statuses a working instance answers with, alongside a JSON error, when the video itself failed
+VIDEO_ERROR_STATUS = (400, 404, 410, 422)
+
 class AlternativeServices:
     """Use alternative services that specialize in YouTube audio extraction"""
     
-    def __init__(self):
+    def __init__(self, registry=None):
+        # Instance health is shared with the API so dead proxies are skipped everywhere
+        self.registry = registry or instance_registry
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
@@ -25,26 +33,21 @@ class AlternativeServices:
             "https://vid.puffyan.us"
         ]
         
-        for instance in invidious_instances:
-            try:
-                url = f"{instance}/api/v1/videos/{video_id}"
-                response = self.session.get(url, timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    # Get audio formats
-                    adaptive_formats = data.get('adaptiveFormats', [])
-                    for fmt in adaptive_formats:
-                        if fmt.get('type', '').startswith('audio'):
-                            return {
-                                'url': fmt.get('url'),
-                                'service': f'Invidious ({instance})',
-                                'quality': fmt.get('bitrate', 'unknown')
-                            }
-                            
-            except Exception as e:
+        for instance in self.registry.select(invidious_instances):
+            url = f"{instance}/api/v1/videos/{video_id}"
+            data = self._get_instance_json(instance, url)
+            if data is None:
                 continue
+            
+            # Get audio formats
+            adaptive_formats = data.get('adaptiveFormats', [])
+            for fmt in adaptive_formats:
+                if fmt.get('type', '').startswith('audio'):
+                    return {
+                        'url': fmt.get('url'),
+                        'service': f'Invidious ({instance})',
+                        'quality': fmt.get('bitrate', 'unknown')
+                    }
         
         return None
     
@@ -56,30 +59,48 @@ class AlternativeServices:
             "https://pipedapi-libre.kavin.rocks"
         ]
         
-        for instance in piped_instances:
-            try:
-                url = f"{instance}/streams/{video_id}"
-                response = self.session.get(url, timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    # Get audio streams
-                    audio_streams = data.get('audioStreams', [])
-                    if audio_streams:
-                        # Get the first available audio stream
-                        stream = audio_streams[0]
-                        return {
-                            'url': stream.get('url'),
-                            'service': f'Piped ({instance})',
-                            'quality': stream.get('bitrate', 'unknown')
-                        }
-                        
-            except Exception as e:
+        for instance in self.registry.select(piped_instances):
+            url = f"{instance}/streams/{video_id}"
+            data = self._get_instance_json(instance, url)
+            if data is None:
                 continue
+            
+            # Get audio streams
+            audio_streams = data.get('audioStreams', [])
+            if audio_streams:
+                # Get the first available audio stream
+                stream = audio_streams[0]
+                return {
+                    'url': stream.get('url'),
+                    'service': f'Piped ({instance})',
+                    'quality': stream.get('bitrate', 'unknown')
+                }
         
         return None
     
+    def _get_instance_json(self, instance, url):
+        """Query a proxy instance and report its health; returns {} for video-level errors, None if the instance failed"""
+        started = time.monotonic()
+        try:
+            response = self.session.get(url, timeout=10)
+            # Only a JSON answer shows the API works: 401/403 (blocked, Cloudflare), 429, 5xx
+            # and HTML pages (a 404 from a missing API route) all count against the instance
+            if response.status_code != 200 and response.status_code not in VIDEO_ERROR_STATUS:
+                raise Exception(f"HTTP {response.status_code}")
+            data = response.json()
+            if not isinstance(data, dict):
+                raise Exception("Unexpected response")
+            if response.status_code != 200:
+                if 'error' not in data and 'message' not in data:
+                    raise Exception(f"HTTP {response.status_code} without an API error")
+                data = {}
+        except Exception:
+            self.registry.record_failure(instance, time.monotonic() - started)
+            return None
+        
+        self.registry.record_success(instance, time.monotonic() - started)
+        return data
+    
     def extract_via_cobalt(self, video_id):
         """Extract using Cobalt API (supports many platforms)"""
         cobalt_instances = [
@@ -0,0 +1,173 @@
+# Audio format negotiation
+# Picks what to send a client from the `format=` parameter or its Accept
+# header: the source bytes as they are, the source codec remuxed into
+# another container, or an MP3 re-encode when nothing else will do
+
+from urllib.parse import urlparse, parse_qs
+
+# Output formats: media types that name them, the codec they carry and FFmpeg's muxer
+OUTPUT_FORMATS = {
+    'mp3': {'media_types': ('audio/mpeg', 'audio/mp3'), 'codec': 'mp3', 'muxer': ['-f', 'mp3']},
+    'm4a': {
+        'media_types': ('audio/mp4', 'audio/m4a', 'audio/x-m4a'),
+        'codec': 'aac',
+        # Fragmented so the MP4 can be written to a pipe
+        'muxer': ['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof'],
+    },
+    'aac': {'media_types': ('audio/aac', 'audio/aacp'), 'codec': 'aac', 'muxer': ['-f', 'adts']},
+    'webm': {'media_types': ('audio/webm',), 'codec': 'opus', 'muxer': ['-f', 'webm']},
+    'ogg': {'media_types': ('audio/ogg', 'audio/opus'), 'codec': 'opus', 'muxer': ['-f', 'ogg']},
+}
+
+# Which of the copyable formats wins a tie in the Accept header: no work before a container change
+DELIVERY_COST = {'passthrough': 0, 'remux': 1, 'transcode': 2}
+
+
+class NotAcceptable(Exception):
+    """The client asked for a format the source can't be delivered in without an encoder we don't run"""
+
+    def __init__(self, requested, available):
+        super().__init__(f"Format '{requested}' is not available for this track, try one of: {', '.join(available)}")
+        self.available = available
+
+
+def parse_format(requested):
+    """Normalize a format= parameter; raises ValueError for names that aren't formats"""
+    if not requested:
+        return None
+    requested = requested.strip().lower()
+    if requested != 'auto' and requested not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown format '{requested}', expected one of: auto, {', '.join(OUTPUT_FORMATS)}")
+    return requested
+
+
+def describe_source(mime_type, audio_url=None):
+    """
+    Return {'format', 'codec', 'audio_only'} for a source stream from its MIME type
+    (e.g. 'audio/webm; codecs="opus"') or the googlevideo URL's `mime=` parameter.
+    None when the container isn't one we can pass through or remux.
+    """
+    if not mime_type and audio_url:
+        try:
+            mime_type = parse_qs(urlparse(audio_url).query).get('mime', [None])[0]
+        except (ValueError, TypeError):
+            mime_type = None
+    if not mime_type:
+        return None
+
+    media_type, _, params = mime_type.partition(';')
+    kind, _, subtype = media_type.strip().lower().partition('/')
+    codecs = params.lower()
+
+    if subtype in ('mp4', 'm4a', 'x-m4a'):
+        source_format, codec = 'm4a', 'aac'
+    elif subtype == 'webm':
+        source_format = 'webm'
+        codec = 'vorbis' if 'vorbis' in codecs else 'opus'
+    else:
+        return None
+
+    if 'mp4a' not in codecs and codec == 'aac' and codecs.strip():
+        # An MP4 whose audio isn't AAC (e.g. ec-3) can only be re-encoded
+        return None
+
+    return {'format': source_format, 'codec': codec, 'audio_only': kind == 'audio'}
+
+
+def parse_accept(accept):
+    """Return [(media_type, q)] from an Accept header, skipping malformed entries"""
+    ranges = []
+    for part in (accept or '').split(','):
+        media_type, *params = [piece.strip() for piece in part.split(';')]
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((media_type.lower(), q))
+    return ranges
+
+
+def _explicit_q(ranges, output_format):
+    """Best q the Accept header gives `output_format` by naming one of its media types (wildcards don't count)"""
+    media_types = OUTPUT_FORMATS[output_format]['media_types']
+    matches = [q for media_type, q in ranges if media_type in media_types]
+    return max(matches) if matches else None
+
+
+def accepts_mp3(requested, accept):
+    """Whether an MP3 (e.g. one already transcoded on disk) is an acceptable answer"""
+    if requested:
+        return requested in ('mp3', 'auto')
+
+    ranges = parse_accept(accept)
+    q = _explicit_q(ranges, 'mp3')
+    if q is not None:
+        return q > 0
+    # Anything else the client lists only adds options, unless it has ruled out every other type
+    wildcards = [q for media_type, q in ranges if media_type in ('*/*', 'audio/*')]
+    if wildcards:
+        return max(wildcards) > 0
+    return not any(
+        _explicit_q(ranges, output_format) for output_format in OUTPUT_FORMATS if output_format != 'mp3'
+    )
+
+
+def delivery_mode(source, output_format):
+    if output_format == 'mp3':
+        return 'transcode'
+    if output_format == source['format'] and source['audio_only']:
+        return 'passthrough'
+    return 'remux'
+
+
+def negotiate(source, requested=None, accept=None):
+    """
+    Return (output_format, mode) where mode is 'passthrough', 'remux' or 'transcode'.
+
+    `requested` is the format= parameter: an output format name, or 'auto' for the
+    cheapest delivery. Without it only media types named explicitly in the Accept
+    header opt out of MP3, so clients that send */* keep getting what they always did.
+    Raises ValueError for unknown format names and NotAcceptable for formats the
+    source codec can't be copied into.
+    """
+    copyable = [
+        output_format for output_format, spec in OUTPUT_FORMATS.items()
+        if source and spec['codec'] == source['codec']
+    ]
+    if source and source['codec'] == 'vorbis':
+        # Vorbis only fits the containers it came in
+        copyable = ['webm', 'ogg']
+
+    requested = parse_format(requested)
+    if requested:
+        if requested == 'auto':
+            if not copyable:
+                return 'mp3', 'transcode'
+            output_format = min(copyable, key=lambda name: DELIVERY_COST[delivery_mode(source, name)])
+            return output_format, delivery_mode(source, output_format)
+        if requested == 'mp3':
+            return 'mp3', 'transcode'
+        if requested not in copyable:
+            raise NotAcceptable(requested, copyable + ['mp3'])
+        return requested, delivery_mode(source, requested)
+
+    ranges = parse_accept(accept)
+    best = None
+    for output_format in copyable:
+        q = _explicit_q(ranges, output_format)
+        if not q:
+            continue
+        rank = (q, -DELIVERY_COST[delivery_mode(source, output_format)])
+        if best is None or rank > best[0]:
+            best = (rank, output_format)
+
+    mp3_q = _explicit_q(ranges, 'mp3')
+    if best and (mp3_q is None or best[0][0] >= mp3_q):
+        return best[1], delivery_mode(source, best[1])
+    return 'mp3', 'transcode'
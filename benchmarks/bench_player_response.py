@@ -0,0 +1,89 @@
+# Player response extraction benchmark
+# Compares the non-greedy regexes the scrapers used to run over whole pages
+# with PlayerResponseScanner (its `};` fast path, and brace matching alone)
+# on the page fixtures, whole and fed in 64 KB chunks as PageFetcher does.
+#
+#   python -m benchmarks.bench_player_response [--repeat N]
+
+import argparse
+import json
+import re
+import time
+from unittest import mock
+
+import player_response
+from benchmarks.page_fixtures import FIXTURES, build_page
+from player_response import PlayerResponseScanner, find_player_response
+
+# What stream_direct / stream_ultimate / extract_from_embed tried before the scanner
+OLD_PATTERNS = [
+    re.compile(r'var ytInitialPlayerResponse = ({.+?});'),
+    re.compile(r'ytInitialPlayerResponse\s*=\s*({.+?});'),
+    re.compile(r'"ytInitialPlayerResponse":({.+?}),"'),
+]
+
+CHUNK_SIZE = 64 * 1024
+
+
+def old_regex(page):
+    text = page.decode('utf-8', errors='replace')
+    for pattern in OLD_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            try:
+                return json.loads(match.group(1))
+            except ValueError:
+                continue
+    return None
+
+
+def scanner_streamed(page):
+    """Returns (result, bytes read before the scanner said stop)"""
+    scanner = PlayerResponseScanner()
+    read = 0
+    for start in range(0, len(page), CHUNK_SIZE):
+        chunk = page[start:start + CHUNK_SIZE]
+        read += len(chunk)
+        if scanner.feed(chunk) is not None:
+            break
+    return scanner.close(), read
+
+
+def braces_only(page):
+    with mock.patch.object(player_response, 'FAST_PATH_ATTEMPTS', 0):
+        return find_player_response(page)
+
+
+def timed(func, page, repeat):
+    func(page)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func(page)
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'fixture':<26}{'page KB':>8}  {'method':<18}{'ms/page':>9}  result")
+    for name in FIXTURES:
+        page = build_page(name)
+        expected = find_player_response(page)
+        rows = [
+            ('old regex', old_regex),
+            ('scanner', find_player_response),
+            ('braces only', braces_only),
+            ('scanner, 64 KB', lambda data: scanner_streamed(data)[0]),
+        ]
+        for label, func in rows:
+            ms, result = timed(func, page, args.repeat)
+            verdict = 'ok' if result == expected else 'FAILED'
+            print(f"{name:<26}{len(page) // 1024:>8}  {label:<18}{ms:>9.2f}  {verdict}")
+        _, read = scanner_streamed(page)
+        print(f"{'':<36}bytes read before stopping: {read // 1024} KB of {len(page) // 1024} KB")
+
+
+if __name__ == '__main__':
+    main()
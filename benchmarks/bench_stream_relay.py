@@ -0,0 +1,131 @@
+# Stream relay benchmark
+# Runs many concurrent StreamingResponses over a fake ffmpeg (a child that
+# writes N bytes of "MP3" to stdout) and compares the sync generator the
+# endpoints used to hand Starlette (proc.stdout.read(4096), one threadpool hop
+# per chunk) with ProcessRelay. Reports throughput and how many of anyio's
+# threadpool tokens, which every run_in_threadpool call shares, were taken.
+#
+#   python -m benchmarks.bench_stream_relay [--streams 200] [--size-kb 1024] [--rate-kbps 0]
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+
+import anyio.to_thread
+from starlette.responses import StreamingResponse
+
+from process_relay import start_relay
+
+# Stands in for ffmpeg: `size` bytes in 4 KB writes, optionally paced to `rate` bytes/s
+FAKE_FFMPEG = '''
+import sys, time
+size, rate = int(sys.argv[1]), int(sys.argv[2])
+out = sys.stdout.buffer
+block = b"\\xff" * 4096
+started = time.monotonic()
+for sent in range(0, size, len(block)):
+    if rate:
+        time.sleep(max(0.0, started + sent / rate - time.monotonic()))
+    out.write(block[:size - sent])
+out.flush()
+'''
+
+
+def fake_ffmpeg(size, rate):
+    return [sys.executable, '-c', FAKE_FFMPEG, str(size), str(rate)]
+
+
+def sync_relay(command):
+    """What the endpoints did before ProcessRelay"""
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def generate():
+        try:
+            while True:
+                chunk = proc.stdout.read(4096)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            proc.kill()
+            proc.wait()
+
+    return generate()
+
+
+async def serve(response):
+    """Drive one response through its ASGI interface with a client that reads everything; returns bytes received"""
+    received = 0
+    disconnected = asyncio.Event()
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        nonlocal received
+        if message['type'] == 'http.response.body':
+            received += len(message.get('body', b''))
+
+    scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': [], 'query_string': b''}
+    await response(scope, receive, send)
+    return received
+
+
+async def run(label, make_body, streams, command):
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    peak_tokens = 0
+    token_samples = []
+    done = False
+
+    async def sample():
+        nonlocal peak_tokens
+        while not done:
+            token_samples.append(limiter.borrowed_tokens)
+            peak_tokens = max(peak_tokens, limiter.borrowed_tokens)
+            await asyncio.sleep(0.005)
+
+    async def one():
+        body = await make_body(command)
+        return await serve(StreamingResponse(body, media_type='audio/mpeg'))
+
+    sampler = asyncio.ensure_future(sample())
+    started = time.perf_counter()
+    received = await asyncio.gather(*(one() for _ in range(streams)))
+    elapsed = time.perf_counter() - started
+    done = True
+    await sampler
+
+    total = sum(received)
+    print(
+        f"{label:<18}{streams:>8}{total / 2**20:>10.0f}{elapsed:>9.2f}{total / 2**20 / elapsed:>10.1f}"
+        f"  {f'{peak_tokens}/{limiter.total_tokens}':<14}{sum(token_samples) / max(len(token_samples), 1):>6.1f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--streams', type=int, default=200)
+    parser.add_argument('--size-kb', type=int, default=1024, help="output per stream")
+    parser.add_argument('--rate-kbps', type=int, default=0, help="pace each fake ffmpeg (0: as fast as it can)")
+    args = parser.parse_args()
+
+    command = fake_ffmpeg(args.size_kb * 1024, args.rate_kbps * 1000 // 8)
+
+    async def sync_body(command):
+        return sync_relay(command)
+
+    print(f"{'relay':<18}{'streams':>8}{'MB':>10}{'seconds':>9}{'MB/s':>10}  {'peak threads':<14}{'mean':>6}")
+    await run('sync read(4096)', sync_body, args.streams, command)
+    await run('ProcessRelay', start_relay, args.streams, command)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,148 @@
+# Transcode time-to-first-byte benchmark
+# Starts each transcode profile's FFmpeg command on local fixture files, read
+# straight from disk and from a local HTTP server paced like a throttled
+# googlevideo response, and times the first MP3 byte on stdout. Probing a few
+# seconds of input is cheap from disk but costs real time over a paced source.
+#
+#   python -m benchmarks.bench_transcode_ttfb [--ffmpeg PATH] [--fixtures DIR] [--rate-kbps 512] [--repeat 5]
+#
+# Without --fixtures, a 60 s AAC (.m4a) and Opus (.webm) fixture are generated with FFmpeg.
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from transcode_profiles import PROFILES, mp3_command, resolve_profile
+
+FIXTURE_CODECS = {
+    'aac.m4a': ['-c:a', 'aac', '-b:a', '128k'],
+    'opus.webm': ['-c:a', 'libopus', '-b:a', '128k'],
+}
+
+
+def generate_fixtures(ffmpeg, directory, seconds=60):
+    paths = []
+    for name, codec in FIXTURE_CODECS.items():
+        path = os.path.join(directory, name)
+        # Music-like enough for the encoders: a chord that changes every second
+        source = f"aevalsrc=sin(2*PI*(220+110*floor(t))*t)+0.5*sin(2*PI*330*t):s=48000:d={seconds}"
+        command = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-f', 'lavfi', '-i', source, '-ac', '2', *codec, path]
+        if os.spawnvp(os.P_WAIT, ffmpeg, command) != 0:
+            sys.exit(f"Could not generate {name} with {ffmpeg}")
+        paths.append(path)
+    return paths
+
+
+class PacedServer:
+    """Serves files from a directory at `rate` bytes/s per response, like a throttled CDN"""
+
+    def __init__(self, directory, rate):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = os.path.join(directory, os.path.basename(self.path))
+                try:
+                    f = open(path, 'rb')
+                except OSError:
+                    self.send_error(404)
+                    return
+                with f:
+                    self.send_response(200)
+                    self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+                    self.end_headers()
+                    started = time.monotonic()
+                    sent = 0
+                    try:
+                        while True:
+                            block = f.read(4096)
+                            if not block:
+                                break
+                            time.sleep(max(0.0, started + sent / rate - time.monotonic()))
+                            self.wfile.write(block)
+                            sent += len(block)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, name):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/{name}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+async def first_byte(command, timeout=60):
+    """Seconds from spawning `command` to its first stdout byte (None if it produced none)"""
+    started = time.perf_counter()
+    proc = await asyncio.create_subprocess_exec(
+        *command, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        chunk = await asyncio.wait_for(proc.stdout.read(1), timeout)
+        return time.perf_counter() - started if chunk else None
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ffmpeg', default='ffmpeg')
+    parser.add_argument('--fixtures', help="directory of audio files (default: generate them)")
+    parser.add_argument('--rate-kbps', type=int, default=512, help="pace of the HTTP source")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    ffmpeg = shutil.which(args.ffmpeg)
+    if ffmpeg is None:
+        sys.exit(f"{args.ffmpeg} not found; pass --ffmpeg PATH")
+
+    workdir = tempfile.TemporaryDirectory()
+    if args.fixtures:
+        directory = args.fixtures
+        fixtures = sorted(os.path.join(directory, name) for name in os.listdir(directory))
+    else:
+        directory = workdir.name
+        fixtures = generate_fixtures(ffmpeg, directory)
+
+    server = PacedServer(directory, args.rate_kbps * 1000 // 8)
+    try:
+        print(f"{'fixture':<14}{'source':<14}{'profile':<14}{'median ms':>10}{'min ms':>9}{'max ms':>9}")
+        for path in fixtures:
+            name = os.path.basename(path)
+            sources = [('file', path), (f'http {args.rate_kbps}k', server.url(name))]
+            for source_label, source in sources:
+                for profile_name in PROFILES:
+                    command = mp3_command(source, resolve_profile(profile_name))
+                    command[0] = ffmpeg
+                    times = [await first_byte(command) for _ in range(args.repeat)]
+                    if None in times:
+                        print(f"{name:<14}{source_label:<14}{profile_name:<14}{'no output':>10}")
+                        continue
+                    print(
+                        f"{name:<14}{source_label:<14}{profile_name:<14}"
+                        f"{statistics.median(times) * 1000:>10.0f}{min(times) * 1000:>9.0f}{max(times) * 1000:>9.0f}"
+                    )
+    finally:
+        server.close()
+        workdir.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
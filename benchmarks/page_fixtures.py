@@ -0,0 +1,92 @@
+# Page fixtures
+# Builds watch/embed-shaped pages for the player response benchmarks: the
+# same layout as a real page (head, ytInitialPlayerResponse, then the much
+# larger ytInitialData), with googlevideo URLs escaped the way YouTube embeds
+# them and descriptions that contain `};`, quotes and backslashes
+
+import json
+import random
+
+FIXTURES = {
+    # name: (adaptive formats, description paragraphs, ytInitialData entries, tricky description)
+    'watch_plain': (40, 4, 3000, False),
+    'watch_tricky_description': (40, 40, 3000, True),
+    'embed_small': (16, 2, 0, True),
+}
+
+
+def googlevideo_url(rng, itag):
+    params = '&'.join(f"{key}={rng.getrandbits(256):x}" for key in ('ei', 'ip', 'id', 'sig', 'lsig', 'n', 'sparams', 'pl', 'initcwndbps', 'mh', 'mm', 'mn', 'ms', 'mv'))
+    return f"https://rr{rng.randint(1, 9)}---sn-{rng.getrandbits(24):x}.googlevideo.com/videoplayback?expire=1700000000&itag={itag}&{params}&mime=audio%2Fwebm&dur=212.061"
+
+
+def player_response(rng, formats, paragraphs, tricky):
+    adaptive = []
+    for n in range(formats):
+        itag = (139, 140, 141, 249, 250, 251, 137, 248)[n % 8]
+        adaptive.append({
+            'itag': itag,
+            'url': googlevideo_url(rng, itag),
+            'mimeType': 'audio/webm; codecs="opus"' if itag >= 249 else 'audio/mp4; codecs="mp4a.40.2"',
+            'bitrate': rng.randint(48000, 160000),
+            'initRange': {'start': '0', 'end': str(rng.randint(200, 700))},
+            'indexRange': {'start': '701', 'end': str(rng.randint(900, 1500))},
+            'lastModified': str(rng.getrandbits(52)),
+            'contentLength': str(rng.randint(10 ** 6, 10 ** 7)),
+            'approxDurationMs': '212061',
+        })
+    line = "Official video. Lyrics: never gonna give you up, never gonna let you down"
+    if tricky:
+        # What trips the non-greedy regex: `};` and quotes inside strings
+        line = 'function f(){return {"a":1};} // "quoted" \\ backslash }; ' + line
+    return {
+        'responseContext': {'serviceTrackingParams': [{'service': 'GFEEDBACK', 'params': [{'key': 'e', 'value': str(rng.getrandbits(64))}]}]},
+        'playabilityStatus': {'status': 'OK', 'playableInEmbed': True},
+        'streamingData': {'expiresInSeconds': '21540', 'adaptiveFormats': adaptive, 'formats': adaptive[:2]},
+        'videoDetails': {
+            'videoId': 'dQw4w9WgXcQ',
+            'title': 'Never Gonna Give You Up',
+            'lengthSeconds': '212',
+            'keywords': [f"keyword {n}" for n in range(30)],
+            'shortDescription': '\n'.join(line for _ in range(paragraphs)),
+        },
+        'captions': {'playerCaptionsTracklistRenderer': {'captionTracks': [
+            {'baseUrl': f"https://www.youtube.com/api/timedtext?v=dQw4w9WgXcQ&lang={n:02d}&signature={rng.getrandbits(512):x}",
+             'name': {'simpleText': f"Language {n}"}, 'vssId': f".l{n}", 'isTranslatable': True}
+            for n in range(40)
+        ]}},
+        'storyboards': {'playerStoryboardSpecRenderer': {'spec': '|'.join(f"{rng.getrandbits(256):x}#M$M" for _ in range(40))}},
+        'microformat': {'playerMicroformatRenderer': {'description': {'simpleText': line}, 'lengthSeconds': '212'}},
+        'playerConfig': {'audioConfig': {'loudnessDb': -3.5}, 'webPlayerConfig': {'webPlayerActionsPorting': {
+            f"action{n}": {'clickTrackingParams': f"{rng.getrandbits(512):x}", 'commandMetadata': {'webCommandMetadata': {'apiUrl': '/youtubei/v1/x'}}}
+            for n in range(200)
+        }}},
+    }
+
+
+def initial_data(rng, entries):
+    return {'contents': {'twoColumnWatchNextResults': {'results': [
+        {'compactVideoRenderer': {
+            'videoId': f"{rng.getrandbits(60):011x}"[:11],
+            'title': {'simpleText': f"Related video {n}"},
+            'navigationEndpoint': {'commandMetadata': {'webCommandMetadata': {'url': f"/watch?v={n:011d}"}}},
+            'thumbnail': {'thumbnails': [{'url': f"https://i.ytimg.com/vi/{n:011d}/hqdefault.jpg", 'width': 168}]},
+        }}
+        for n in range(entries)
+    ]}}}
+
+
+def build_page(name):
+    """Page bytes for a fixture, the same every time"""
+    formats, paragraphs, entries, tricky = FIXTURES[name]
+    rng = random.Random(name)
+    # Pages embed the JSON with '/' escaped and & as \u0026 inside URLs
+    player = json.dumps(player_response(rng, formats, paragraphs, tricky)).replace('&', '\\u0026').replace('/', '\\/')
+    head = '<!DOCTYPE html><html><head>' + ''.join(
+        f'<link rel="preload" href="https://www.youtube.com/s/player/{n:08x}/base.js" as="script">' for n in range(200)
+    ) + '<script>var ytcfg = {"EXPERIMENT_FLAGS": {' + ','.join(f'"flag_{n}": true' for n in range(2000)) + '}};</script></head><body>'
+    parts = [head, f'<script nonce="x">var ytInitialPlayerResponse = {player};var meta = document.createElement("meta");</script>']
+    if entries:
+        parts.append(f'<script nonce="x">var ytInitialData = {json.dumps(initial_data(rng, entries))};</script>')
+    parts.append('</body></html>')
+    return ''.join(parts).encode('utf-8')
@@ -0,0 +1,261 @@
+# Transcode broadcaster
+# Listeners of the same track share one FFmpeg process: its output goes into
+# a ring buffer and every listener reads from it with its own cursor
+
+import asyncio
+import itertools
+import time
+from collections import deque
+
+from process_relay import READ_SIZE, process_cpu_seconds, spawn, stop_process
+
+
+class Broadcast:
+    """One running transcode and the ring buffer its listeners read from"""
+
+    def __init__(self, key, command, capacity, writer=None, slot=None, feed=None, read_size=READ_SIZE, on_idle=None):
+        self.key = key
+        self.command = command
+        # Optional async byte source written to the process's stdin
+        self.feed = feed
+        self.capacity = capacity
+        # Optional write-through sink (write/commit/abort), e.g. a transcode cache writer
+        self.writer = writer
+        # Optional scheduler slot (release()), held for as long as the process runs
+        self.slot = slot
+        self.read_size = read_size
+        self.on_idle = on_idle
+        self._chunks = deque()
+        # Sequence number of self._chunks[0]; listener cursors are sequence numbers
+        self._first_seq = 0
+        self.buffered_bytes = 0
+        self.produced_bytes = 0
+        self.listeners = 0
+        self.peak_listeners = 0
+        self.done = False
+        self.returncode = None
+        # CPU seconds the shared process had used when last sampled, and how much of that
+        # listeners that already left were charged with
+        self.cpu_seconds = None
+        self.cpu_charged = 0.0
+        self._proc = None
+        self._feeder = None
+        self._changed = asyncio.Event()
+        self._task = None
+
+    @property
+    def joinable(self):
+        # A finished transcode is only worth joining while it is still complete in the buffer
+        return not self.done or (self.returncode == 0 and self._first_seq == 0)
+
+    async def start(self):
+        """Spawn the process and start relaying its output; a failed spawn raises here, before any response"""
+        try:
+            self._proc, self._feeder = await spawn(self.command, self.feed)
+        except BaseException:
+            self._finish()
+            raise
+        self._task = asyncio.ensure_future(self._produce())
+        self._task.add_done_callback(self._task_done)
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _append(self, chunk):
+        self._chunks.append(chunk)
+        self.buffered_bytes += len(chunk)
+        self.produced_bytes += len(chunk)
+        # Drop the oldest chunks once over capacity (always keep the newest)
+        while self.buffered_bytes > self.capacity and len(self._chunks) > 1:
+            self.buffered_bytes -= len(self._chunks.popleft())
+            self._first_seq += 1
+        if self.writer:
+            self.writer.write(chunk)
+        self._notify()
+
+    async def _produce(self):
+        proc, feeder = self._proc, self._feeder
+        try:
+            sampled_at = time.monotonic()
+            while True:
+                chunk = await proc.stdout.read(self.read_size)
+                if not chunk:
+                    break
+                self._append(chunk)
+                if time.monotonic() - sampled_at >= 1.0:
+                    self._sample(proc)
+                    sampled_at = time.monotonic()
+            self._sample(proc)
+            self.returncode = await proc.wait()
+
+            if self.writer:
+                writer, self.writer = self.writer, None
+                if self.returncode == 0:
+                    # Publishing fsyncs the file, keep that off the event loop
+                    await asyncio.get_running_loop().run_in_executor(None, writer.commit)
+                else:
+                    writer.abort()
+        finally:
+            self._sample(proc)
+            await stop_process(proc, feeder)
+            self._finish()
+
+    def _sample(self, proc):
+        cpu_seconds = process_cpu_seconds(proc.pid)
+        if cpu_seconds is not None:
+            self.cpu_seconds = cpu_seconds
+
+    def _task_done(self, task):
+        # A task cancelled before its first step never runs _produce's finally block
+        if not self.done:
+            if self._proc.returncode is None:
+                # The event loop's child watcher still reaps it
+                self._proc.kill()
+            if self._feeder is not None:
+                self._feeder.cancel()
+            self._finish()
+
+    def _finish(self):
+        if self.writer:
+            # Torn down early (last listener left) or failed: the output is incomplete
+            self.writer.abort()
+            self.writer = None
+        if self.slot:
+            self.slot.release()
+        self.done = True
+        self._notify()
+        if self.listeners == 0 and self.on_idle:
+            self.on_idle(self)
+
+    def listen(self):
+        """
+        Register a listener now and return its iterator over the transcode's output,
+        starting from the oldest byte still buffered. It counts as a listener until
+        closed (aclose()) or exhausted, whether or not it is ever iterated.
+        """
+        self.listeners += 1
+        self.peak_listeners = max(self.peak_listeners, self.listeners)
+        return Listener(self, self._first_seq)
+
+    def _charge(self):
+        """CPU seconds the process used since the previous listener left, now charged to the one leaving"""
+        if self._proc is not None and self._proc.returncode is None:
+            self._sample(self._proc)
+        charge = max(0.0, (self.cpu_seconds or 0.0) - self.cpu_charged)
+        self.cpu_charged += charge
+        return charge
+
+    def _leave(self):
+        self.listeners -= 1
+        if self.listeners == 0:
+            if not self.done and self._task is not None:
+                # Nobody is listening any more: stop the transcode and its upstream fetch
+                self._task.cancel()
+            elif self.on_idle:
+                self.on_idle(self)
+
+    def to_dict(self):
+        return {
+            'key': list(self.key) if isinstance(self.key, tuple) else self.key,
+            'listeners': self.listeners,
+            'peak_listeners': self.peak_listeners,
+            'produced_bytes': self.produced_bytes,
+            'buffered_bytes': self.buffered_bytes,
+            'cpu_seconds': self.cpu_seconds,
+            'done': self.done,
+        }
+
+
+class Listener:
+    """
+    One listener's cursor into a broadcast's ring buffer, as an async iterator.
+    Encoder CPU is charged to listeners as they leave: each takes what the shared
+    process used since the previous one left, so the listeners of a broadcast add
+    up to its total and whoever stays to the end pays for the rest of the encode.
+    """
+
+    def __init__(self, broadcast, cursor):
+        self.broadcast = broadcast
+        self._cursor = cursor
+        self._closed = False
+        self._cpu_seconds = None
+
+    @property
+    def cpu_seconds(self):
+        if self._closed:
+            return self._cpu_seconds
+        # Still listening: what this listener would be charged if it left now
+        if self.broadcast.cpu_seconds is None:
+            return None
+        return max(0.0, self.broadcast.cpu_seconds - self.broadcast.cpu_charged)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        broadcast = self.broadcast
+        while not self._closed:
+            # A listener that fell behind the ring buffer skips ahead to what is left
+            cursor = max(self._cursor, broadcast._first_seq)
+            available = broadcast._first_seq + len(broadcast._chunks)
+            if cursor < available:
+                start = cursor - broadcast._first_seq
+                parts = list(itertools.islice(broadcast._chunks, start, min(start + 16, len(broadcast._chunks))))
+                self._cursor = cursor + len(parts)
+                return parts[0] if len(parts) == 1 else b''.join(parts)
+            if broadcast.done:
+                await self.aclose()
+                break
+            await broadcast._changed.wait()
+        raise StopAsyncIteration
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            self._cpu_seconds = self.broadcast._charge()
+            self.broadcast._leave()
+
+
+class Broadcaster:
+    """Registry of running broadcasts, one per key"""
+
+    def __init__(self, capacity=16 * 1024 * 1024):
+        self.capacity = capacity
+        self._broadcasts = {}
+        self.started = 0
+        self.joined = 0
+
+    def join(self, key):
+        """Listen to the broadcast running for `key`, or None if there is none to join"""
+        broadcast = self._broadcasts.get(key)
+        if broadcast is None or not broadcast.joinable:
+            return None
+        self.joined += 1
+        return broadcast.listen()
+
+    async def start(self, key, command, writer=None, slot=None, feed=None):
+        """
+        Start a broadcast of `command`'s output for `key` and return the first listener.
+        Spawning happens here, so a missing binary raises (with the writer aborted and
+        the slot released) before the caller has sent a response.
+        """
+        broadcast = Broadcast(key, command, self.capacity, writer=writer, slot=slot, feed=feed, on_idle=self._remove)
+        await broadcast.start()
+        self._broadcasts[key] = broadcast
+        self.started += 1
+        return broadcast.listen()
+
+    def _remove(self, broadcast):
+        if self._broadcasts.get(broadcast.key) is broadcast:
+            del self._broadcasts[broadcast.key]
+
+    def stats(self):
+        return {
+            'active': len(self._broadcasts),
+            'listeners': sum(broadcast.listeners for broadcast in self._broadcasts.values()),
+            'started': self.started,
+            'joined': self.joined,
+            'buffer_capacity': self.capacity,
+            'broadcasts': [broadcast.to_dict() for broadcast in self._broadcasts.values()],
+        }
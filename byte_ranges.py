@@ -0,0 +1,44 @@
+# HTTP byte ranges
+# Parsing of single-range `Range: bytes=...` request headers
+
+import re
+
+RANGE_PATTERN = re.compile(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$', re.IGNORECASE)
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested range lies entirely outside the resource"""
+
+
+def parse_range_header(header, size):
+    """
+    Return the inclusive (start, end) a Range header asks for in a resource of
+    `size` bytes, or None when the whole resource should be sent (no header,
+    a malformed one, or multiple ranges, which servers may ignore).
+    Raises RangeNotSatisfiable for ranges that start past the end.
+    """
+    if not header:
+        return None
+
+    match = RANGE_PATTERN.match(header)
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the final N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    if end < start:
+        return None
+    return start, min(end, size - 1)
@@ -0,0 +1,92 @@
+# In-process caches
+# Small thread-safe LRU cache with per-entry expiry, shared by the API's caches
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ExpiringLRUCache:
+    """LRU cache where every entry carries its own expiry time"""
+
+    def __init__(self, max_entries=512, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the cached value, or `default` if missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+            del self._entries[key]
+            self.misses += 1
+
+        self.on_evict(value)
+        return default
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        """Store a value until `expires_at`, or for `ttl` seconds (default_ttl if neither)"""
+        if expires_at is None:
+            expires_at = time.time() + (self.default_ttl if ttl is None else ttl)
+
+        dropped = []
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None and previous[1] is not value:
+                dropped.append(previous[1])
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                dropped.append(self._entries.popitem(last=False)[1][1])
+                self.evictions += 1
+
+        for old_value in dropped:
+            self.on_evict(old_value)
+
+    def on_evict(self, value):
+        """Called outside the lock with each value dropped for space, expiry or replacement"""
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for the debug endpoints"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > time.time()
@@ -0,0 +1,106 @@
+# Blocking work executors
+# Bounded thread pools that keep yt-dlp, requests and Supabase calls off
+# the asyncio event loop
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Kinds of blocking work and their default worker counts.
+# Each can be overridden with <KIND>_CONCURRENCY, e.g. EXTRACTION_CONCURRENCY=4
+DEFAULT_LIMITS = {
+    'extraction': 8,
+    'http': 32,
+    'supabase': 8,
+}
+
+
+def limits_from_env(defaults=DEFAULT_LIMITS):
+    """Read per-kind concurrency limits from the environment"""
+    limits = {}
+    for kind, default in defaults.items():
+        value = os.environ.get(f"{kind.upper()}_CONCURRENCY")
+        try:
+            limits[kind] = max(1, int(value)) if value else default
+        except ValueError:
+            limits[kind] = default
+    return limits
+
+
+class BlockingExecutors:
+    """One bounded thread pool per kind of blocking work"""
+
+    def __init__(self, limits=None):
+        self.limits = dict(limits or limits_from_env())
+        self._pools = {
+            kind: ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"{kind}-worker")
+            for kind, size in self.limits.items()
+        }
+        self._lock = threading.Lock()
+        self._submitted = {kind: 0 for kind in self.limits}
+        self._running = {kind: 0 for kind in self.limits}
+        self._completed = {kind: 0 for kind in self.limits}
+        self._cancelled = {kind: 0 for kind in self.limits}
+
+    async def run(self, kind, func, *args, **kwargs):
+        """Run `func(*args, **kwargs)` on the pool for `kind` and await its result"""
+        pool = self._pools.get(kind)
+        if pool is None:
+            raise ValueError(f"Unknown executor kind: {kind}")
+
+        with self._lock:
+            self._submitted[kind] += 1
+
+        # Run in a copy of the caller's context, as asyncio.to_thread does, so context variables reach the worker
+        context = contextvars.copy_context()
+        future = pool.submit(context.run, self._tracked, kind, func, *args, **kwargs)
+        # Settled from the pool future itself, so a call cancelled while still queued
+        # (its caller gave up) is accounted for too; it never reaches _tracked
+        future.add_done_callback(functools.partial(self._settled, kind))
+        return await asyncio.wrap_future(future)
+
+    def _tracked(self, kind, func, *args, **kwargs):
+        with self._lock:
+            self._running[kind] += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running[kind] -= 1
+
+    def _settled(self, kind, future):
+        with self._lock:
+            if future.cancelled():
+                self._cancelled[kind] += 1
+            else:
+                self._completed[kind] += 1
+
+    def _outstanding(self, kind):
+        # Submitted calls that are queued or running (caller holds the lock)
+        return self._submitted[kind] - self._completed[kind] - self._cancelled[kind]
+
+    def idle_workers(self, kind):
+        """Workers of `kind` that are neither busy nor spoken for by queued calls"""
+        with self._lock:
+            return self.limits[kind] - self._outstanding(kind)
+
+    def stats(self):
+        """Per-kind pool size, running and queued call counts"""
+        with self._lock:
+            return {
+                kind: {
+                    'workers': self.limits[kind],
+                    'running': self._running[kind],
+                    'queued': self._outstanding(kind) - self._running[kind],
+                    'completed': self._completed[kind],
+                    'cancelled': self._cancelled[kind],
+                }
+                for kind in self.limits
+            }
+
+    def shutdown(self, wait=False):
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,68 @@
+# Extraction Cache
+# Remembers resolved audio URLs per video so repeat plays skip extraction
+
+import time
+from urllib.parse import urlparse, parse_qs
+
+from cache import ExpiringLRUCache
+
+
+def audio_url_expiry(audio_url):
+    """Return the unix timestamp from a googlevideo URL's `expire=` parameter, if any"""
+    try:
+        query = parse_qs(urlparse(audio_url).query)
+        expire = query.get('expire')
+        if expire:
+            return float(expire[0])
+    except (ValueError, TypeError):
+        pass
+
+    # Some proxies put the parameters in the path (/expire/1700000000/...)
+    parts = urlparse(audio_url).path.split('/')
+    if 'expire' in parts:
+        try:
+            return float(parts[parts.index('expire') + 1])
+        except (IndexError, ValueError):
+            pass
+
+    return None
+
+
+class ExtractionCache(ExpiringLRUCache):
+    """Resolved audio URLs keyed by video ID, expiring with the signed URL itself"""
+
+    def __init__(self, max_entries=512, default_ttl=1800, safety_margin=120):
+        super().__init__(max_entries=max_entries, default_ttl=default_ttl)
+        # Drop entries a bit before googlevideo does so a stream never starts on a dying URL
+        self.safety_margin = safety_margin
+
+    def store(self, video_id, audio_url, mime_type=None, bitrate=None, method=None, duration=None):
+        """Cache a resolved audio URL together with where it came from"""
+        if not video_id or not audio_url:
+            return None
+
+        now = time.time()
+        expires_at = audio_url_expiry(audio_url)
+        if expires_at is None:
+            expires_at = now + self.default_ttl
+        expires_at -= self.safety_margin
+
+        if expires_at <= now:
+            return None
+
+        entry = {
+            'url': audio_url,
+            'mime_type': mime_type,
+            'bitrate': bitrate,
+            'method': method,
+            'duration': duration,
+            'resolved_at': now,
+        }
+        self.set(video_id, entry, expires_at=expires_at)
+        return entry
+
+    def lookup(self, video_id):
+        """Return the cached entry for a video, or None"""
+        if not video_id:
+            return None
+        return self.get(video_id)
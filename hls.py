@@ -0,0 +1,126 @@
+# HLS output
+# Cuts a track into fixed-duration segments that are each encoded on their
+# own, so a player only fetches (and we only encode) the part it plays, and
+# every segment can be cached or served from a CDN independently
+
+import asyncio
+import math
+from urllib.parse import urlparse, parse_qs
+
+from transcode_profiles import BITRATES
+
+# Segment codecs, each carried in MPEG-TS so timestamps run on across segments
+SEGMENT_CODECS = {
+    'aac': ['-c:a', 'aac'],
+    'mp3': ['-c:a', 'libmp3lame'],
+}
+
+SEGMENT_MEDIA_TYPE = 'video/mp2t'
+PLAYLIST_MEDIA_TYPE = 'application/vnd.apple.mpegurl'
+
+# Segment lengths in seconds a variant may name
+MIN_SEGMENT_SECONDS = 1.0
+MAX_SEGMENT_SECONDS = 30.0
+
+
+def variant_name(codec, bitrate, segment_seconds):
+    """
+    Variant path component of a playlist's segments ('aac-128k-6s'). It names the
+    segment length too, so a segment URL always means the same cut of the track
+    and stays valid (and cacheable for good) when the configured length changes.
+    """
+    return f'{codec}-{bitrate}-{segment_seconds:g}s'
+
+
+def parse_variant(variant):
+    """Split a segment path's variant ('aac-128k-6s') into (codec, bitrate, segment seconds); raises ValueError"""
+    parts = variant.split('-')
+    if len(parts) == 3 and parts[0] in SEGMENT_CODECS and parts[1] in BITRATES and parts[2].endswith('s'):
+        try:
+            segment_seconds = float(parts[2][:-1])
+        except ValueError:
+            segment_seconds = None
+        # Only the canonical spelling, so one cut has exactly one URL
+        if (segment_seconds is not None and MIN_SEGMENT_SECONDS <= segment_seconds <= MAX_SEGMENT_SECONDS
+                and variant_name(parts[0], parts[1], segment_seconds) == variant):
+            return parts[0], parts[1], segment_seconds
+    raise ValueError(f"Unknown HLS variant '{variant}'")
+
+
+def duration_hint(audio_url):
+    """The duration in seconds googlevideo URLs carry in their `dur=` parameter, or None"""
+    try:
+        dur = parse_qs(urlparse(audio_url).query).get('dur', [None])[0]
+        return float(dur) if dur else None
+    except (ValueError, TypeError):
+        return None
+
+
+async def probe_duration(audio_url, timeout=15):
+    """Ask ffprobe for a source's duration in seconds; None when it can't tell"""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            'ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', audio_url,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+    except OSError:
+        return None
+    try:
+        output, _ = await asyncio.wait_for(proc.communicate(), timeout)
+        return float(output.strip()) if proc.returncode == 0 else None
+    except (asyncio.TimeoutError, ValueError):
+        return None
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+
+def segment_count(duration, segment_seconds):
+    return max(1, math.ceil(duration / segment_seconds))
+
+
+def segment_bounds(index, duration, segment_seconds):
+    """(start, length) in seconds of segment `index`; raises IndexError past the end of the track"""
+    if index < 0 or index >= segment_count(duration, segment_seconds):
+        raise IndexError(index)
+    start = index * segment_seconds
+    return start, min(segment_seconds, duration - start)
+
+
+def build_playlist(duration, segment_seconds, codec, bitrate):
+    """VOD media playlist listing every segment of a track as `{variant}/{index}.ts`"""
+    variant = variant_name(codec, bitrate, segment_seconds)
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{math.ceil(segment_seconds)}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+        '#EXT-X-INDEPENDENT-SEGMENTS',
+    ]
+    for index in range(segment_count(duration, segment_seconds)):
+        _, length = segment_bounds(index, duration, segment_seconds)
+        lines.append(f'#EXTINF:{length:.3f},')
+        lines.append(f'{variant}/{index}.ts')
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+
+def segment_command(audio_url, start, length, codec, bitrate):
+    """
+    FFmpeg command that encodes `length` seconds of `audio_url` from `start` into
+    one MPEG-TS segment on stdout. FFmpeg seeks the source itself (a range request
+    for an HTTP URL), and the output timestamps are offset to the segment's place
+    in the track so players see one continuous timeline.
+    """
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-ss', f'{start:.3f}', '-t', f'{length:.3f}',
+        '-i', audio_url,
+        '-vn', *SEGMENT_CODECS[codec], '-b:a', bitrate, '-ar', '44100', '-ac', '2',
+        '-output_ts_offset', f'{start:.3f}',
+        '-f', 'mpegts', 'pipe:1'
+    ]
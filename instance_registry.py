@@ -0,0 +1,136 @@
+# Proxy instance registry
+# Health scoring (latency/error EWMAs), circuit breaking and weighted
+# selection for Invidious/Piped instances
+
+import random
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class InstanceHealth:
+    """Rolling health of one instance"""
+
+    def __init__(self, url, initial_latency):
+        self.url = url
+        self.latency_ewma = initial_latency
+        self.error_ewma = 0.0
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.open_seconds = 0.0
+        self.probe_started = 0.0
+        self.successes = 0
+        self.failures = 0
+
+    def to_dict(self, now):
+        return {
+            'url': self.url,
+            'state': self.state,
+            'latency_ms': round(self.latency_ewma * 1000),
+            'error_rate': round(self.error_ewma, 3),
+            'consecutive_failures': self.consecutive_failures,
+            'retry_in': max(0, round(self.open_until - now)) if self.state == OPEN else None,
+            'successes': self.successes,
+            'failures': self.failures,
+        }
+
+
+class InstanceRegistry:
+    """Tracks instance health and decides which instances a request should try, and in what order"""
+
+    def __init__(self, alpha=0.3, failure_threshold=3, open_seconds=60, max_open_seconds=900,
+                 probe_timeout=30, initial_latency=1.0):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        # A half-open probe that never reports back frees its slot after this long
+        self.probe_timeout = probe_timeout
+        self.initial_latency = initial_latency
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def _get(self, url):
+        health = self._instances.get(url)
+        if health is None:
+            health = self._instances[url] = InstanceHealth(url, self.initial_latency)
+        return health
+
+    def _weight(self, health):
+        # Healthy and fast instances get picked first more often
+        return max(0.05, 1.0 - health.error_ewma) / max(0.05, health.latency_ewma)
+
+    def select(self, candidates):
+        """
+        Return the usable `candidates` in the order they should be tried.
+        Open circuits are skipped; an instance whose cool-down has expired is
+        let through as a single half-open probe, after the healthy ones.
+        """
+        now = time.time()
+        healthy, probes = [], []
+
+        with self._lock:
+            for url in candidates:
+                health = self._get(url)
+
+                if health.state == OPEN and now >= health.open_until:
+                    health.state = HALF_OPEN
+                    health.probe_started = 0.0
+
+                if health.state == CLOSED:
+                    healthy.append(health)
+                elif health.state == HALF_OPEN:
+                    if not health.probe_started or now - health.probe_started > self.probe_timeout:
+                        health.probe_started = now
+                        probes.append(health)
+
+            # Weighted random order (Efraimidis-Spirakis) so load spreads over good instances
+            keyed = [(random.random() ** (1.0 / self._weight(health)), health.url) for health in healthy]
+            keyed.sort(reverse=True)
+
+        return [url for _, url in keyed] + [health.url for health in probes]
+
+    def record_success(self, url, latency):
+        with self._lock:
+            health = self._get(url)
+            health.successes += 1
+            health.latency_ewma += self.alpha * (latency - health.latency_ewma)
+            health.error_ewma += self.alpha * (0.0 - health.error_ewma)
+            health.consecutive_failures = 0
+            health.state = CLOSED
+            health.open_seconds = 0.0
+            health.probe_started = 0.0
+
+    def record_failure(self, url, latency=None):
+        now = time.time()
+        with self._lock:
+            health = self._get(url)
+            health.failures += 1
+            if latency is not None:
+                health.latency_ewma += self.alpha * (latency - health.latency_ewma)
+            health.error_ewma += self.alpha * (1.0 - health.error_ewma)
+            health.consecutive_failures += 1
+
+            # A failed probe re-opens at once with a longer cool-down
+            if health.state == HALF_OPEN or health.consecutive_failures >= self.failure_threshold:
+                if health.open_seconds:
+                    health.open_seconds = min(health.open_seconds * 2, self.max_open_seconds)
+                else:
+                    health.open_seconds = self.base_open_seconds
+                health.state = OPEN
+                health.open_until = now + health.open_seconds
+                health.probe_started = 0.0
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            instances = [health.to_dict(now) for health in self._instances.values()]
+        return sorted(instances, key=lambda entry: (entry['state'] != CLOSED, entry['error_rate'], entry['latency_ms']))
+
+
+# Shared by the API endpoints and AlternativeServices
+instance_registry = InstanceRegistry()
@@ -1,18 +1,44 @@
 from fastapi import FastAPI, Query, HTTPException, Depends, Request
-from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse
+from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import yt_dlp
-import subprocess
+import asyncio
 import os
 import re
 import jwt
 import requests
 import json
+import tempfile
 import time
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+from audio_formats import OUTPUT_FORMATS, NotAcceptable, accepts_mp3, describe_source, negotiate, parse_format
+from broadcaster import Broadcaster
+from byte_ranges import RangeNotSatisfiable, parse_range_header
+from executors import BlockingExecutors
+from extraction_cache import ExtractionCache
+from hls import (
+    PLAYLIST_MEDIA_TYPE, SEGMENT_CODECS, SEGMENT_MEDIA_TYPE, build_playlist, duration_hint,
+    parse_variant, probe_duration, segment_bounds, segment_command
+)
+from instance_registry import instance_registry
+from negative_cache import NegativeCache
+from page_fetcher import PageFetcher
+from playlist_cache import PlaylistCache, playlist_id_from_url
+from prefetch import Prefetcher
+from process_relay import start_relay
+from search_cache import SearchCache, encode_cursor, decode_cursor
+from single_flight import SingleFlight
+from source_fetcher import ResponseRelay, SourceFetcher
+from stream_session import StreamSessions
+from strategy_race import in_race, race_lost, race_strategies, format_timings
+from strategy_ranking import StrategyRanker
+from transcode_cache import TranscodeCache
+from transcode_profiles import PROFILES, QUALITIES, mp3_command, parse_bitrate, resolve_profile
+from transcode_scheduler import TranscodeScheduler, SchedulerFull
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -89,6 +115,36 @@ This API allows you to:
     version="1.0.0"
 )
 
+# Bounded pools for blocking work (yt-dlp, upstream HTTP, Supabase);
+# sizes come from EXTRACTION_CONCURRENCY, HTTP_CONCURRENCY and SUPABASE_CONCURRENCY
+blocking = BlockingExecutors()
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    blocking.shutdown()
+
+# Pooled downloads of transcode sources, fed to FFmpeg over stdin
+source_fetcher = SourceFetcher(
+    chunk_size=int(os.environ.get("SOURCE_CHUNK_KB", "2048")) * 1024,
+    max_connections=int(os.environ.get("SOURCE_CONNECTIONS", "32")),
+    retries=int(os.environ.get("SOURCE_RETRIES", "3"))
+)
+
+# "fetch" downloads sources with source_fetcher, "url" leaves the HTTP to FFmpeg
+TRANSCODE_INPUT = os.environ.get("TRANSCODE_INPUT", "fetch")
+
+# Concurrent range requests per source when a transcode fills the cache (1 disables)
+SOURCE_PARALLEL_CONNECTIONS = int(os.environ.get("SOURCE_PARALLEL_CONNECTIONS", "4"))
+
+@app.on_event("shutdown")
+async def close_source_fetcher():
+    await source_fetcher.close()
+
+# Streamed responses, torn down within STREAM_DISCONNECT_POLL seconds of the client leaving
+stream_sessions = StreamSessions(
+    poll_interval=float(os.environ.get("STREAM_DISCONNECT_POLL", "1.0"))
+)
+
 @app.get("/", response_class=HTMLResponse)
 async def homepage(request: Request):
     """Serve the homepage with API information"""
@@ -155,6 +211,21 @@ def get_ydl_opts(search=False):
     
     return opts
 
+def ydl_extract(ydl_opts, url):
+    """Run a yt-dlp metadata extraction (blocking, call through `blocking.run`)"""
+    if in_race():
+        if race_lost():
+            # The race was decided while this call sat in the queue: nobody wants the result
+            return None
+        # A cancelled loser can't interrupt an extraction, so racing ones are kept short
+        ydl_opts = dict(
+            ydl_opts,
+            socket_timeout=min(ydl_opts.get('socket_timeout', FALLBACK_RACE_SOCKET_TIMEOUT), FALLBACK_RACE_SOCKET_TIMEOUT),
+            retries=min(ydl_opts.get('retries', FALLBACK_RACE_RETRIES), FALLBACK_RACE_RETRIES)
+        )
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return ydl.extract_info(url, download=False)
+
 def extract_video_id(url):
     """Extract YouTube video ID from various URL formats"""
     import re
@@ -169,8 +240,377 @@ def extract_video_id(url):
             return match.group(1)
     return None
 
+# Watch/mobile/embed pages shared by every scraping code path
+page_fetcher = PageFetcher(
+    ttl=int(os.environ.get("PAGE_CACHE_TTL", "60")),
+    max_entries=int(os.environ.get("PAGE_CACHE_SIZE", "64")),
+    error_ttl=int(os.environ.get("PAGE_ERROR_TTL", "5"))
+)
+
+# Success/latency tracking that reorders the stream_mp3 and stream_robust methods
+strategy_ranker = StrategyRanker(
+    window=int(os.environ.get("STRATEGY_WINDOW", "50"))
+)
+
+# Default stagger between methods when /stream_fallback runs in race mode
+FALLBACK_HEDGE_DELAY = float(os.environ.get("FALLBACK_HEDGE_DELAY", "2.0"))
+
+# yt-dlp limits inside a race, which bound how long a losing method's thread keeps running
+FALLBACK_RACE_SOCKET_TIMEOUT = int(os.environ.get("FALLBACK_RACE_SOCKET_TIMEOUT", "15"))
+FALLBACK_RACE_RETRIES = int(os.environ.get("FALLBACK_RACE_RETRIES", "2"))
+
+# Resolved audio URLs shared by every streaming endpoint, keyed by video ID
+extraction_cache = ExtractionCache(
+    max_entries=int(os.environ.get("EXTRACTION_CACHE_SIZE", "512"))
+)
+
+# Concurrent resolutions of the same video share one upstream extraction
+single_flight = SingleFlight()
+
+# Videos known to be private, removed, blocked or bot-checked, with the reason to fail with
+negative_cache = NegativeCache(
+    max_entries=int(os.environ.get("NEGATIVE_CACHE_SIZE", "1024")),
+    ttls={
+        failure_class: int(os.environ[f"NEGATIVE_TTL_{failure_class.upper()}"])
+        for failure_class in ('bot_check', 'private', 'region_blocked', 'age_restricted', 'unavailable')
+        if os.environ.get(f"NEGATIVE_TTL_{failure_class.upper()}")
+    }
+)
+
+def reject_known_failure(video_id):
+    """Fail fast with the cached reason if this video recently failed in a recognised way"""
+    failure = negative_cache.lookup(video_id)
+    if failure:
+        raise HTTPException(
+            status_code=failure['status_code'],
+            detail=failure['detail'],
+            headers={
+                'X-Negative-Cache': failure['class'],
+                'Retry-After': str(max(1, int(failure['expires_at'] - time.time())))
+            }
+        )
+
+def note_page_failure(page):
+    """Record a page's playabilityStatus in the negative cache when the video isn't playable"""
+    if page.ok:
+        negative_cache.note_playability(page.video_id, page.playability_status)
+
+def remember_audio(video_id, audio_url, method, mime_type=None, bitrate=None, duration=None):
+    """Cache a resolved audio URL and return it in the shape the resolvers hand back"""
+    # A video that just resolved is evidently playable again
+    negative_cache.delete(video_id)
+    entry = extraction_cache.store(
+        video_id, audio_url, mime_type=mime_type, bitrate=bitrate, method=method, duration=duration
+    )
+    return entry or {'url': audio_url, 'mime_type': mime_type, 'bitrate': bitrate, 'method': method, 'duration': duration}
+
+def remember_ydl_audio(video_id, info, audio_url, method):
+    """Cache an audio URL resolved by yt-dlp along with its format details"""
+    ext = info.get('ext')
+    abr = info.get('abr')
+    mime_type = None
+    if ext:
+        # Progressive formats carry video too, and the codec decides what the audio can be remuxed into
+        kind = "video" if info.get('vcodec') not in (None, 'none') else "audio"
+        acodec = info.get('acodec')
+        mime_type = f'{kind}/{ext}; codecs="{acodec}"' if acodec and acodec != 'none' else f"{kind}/{ext}"
+    return remember_audio(
+        video_id,
+        audio_url,
+        method,
+        mime_type=mime_type,
+        bitrate=int(abr * 1000) if abr else None,
+        duration=info.get('duration')
+    )
+
+async def resolve_safe_audio(video_id):
+    """Resolve an audio URL with the Android yt-dlp client (raises on extraction errors)"""
+    clean_url = f"https://www.youtube.com/watch?v={video_id}"
+    
+    # Use simple approach that often bypasses detection
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'format': 'bestaudio[ext=m4a]',
+        'user_agent': 'com.google.android.youtube/17.36.4',
+        'extractor_args': {
+            'youtube': {
+                'player_client': ['android'],
+            }
+        }
+    }
+    
+    info = await blocking.run("extraction", ydl_extract, ydl_opts, clean_url)
+    if info and info.get('url'):
+        return remember_ydl_audio(video_id, info, info['url'], "yt-dlp-Safe")
+    return None
+
+# Finished MP3 transcodes on disk, so each track is only encoded once
+transcode_cache = TranscodeCache(
+    os.environ.get("TRANSCODE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "transcode_cache")),
+    max_bytes=int(os.environ.get("TRANSCODE_CACHE_MAX_MB", "2048")) * 1024 * 1024
+)
+
+# Encoder settings used when a request names no profile; its bitrate is part of the transcode cache key
+DEFAULT_TRANSCODE_PROFILE = resolve_profile(os.environ.get("TRANSCODE_PROFILE"))
+
+# Running transcodes, so concurrent listeners of a track share one FFmpeg process
+broadcaster = Broadcaster(
+    capacity=int(os.environ.get("BROADCAST_BUFFER_MB", "16")) * 1024 * 1024
+)
+
+# Admission control for FFmpeg: a slot per transcode, a bounded queue, 503 beyond it
+transcode_scheduler = TranscodeScheduler(
+    slots=int(os.environ.get("TRANSCODE_SLOTS", "0")) or None,
+    max_queue=int(os.environ["TRANSCODE_QUEUE_SIZE"]) if os.environ.get("TRANSCODE_QUEUE_SIZE") else None,
+    queue_timeout=float(os.environ.get("TRANSCODE_QUEUE_TIMEOUT", "30")),
+    retry_after=int(os.environ.get("TRANSCODE_RETRY_AFTER", "5"))
+)
+
+async def admit_transcode():
+    """Wait for a transcode slot, or fail with 503 and Retry-After when the queue is full"""
+    try:
+        return await transcode_scheduler.acquire()
+    except SchedulerFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': str(e.retry_after)})
+
+async def start_transcode(command, feed=None):
+    """Start FFmpeg once admitted and return its output stream; the slot is freed when it exits"""
+    slot = await admit_transcode()
+    return await start_relay(command, slot=slot, feed=feed)
+
+def transcode_input(audio_url, parallel=False):
+    """
+    FFmpeg's `-i` argument for a source, plus the byte source to feed its stdin
+    when we download it ourselves (None when FFmpeg fetches the URL itself).
+    With `parallel` the whole source is pulled over several connections at once,
+    for transcodes that fill the cache rather than just keep up with playback.
+    """
+    if TRANSCODE_INPUT == "fetch" and audio_url.startswith(('http://', 'https://')):
+        if parallel:
+            return 'pipe:0', source_fetcher.iter_source_parallel(audio_url, connections=SOURCE_PARALLEL_CONNECTIONS)
+        return 'pipe:0', source_fetcher.iter_source(audio_url)
+    return audio_url, None
+
+def serve_cached_file(path, media_type, filename, range_header=None):
+    """
+    Stream a file from the transcode cache (opened now, so a later eviction can't
+    pull it away), honouring a single-range Range header with 206 Partial Content.
+    """
+    f = open(path, 'rb')
+    size = os.fstat(f.fileno()).st_size
+    
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except RangeNotSatisfiable:
+        f.close()
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={'Content-Range': f'bytes */{size}'})
+    
+    start, end = byte_range or (0, size - 1)
+    headers = {
+        'Content-Disposition': f'inline; filename="{filename}"',
+        'Content-Length': str(end - start + 1),
+        'Accept-Ranges': 'bytes',
+        'X-Transcode-Cache': 'hit'
+    }
+    if byte_range:
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    
+    def generate():
+        with f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(64 * 1024, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    
+    return StreamingResponse(
+        generate(),
+        status_code=206 if byte_range else 200,
+        media_type=media_type,
+        headers=headers
+    )
+
+def cached_mp3_response(video_id, filename, range_header=None, bitrate=None):
+    """
+    Serve a previously transcoded MP3 from disk, or join a transcode of it that is
+    already running. None if neither exists yet.
+    """
+    if not video_id:
+        return None
+    
+    bitrate = bitrate or DEFAULT_TRANSCODE_PROFILE['bitrate']
+    path = transcode_cache.lookup(video_id, "mp3", bitrate)
+    if path:
+        try:
+            return serve_cached_file(path, "audio/mpeg", filename, range_header)
+        except OSError:
+            pass
+    
+    # Late joiners start from the oldest output still buffered (the whole track for most songs)
+    stream = broadcaster.join((video_id, "mp3", bitrate))
+    if stream is None:
+        return None
+    return StreamingResponse(
+        stream,
+        media_type="audio/mpeg",
+        headers={
+            'Content-Disposition': f'inline; filename="{filename}"',
+            'Accept-Ranges': 'none',
+            'X-Transcode-Shared': 'joined'
+        }
+    )
+
+# Upstream response headers a passthrough stream hands on to the client
+RELAYED_HEADERS = ('Content-Length', 'Content-Range', 'Accept-Ranges')
+
+async def open_upstream_audio(audio_url, headers, range_header=None):
+    """
+    Start a streaming GET of an audio URL, forwarding the client's Range header,
+    and return (response, headers to relay). Seeking or resuming then only costs
+    the bytes actually requested.
+    """
+    request_headers = {name: value for name, value in headers.items() if name.lower() != 'range'}
+    if range_header:
+        request_headers['Range'] = range_header
+    
+    # On the pooled async client, so a hung-up client's download can be closed right away
+    upstream = await source_fetcher.open_stream(audio_url, request_headers)
+    if upstream.status_code == 416:
+        await upstream.aclose()
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={'Content-Range': upstream.headers.get('Content-Range', 'bytes */*')}
+        )
+    try:
+        upstream.raise_for_status()
+    except Exception:
+        await upstream.aclose()
+        raise
+    
+    relayed = {name: upstream.headers[name] for name in RELAYED_HEADERS if name in upstream.headers}
+    if 'Content-Encoding' in upstream.headers:
+        # The body is relayed decoded, so the upstream length no longer applies
+        relayed.pop('Content-Length', None)
+    relayed.setdefault('Accept-Ranges', 'bytes')
+    return upstream, relayed
+
+def iter_upstream(upstream, label):
+    """Relay an opened upstream response body; closing it closes the upstream connection"""
+    return ResponseRelay(upstream, label)
+
+async def stream_mp3_from_url(audio_url: str, filename: str, video_id: str = None, profile=None):
+    """
+    Transcode an audio URL to MP3 with FFmpeg and stream the output. With a
+    video_id the transcode is broadcast: listeners arriving while it runs share
+    the same FFmpeg process, and its output is written through to the transcode
+    cache and published once FFmpeg finishes cleanly.
+    """
+    profile = profile or DEFAULT_TRANSCODE_PROFILE
+    # A live encode can't seek; once published the cached file can
+    headers = {
+        'Content-Disposition': f'inline; filename="{filename}"',
+        'Accept-Ranges': 'none',
+        'X-Transcode-Profile': f"{profile['name']}/{profile['bitrate']}"
+    }
+    
+    if video_id:
+        key = (video_id, "mp3", profile['bitrate'])
+        stream = broadcaster.join(key)
+        if stream is None:
+            slot = await admit_transcode()
+            # Another listener may have started this track while we queued for the slot
+            stream = broadcaster.join(key)
+            if stream is None:
+                # The encode is written through to the transcode cache, so finish it as fast as possible
+                source, feed = transcode_input(audio_url, parallel=True)
+                # Spawned before the response starts, so a missing FFmpeg is a 500 rather than an empty 200
+                stream = await broadcaster.start(
+                    key, mp3_command(source, profile),
+                    writer=transcode_cache.open_writer(*key), slot=slot, feed=feed
+                )
+            else:
+                slot.release()
+        return StreamingResponse(stream, media_type="audio/mpeg", headers=headers)
+    
+    source, feed = transcode_input(audio_url)
+    return StreamingResponse(await start_transcode(mp3_command(source, profile), feed), media_type="audio/mpeg", headers=headers)
+
+def requested_profile(profile, quality):
+    """Validate profile= and quality= up front, before any extraction"""
+    if not profile and not quality:
+        return DEFAULT_TRANSCODE_PROFILE
+    try:
+        return resolve_profile(profile or DEFAULT_TRANSCODE_PROFILE['name'], quality)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def requested_format(format):
+    """Validate a format= parameter up front, before any extraction"""
+    try:
+        return parse_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def stream_negotiated(request: Request, audio, requested, basename, video_id=None, profile=None):
+    """
+    Deliver resolved audio in the format the client negotiated: the upstream bytes
+    as they are (ranges included), the same codec remuxed with `-c:a copy`, or an
+    MP3 encode only when the client needs one.
+    """
+    source = describe_source(audio.get('mime_type'), audio['url'])
+    try:
+        output_format, mode = negotiate(source, requested, request.headers.get('accept'))
+    except NotAcceptable as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    
+    media_type = OUTPUT_FORMATS[output_format]['media_types'][0]
+    filename = f"{basename}.{output_format}"
+    
+    if mode == 'transcode':
+        response = await stream_mp3_from_url(audio['url'], filename, video_id, profile)
+    elif mode == 'passthrough':
+        upstream, relayed = await open_upstream_audio(
+            audio['url'],
+            {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'},
+            request.headers.get('range')
+        )
+        response = StreamingResponse(
+            iter_upstream(upstream, "Passthrough streaming"),
+            status_code=upstream.status_code,
+            media_type=media_type,
+            headers={'Content-Disposition': f'inline; filename="{filename}"', **relayed}
+        )
+    else:
+        source, feed = transcode_input(audio['url'])
+        command = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-i', source,
+            '-vn', '-c:a', 'copy',
+            *OUTPUT_FORMATS[output_format]['muxer'], 'pipe:1'
+        ]
+        response = StreamingResponse(
+            await start_transcode(command, feed),
+            media_type=media_type,
+            headers={'Content-Disposition': f'inline; filename="{filename}"', 'Accept-Ranges': 'none'}
+        )
+    
+    response.headers['X-Audio-Delivery'] = mode
+    response.headers['Vary'] = 'Accept'
+    return response
+
 @app.get("/stream_safe", summary="Safe streaming with video ID extraction", tags=["Streaming"])
-async def stream_safe(url: str = Query(..., description="YouTube video URL or video ID")):
+@stream_sessions.track
+async def stream_safe(
+    request: Request,
+    url: str = Query(..., description="YouTube video URL or video ID"),
+    profile: str = Query(None, description="Transcode profile: standard, low_latency (fastest first byte) or economy"),
+    quality: str = Query(None, description="MP3 bitrate: low, medium, high, max or e.g. 160k")
+):
     """
     Ultra-safe streaming endpoint that uses video ID extraction
     and multiple bypass techniques.
@@ -181,70 +621,34 @@ async def stream_safe(url: str = Query(..., description="YouTube video URL or vi
     if not video_id:
         raise HTTPException(status_code=400, detail="Invalid YouTube URL or video ID")
     
+    settings = requested_profile(profile, quality)
+    cached = cached_mp3_response(video_id, f"{video_id}.mp3", request.headers.get('range'), settings['bitrate'])
+    if cached:
+        return cached
+    
+    reject_known_failure(video_id)
     clean_url = f"https://www.youtube.com/watch?v={video_id}"
     
-    # Try the most reliable method first
+    # Try the most reliable method first, reusing a URL another endpoint resolved recently
     try:
-        # Use simple approach that often bypasses detection
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'format': 'bestaudio[ext=m4a]',
-            'user_agent': 'com.google.android.youtube/17.36.4',
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['android'],
-                }
-            }
-        }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(clean_url, download=False)
-            if info and info.get('url'):
-                audio_url = info['url']
-                
-                # Simple streaming without complex FFmpeg
-                command = [
-                    'ffmpeg', '-hide_banner', '-loglevel', 'quiet',
-                    '-i', audio_url,
-                    '-f', 'mp3', '-ab', '128k',
-                    '-vn', 'pipe:1'
-                ]
-                
-                proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-                
-                def generate():
-                    try:
-                        while True:
-                            chunk = proc.stdout.read(4096)
-                            if not chunk:
-                                break
-                            yield chunk
-                    finally:
-                        if proc.poll() is None:
-                            proc.terminate()
-                
-                return StreamingResponse(
-                    generate(), 
-                    media_type="audio/mpeg",
-                    headers={'Content-Disposition': f'inline; filename="{video_id}.mp3"'}
-                )
-                
+        audio = extraction_cache.lookup(video_id) or await single_flight.run(
+            ("stream_safe", video_id), lambda: resolve_safe_audio(video_id)
+        )
     except Exception as e:
-        # Fallback to robust method
-        return await stream_robust(clean_url)
-
-@app.get("/stream_ultimate", summary="Ultimate bypass with all methods", tags=["Streaming"])
-async def stream_ultimate(url: str = Query(..., description="YouTube video URL or video ID")):
-    """
-    Ultimate streaming endpoint that tries EVERYTHING to bypass restrictions.
-    Uses multiple libraries, APIs, and techniques.
-    """
+        audio = None
+        # A private or removed video will fail the robust methods too
+        if negative_cache.note(video_id, e, final=False):
+            reject_known_failure(video_id)
     
-    # Extract video ID
-    video_id = extract_video_id(url)
-    if not video_id:
-        raise HTTPException(status_code=400, detail="Invalid YouTube URL or video ID")
+    # A full transcode queue is answered with 503 rather than another extraction
+    if audio:
+        return await stream_mp3_from_url(audio['url'], f"{video_id}.mp3", video_id, settings)
+    
+    # Fallback to robust method
+    return await stream_robust(request, clean_url, format=None, profile=profile, quality=quality)
+
+async def resolve_ultimate_audio(video_id):
+    """Resolve an audio URL via InnerTube clients, the embed page, then aggressive yt-dlp"""
     
     # Method 1: Direct API approach (often works when yt-dlp fails)
     try:
@@ -285,10 +689,11 @@ async def stream_ultimate(url: str = Query(..., description="YouTube video URL o
                     'X-YouTube-Client-Version': client['clientVersion']
                 }
                 
-                response = requests.post(api_url, json=payload, headers=headers, timeout=10)
+                response = await blocking.run("http", requests.post, api_url, json=payload, headers=headers, timeout=10)
                 
                 if response.status_code == 200:
                     data = response.json()
+                    negative_cache.note_playability(video_id, data.get('playabilityStatus'))
                     
                     # Extract audio URL from response
                     streaming_data = data.get('streamingData', {})
@@ -298,17 +703,21 @@ async def stream_ultimate(url: str = Query(..., description="YouTube video URL o
                     for fmt in adaptive_formats:
                         mime_type = fmt.get('mimeType', '')
                         if 'audio' in mime_type and fmt.get('url'):
-                            audio_url = fmt['url']
-                            
-                            # Stream directly without yt-dlp
-                            return await stream_direct_url(audio_url, video_id)
+                            return remember_audio(
+                                video_id, fmt['url'], f"InnerTube-{client['clientName']}",
+                                mime_type=mime_type,
+                                bitrate=fmt.get('bitrate')
+                            )
                     
                     # Try regular formats
                     formats = streaming_data.get('formats', [])
                     for fmt in formats:
                         if fmt.get('url'):
-                            audio_url = fmt['url']
-                            return await stream_direct_url(audio_url, video_id)
+                            return remember_audio(
+                                video_id, fmt['url'], f"InnerTube-{client['clientName']}-Format",
+                                mime_type=fmt.get('mimeType'),
+                                bitrate=fmt.get('bitrate')
+                            )
                             
             except Exception as e:
                 continue  # Try next client
@@ -318,38 +727,16 @@ async def stream_ultimate(url: str = Query(..., description="YouTube video URL o
     
     # Method 2: Embed page extraction
     try:
-        embed_url = f"https://www.youtube.com/embed/{video_id}"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Referer': 'https://www.youtube.com/',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
-        }
+        page = await blocking.run("http", page_fetcher.fetch, video_id, 'embed')
+        note_page_failure(page)
         
-        response = requests.get(embed_url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            # Look for player config
-            patterns = [
-                r'ytInitialPlayerResponse\s*=\s*({.+?});',
-                r'"streamingData":({.+?})',
-                r'var ytInitialPlayerResponse = ({.+?});'
-            ]
-            
-            for pattern in patterns:
-                matches = re.findall(pattern, response.text)
-                for match in matches:
-                    try:
-                        if isinstance(match, str):
-                            data = json.loads(match)
-                            streaming_data = data.get('streamingData', {})
-                            
-                            # Extract audio URL
-                            for fmt in streaming_data.get('adaptiveFormats', []):
-                                if 'audio' in fmt.get('mimeType', '') and fmt.get('url'):
-                                    return await stream_direct_url(fmt['url'], video_id)
-                                    
-                    except:
-                        continue
+        # Extract audio URL from the parsed player config
+        for fmt in page.audio_formats() if page.ok else []:
+            return remember_audio(
+                video_id, fmt['url'], "Embed-Page",
+                mime_type=fmt.get('mimeType'),
+                bitrate=fmt.get('bitrate')
+            )
                         
     except Exception as e:
         pass
@@ -386,13 +773,36 @@ async def stream_ultimate(url: str = Query(..., description="YouTube video URL o
         
         clean_url = f"https://www.youtube.com/watch?v={video_id}"
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(clean_url, download=False)
-            if info and info.get('url'):
-                return await stream_direct_url(info['url'], video_id)
-                
+        info = await blocking.run("extraction", ydl_extract, ydl_opts, clean_url)
+        if info and info.get('url'):
+            return remember_ydl_audio(video_id, info, info['url'], "yt-dlp-Ultimate")
+            
     except Exception as e:
-        pass
+        negative_cache.note(video_id, e, final=False)
+    
+    return None
+
+@app.get("/stream_ultimate", summary="Ultimate bypass with all methods", tags=["Streaming"])
+@stream_sessions.track
+async def stream_ultimate(request: Request, url: str = Query(..., description="YouTube video URL or video ID")):
+    """
+    Ultimate streaming endpoint that tries EVERYTHING to bypass restrictions.
+    Uses multiple libraries, APIs, and techniques.
+    """
+    
+    # Extract video ID
+    video_id = extract_video_id(url)
+    if not video_id:
+        raise HTTPException(status_code=400, detail="Invalid YouTube URL or video ID")
+    
+    reject_known_failure(video_id)
+    
+    # Skip extraction entirely if the audio URL is still cached
+    audio = extraction_cache.lookup(video_id) or await single_flight.run(
+        ("stream_ultimate", video_id), lambda: resolve_ultimate_audio(video_id)
+    )
+    if audio:
+        return await stream_direct_url(audio['url'], video_id, request.headers.get('range'))
     
     # All methods failed
     raise HTTPException(
@@ -400,7 +810,7 @@ async def stream_ultimate(url: str = Query(..., description="YouTube video URL o
         detail=f"All extraction methods failed for video {video_id}. This video may be geo-blocked, age-restricted, or unavailable."
     )
 
-async def stream_direct_url(audio_url: str, video_id: str):
+async def stream_direct_url(audio_url: str, video_id: str, range_header: str = None):
     """Stream audio directly from URL without yt-dlp processing"""
     try:
         # Method 1: Direct streaming (fastest)
@@ -410,19 +820,11 @@ async def stream_direct_url(audio_url: str, video_id: str):
         }
         
         # Check if URL is accessible
-        head_response = requests.head(audio_url, headers=headers, timeout=5)
+        head_response = await blocking.run("http", requests.head, audio_url, headers=headers, timeout=5)
         
         if head_response.status_code in [200, 206]:
-            # Stream directly without FFmpeg conversion
-            def generate_direct():
-                try:
-                    with requests.get(audio_url, headers=headers, stream=True, timeout=30) as r:
-                        r.raise_for_status()
-                        for chunk in r.iter_content(chunk_size=8192):
-                            if chunk:
-                                yield chunk
-                except Exception as e:
-                    print(f"Direct streaming error: {e}")
+            # Stream directly without FFmpeg conversion, passing the client's range through
+            upstream, relayed = await open_upstream_audio(audio_url, headers, range_header)
             
             # Detect content type
             content_type = head_response.headers.get('content-type', 'audio/mp4')
@@ -434,39 +836,23 @@ async def stream_direct_url(audio_url: str, video_id: str):
                 filename = f"{video_id}.mp3"
             
             return StreamingResponse(
-                generate_direct(),
+                iter_upstream(upstream, "Direct streaming"),
+                status_code=upstream.status_code,
                 media_type=media_type,
-                headers={'Content-Disposition': f'inline; filename="{filename}"'}
+                headers={'Content-Disposition': f'inline; filename="{filename}"', **relayed}
             )
         
         # Method 2: FFmpeg conversion (if direct streaming fails)
-        command = [
-            'ffmpeg', '-hide_banner', '-loglevel', 'error',
-            '-i', audio_url,
-            '-f', 'mp3', '-ab', '96k',  # Lower bitrate for faster processing
-            '-vn', '-y', 'pipe:1'
-        ]
-        
-        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        
-        def generate_converted():
-            try:
-                while True:
-                    chunk = proc.stdout.read(4096)
-                    if not chunk:
-                        break
-                    yield chunk
-            finally:
-                if proc.poll() is None:
-                    proc.terminate()
-                    proc.wait()
+        command = mp3_command(audio_url, resolve_profile('economy'))  # Lower bitrate for faster processing
         
         return StreamingResponse(
-            generate_converted(),
+            await start_transcode(command),
             media_type="audio/mpeg",
             headers={'Content-Disposition': f'inline; filename="{video_id}.mp3"'}
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to stream audio: {str(e)}")
 
@@ -495,7 +881,7 @@ async def test_extraction(url: str = Query(..., description="YouTube video URL o
             }
         }
         
-        response = requests.post(api_url, json=payload, timeout=10)
+        response = await blocking.run("http", requests.post, api_url, json=payload, timeout=10)
         if response.status_code == 200:
             data = response.json()
             streaming_data = data.get('streamingData', {})
@@ -543,17 +929,16 @@ async def test_extraction(url: str = Query(..., description="YouTube video URL o
             }
         }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
-            
-            results["methods"].append({
-                "name": "yt-dlp",
-                "status": "success",
-                "title": info.get('title', 'Unknown'),
-                "duration": info.get('duration'),
-                "has_audio_url": bool(info.get('url'))
-            })
-            
+        info = await blocking.run("extraction", ydl_extract, ydl_opts, f"https://www.youtube.com/watch?v={video_id}")
+        
+        results["methods"].append({
+            "name": "yt-dlp",
+            "status": "success",
+            "title": info.get('title', 'Unknown'),
+            "duration": info.get('duration'),
+            "has_audio_url": bool(info.get('url'))
+        })
+        
     except Exception as e:
         results["methods"].append({
             "name": "yt-dlp",
@@ -563,16 +948,8 @@ async def test_extraction(url: str = Query(..., description="YouTube video URL o
     
     return results
 
-@app.get("/stream_proxy", summary="Stream via proxy services", tags=["Streaming"])
-async def stream_proxy(url: str = Query(..., description="YouTube video URL or video ID")):
-    """
-    Stream using alternative proxy services when YouTube blocks direct access.
-    Uses Invidious, Piped, and other YouTube proxy services.
-    """
-    
-    video_id = extract_video_id(url)
-    if not video_id:
-        raise HTTPException(status_code=400, detail="Invalid YouTube URL or video ID")
+async def resolve_proxy_audio(video_id):
+    """Resolve an audio URL through Invidious/Piped, scraping the watch page as a last resort"""
     
     # Alternative services that can bypass YouTube restrictions
     services_to_try = [
@@ -596,92 +973,91 @@ async def stream_proxy(url: str = Query(..., description="YouTube video URL or v
         }
     ]
     
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
+    
     for service in services_to_try:
-        for instance in service['instances']:
+        # Healthiest instances first, dead ones skipped until their circuit half-opens
+        for instance in instance_registry.select(service['instances']):
+            if service['name'] == 'Invidious':
+                api_url = f"{instance}/api/v1/videos/{video_id}"
+            else:
+                api_url = f"{instance}/streams/{video_id}"
+            
+            started = time.monotonic()
             try:
-                if service['name'] == 'Invidious':
-                    # Try Invidious API
-                    api_url = f"{instance}/api/v1/videos/{video_id}"
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                    }
-                    
-                    response = requests.get(api_url, headers=headers, timeout=10)
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        
-                        # Get audio formats
-                        adaptive_formats = data.get('adaptiveFormats', [])
-                        for fmt in adaptive_formats:
-                            if fmt.get('type', '').startswith('audio'):
-                                audio_url = fmt.get('url')
-                                if audio_url:
-                                    return await stream_from_proxy_url(audio_url, video_id, f"Invidious-{instance}")
-                
-                elif service['name'] == 'Piped':
-                    # Try Piped API
-                    api_url = f"{instance}/streams/{video_id}"
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                    }
-                    
-                    response = requests.get(api_url, headers=headers, timeout=10)
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        
-                        # Get audio streams
-                        audio_streams = data.get('audioStreams', [])
-                        if audio_streams:
-                            audio_url = audio_streams[0].get('url')
-                            if audio_url:
-                                return await stream_from_proxy_url(audio_url, video_id, f"Piped-{instance}")
-                                
+                response = await blocking.run("http", requests.get, api_url, headers=headers, timeout=10)
+                # 429/5xx mean the instance itself is struggling; other 4xx are about the video
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise Exception(f"HTTP {response.status_code}")
+                data = response.json() if response.status_code == 200 else {}
             except Exception as e:
-                # Try next instance
-                continue
+                instance_registry.record_failure(instance, time.monotonic() - started)
+                continue  # Try next instance
+            
+            instance_registry.record_success(instance, time.monotonic() - started)
+            
+            if service['name'] == 'Invidious':
+                # Get audio formats
+                for fmt in data.get('adaptiveFormats', []):
+                    if fmt.get('type', '').startswith('audio') and fmt.get('url'):
+                        return remember_audio(
+                            video_id, fmt['url'], f"Invidious-{instance}",
+                            mime_type=fmt.get('type'),
+                            bitrate=fmt.get('bitrate')
+                        )
+            else:
+                # Get audio streams
+                audio_streams = data.get('audioStreams', [])
+                if audio_streams and audio_streams[0].get('url'):
+                    return remember_audio(
+                        video_id, audio_streams[0]['url'], f"Piped-{instance}",
+                        mime_type=audio_streams[0].get('mimeType'),
+                        bitrate=audio_streams[0].get('bitrate')
+                    )
     
-    # If proxy services fail, try direct extraction with different approach
+    # If proxy services fail, try direct extraction from the (shared) watch page
     try:
-        # Last resort: Use youtube-dl style extraction with different user agent
-        headers = {
-            'User-Agent': 'yt-dlp/2023.07.06',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-us,en;q=0.5',
-            'Sec-Fetch-Mode': 'navigate'
-        }
-        
-        # Try to get video page with different headers
-        video_url = f"https://www.youtube.com/watch?v={video_id}"
-        response = requests.get(video_url, headers=headers, timeout=10)
+        page = await blocking.run("http", page_fetcher.fetch, video_id, 'watch')
+        note_page_failure(page)
         
-        if response.status_code == 200:
-            # Look for any streaming URLs in the page
-            patterns = [
-                r'"url":"([^"]*audioonly[^"]*)"',
-                r'"url":"([^"]*audio[^"]*)"',
-                r'{"url":"([^"]*)"[^}]*"mimeType":"audio',
-            ]
-            
-            for pattern in patterns:
-                matches = re.findall(pattern, response.text)
-                for match in matches:
-                    # Decode URL
-                    audio_url = match.replace('\\u0026', '&').replace('\/', '/')
-                    if 'googlevideo.com' in audio_url:
-                        return await stream_from_proxy_url(audio_url, video_id, "Direct-Extraction")
+        # Look for any audio streaming URLs in the page
+        for audio_url in page.audio_stream_urls() if page.ok else []:
+            return remember_audio(video_id, audio_url, "Direct-Extraction")
                         
     except Exception as e:
         pass
     
+    return None
+
+@app.get("/stream_proxy", summary="Stream via proxy services", tags=["Streaming"])
+@stream_sessions.track
+async def stream_proxy(request: Request, url: str = Query(..., description="YouTube video URL or video ID")):
+    """
+    Stream using alternative proxy services when YouTube blocks direct access.
+    Uses Invidious, Piped, and other YouTube proxy services.
+    """
+    
+    video_id = extract_video_id(url)
+    if not video_id:
+        raise HTTPException(status_code=400, detail="Invalid YouTube URL or video ID")
+    
+    reject_known_failure(video_id)
+    
+    audio = extraction_cache.lookup(video_id) or await single_flight.run(
+        ("stream_proxy", video_id), lambda: resolve_proxy_audio(video_id)
+    )
+    if audio:
+        return await stream_from_proxy_url(audio['url'], video_id, audio['method'] or "Cache", request.headers.get('range'))
+    
     # All methods failed
     raise HTTPException(
         status_code=503,
         detail=f"All proxy services failed for video {video_id}. Video may be geo-blocked, age-restricted, or removed."
     )
 
-async def stream_from_proxy_url(audio_url: str, video_id: str, service_name: str):
+async def stream_from_proxy_url(audio_url: str, video_id: str, service_name: str, range_header: str = None):
     """Stream audio from proxy service URL"""
     try:
         # First check if URL is accessible
@@ -691,25 +1067,15 @@ async def stream_from_proxy_url(audio_url: str, video_id: str, service_name: str
             'Range': 'bytes=0-1023'  # Test with small range first
         }
         
-        test_response = requests.head(audio_url, headers=headers, timeout=5)
+        test_response = await blocking.run("http", requests.head, audio_url, headers=headers, timeout=5)
         
         if test_response.status_code in [200, 206, 416]:  # 416 = Range not satisfiable but file exists
-            # Stream directly without conversion for speed
-            def generate_proxy_stream():
-                try:
-                    stream_headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                        'Referer': 'https://www.youtube.com/'
-                    }
-                    
-                    with requests.get(audio_url, headers=stream_headers, stream=True, timeout=30) as r:
-                        r.raise_for_status()
-                        for chunk in r.iter_content(chunk_size=8192):
-                            if chunk:
-                                yield chunk
-                                
-                except Exception as e:
-                    print(f"Proxy streaming error: {e}")
+            # Stream directly without conversion for speed, passing the client's range through
+            stream_headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+                'Referer': 'https://www.youtube.com/'
+            }
+            upstream, relayed = await open_upstream_audio(audio_url, stream_headers, range_header)
             
             # Detect format from URL or content type
             content_type = test_response.headers.get('content-type', '')
@@ -724,38 +1090,24 @@ async def stream_from_proxy_url(audio_url: str, video_id: str, service_name: str
                 filename = f"{video_id}_via_{service_name}.mp3"
             
             return StreamingResponse(
-                generate_proxy_stream(),
+                iter_upstream(upstream, "Proxy streaming"),
+                status_code=upstream.status_code,
                 media_type=media_type,
                 headers={
                     'Content-Disposition': f'inline; filename="{filename}"',
-                    'X-Service-Used': service_name
+                    'X-Service-Used': service_name,
+                    **relayed
                 }
             )
         else:
             # URL not accessible, try with FFmpeg conversion
-            command = [
-                'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            command = mp3_command(audio_url, DEFAULT_TRANSCODE_PROFILE, input_args=[
                 '-user_agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                '-referer', 'https://www.youtube.com/',
-                '-i', audio_url,
-                '-f', 'mp3', '-ab', '128k', '-vn', 'pipe:1'
-            ]
-            
-            proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            
-            def generate_converted_proxy():
-                try:
-                    while True:
-                        chunk = proc.stdout.read(4096)
-                        if not chunk:
-                            break
-                        yield chunk
-                finally:
-                    if proc.poll() is None:
-                        proc.terminate()
+                '-referer', 'https://www.youtube.com/'
+            ])
             
             return StreamingResponse(
-                generate_converted_proxy(),
+                await start_transcode(command),
                 media_type="audio/mpeg",
                 headers={
                     'Content-Disposition': f'inline; filename="{video_id}_via_{service_name}.mp3"',
@@ -763,45 +1115,93 @@ async def stream_from_proxy_url(audio_url: str, video_id: str, service_name: str
                 }
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to stream from {service_name}: {str(e)}")
 
 @app.get("/stream_fallback", summary="Ultimate fallback with all methods", tags=["Streaming"])
-async def stream_fallback(url: str = Query(..., description="YouTube video URL or video ID")):
+@stream_sessions.track
+async def stream_fallback(
+    request: Request,
+    url: str = Query(..., description="YouTube video URL or video ID"),
+    mode: str = Query("sequential", description="'sequential' tries methods one by one, 'race' runs them concurrently"),
+    hedge_delay: float = Query(FALLBACK_HEDGE_DELAY, description="In race mode, seconds to wait before starting the next method (0 starts all at once)")
+):
     """
-    Ultimate fallback that tries every possible method in sequence:
-    1. Direct YouTube API
-    2. Proxy services (Invidious, Piped)
-    3. Enhanced yt-dlp
-    4. Direct page scraping
+    Ultimate fallback that tries every possible method:
+    1. Proxy services (Invidious, Piped)
+    2. Direct YouTube API and embed page
+    3. Safe yt-dlp extraction
+    4. Robust yt-dlp extraction
+    
+    In race mode the methods run concurrently (staggered by `hedge_delay`), the first
+    playable audio URL wins and the rest are cancelled. The winning method and
+    per-method timings are reported in the X-Fallback-Strategy and
+    X-Fallback-Timings response headers.
     """
     
     video_id = extract_video_id(url)
     if not video_id:
         raise HTTPException(status_code=400, detail="Invalid YouTube URL or video ID")
     
-    # Try each method in order of success probability
+    if mode not in ("sequential", "race"):
+        raise HTTPException(status_code=400, detail="mode must be 'sequential' or 'race'")
+    
+    # A track encoded before needs no method at all
+    cached = cached_mp3_response(video_id, f"{video_id}.mp3", request.headers.get('range'))
+    if cached:
+        return cached
+    
+    # Private/removed videos would only run every method again to the same end
+    reject_known_failure(video_id)
+    
+    range_header = request.headers.get('range')
+    
+    # Each method resolves an audio URL first and only starts streaming once it has won
     methods = [
-        ("Proxy Services", lambda: stream_proxy(url)),
-        ("Ultimate Extraction", lambda: stream_ultimate(url)),
-        ("Safe Method", lambda: stream_safe(url)),
-        ("Robust Method", lambda: stream_robust(url))
+        ("Proxy Services",
+         lambda: resolve_proxy_audio(video_id),
+         lambda audio: stream_from_proxy_url(audio['url'], video_id, audio['method'] or "Cache", range_header)),
+        ("Ultimate Extraction",
+         lambda: resolve_ultimate_audio(video_id),
+         lambda audio: stream_direct_url(audio['url'], video_id, range_header)),
+        ("Safe Method",
+         lambda: resolve_safe_audio(video_id),
+         lambda audio: stream_mp3_from_url(audio['url'], f"{video_id}.mp3", video_id)),
+        ("Robust Method",
+         lambda: resolve_robust_audio(url),
+         lambda audio: stream_mp3_from_url(audio['url'], "audio.mp3", video_id))
     ]
+    responders = {name: respond for name, _, respond in methods}
     
-    errors = []
+    cached = extraction_cache.lookup(video_id)
+    if cached:
+        return await responders["Proxy Services"](cached)
     
-    for method_name, method_func in methods:
-        try:
-            result = await method_func()
-            # If we get here, the method succeeded
-            return result
-            
-        except HTTPException as e:
-            errors.append(f"{method_name}: {e.detail}")
-            continue
-        except Exception as e:
-            errors.append(f"{method_name}: {str(e)}")
-            continue
+    # Concurrent requests for this video with the same settings share one run (the race itself
+    # is what gets coalesced, so its losers are still cancelled as soon as a method wins)
+    hedge = max(0.0, hedge_delay) if mode == "race" else None
+    winner, audio, timings, errors = await single_flight.run(
+        ("stream_fallback", video_id, mode, hedge),
+        lambda: race_strategies(
+            [(name, resolve) for name, resolve, _ in methods],
+            hedge_delay=hedge,
+            # Hedges start only while extraction workers are free, so losers can't pile up in the pool
+            can_start=lambda: blocking.idle_workers("extraction") > 0
+        )
+    )
+    
+    if winner:
+        response = await responders[winner](audio)
+        response.headers['X-Fallback-Strategy'] = winner
+        response.headers['X-Fallback-Timings'] = format_timings(timings)
+        return response
+    
+    # Remember recognisable failures so the next request doesn't repeat all of this
+    for error in errors.values():
+        negative_cache.note(video_id, error)
+    reject_known_failure(video_id)
     
     # All methods failed, return comprehensive error
     raise HTTPException(
@@ -810,7 +1210,8 @@ async def stream_fallback(url: str = Query(..., description="YouTube video URL o
             "message": f"All extraction methods failed for video {video_id}",
             "video_id": video_id,
             "methods_tried": len(methods),
-            "errors": errors,
+            "errors": [f"{name}: {error}" for name, error in errors.items()],
+            "timings": timings,
             "suggestions": [
                 "Video may be geo-blocked or age-restricted",
                 "Try a different video",
@@ -839,21 +1240,21 @@ async def debug_video(url: str = Query(..., description="YouTube video URL or vi
     
     # Test 1: Basic video accessibility
     try:
-        response = requests.get(f"https://www.youtube.com/watch?v={video_id}", timeout=10)
-        if response.status_code == 200:
-            if "Video unavailable" in response.text:
+        page = await blocking.run("http", page_fetcher.fetch, video_id, 'watch')
+        if page.ok:
+            if page.unavailable:
                 debug_results["tests"].append({
                     "method": "Basic Access",
                     "status": "FAILED",
                     "error": "Video unavailable"
                 })
-            elif "Private video" in response.text:
+            elif page.private:
                 debug_results["tests"].append({
                     "method": "Basic Access", 
                     "status": "FAILED",
                     "error": "Private video"
                 })
-            elif "age-restricted" in response.text.lower():
+            elif page.age_restricted:
                 debug_results["tests"].append({
                     "method": "Basic Access",
                     "status": "FAILED", 
@@ -869,7 +1270,7 @@ async def debug_video(url: str = Query(..., description="YouTube video URL or vi
             debug_results["tests"].append({
                 "method": "Basic Access",
                 "status": "FAILED",
-                "error": f"HTTP {response.status_code}"
+                "error": f"HTTP {page.status_code}"
             })
     except Exception as e:
         debug_results["tests"].append({
@@ -881,7 +1282,7 @@ async def debug_video(url: str = Query(..., description="YouTube video URL or vi
     # Test 2: YouTube oEmbed API
     try:
         oembed_url = f"https://www.youtube.com/oembed?url=https://www.youtube.com/watch?v={video_id}&format=json"
-        response = requests.get(oembed_url, timeout=5)
+        response = await blocking.run("http", requests.get, oembed_url, timeout=5)
         if response.status_code == 200:
             data = response.json()
             debug_results["tests"].append({
@@ -913,7 +1314,7 @@ async def debug_video(url: str = Query(..., description="YouTube video URL or vi
     for instance in invidious_instances:
         try:
             api_url = f"{instance}/api/v1/videos/{video_id}"
-            response = requests.get(api_url, timeout=8)
+            response = await blocking.run("http", requests.get, api_url, timeout=8)
             
             if response.status_code == 200:
                 data = response.json()
@@ -960,18 +1361,17 @@ async def debug_video(url: str = Query(..., description="YouTube video URL or vi
     
     for config in yt_dlp_configs:
         try:
-            with yt_dlp.YoutubeDL(config["config"]) as ydl:
-                info = ydl.extract_info(f"https://www.youtube.com/watch?v={video_id}", download=False)
-                
-                debug_results["tests"].append({
-                    "method": f"yt-dlp ({config['name']})",
-                    "status": "SUCCESS",
-                    "title": info.get("title", "Unknown"),
-                    "duration": info.get("duration", 0),
-                    "has_audio_url": bool(info.get("url"))
-                })
-                break  # Found working config
-                
+            info = await blocking.run("extraction", ydl_extract, config["config"], f"https://www.youtube.com/watch?v={video_id}")
+            
+            debug_results["tests"].append({
+                "method": f"yt-dlp ({config['name']})",
+                "status": "SUCCESS",
+                "title": info.get("title", "Unknown"),
+                "duration": info.get("duration", 0),
+                "has_audio_url": bool(info.get("url"))
+            })
+            break  # Found working config
+            
         except Exception as e:
             debug_results["tests"].append({
                 "method": f"yt-dlp ({config['name']})",
@@ -991,7 +1391,8 @@ async def debug_video(url: str = Query(..., description="YouTube video URL or vi
     return debug_results
 
 @app.get("/stream_direct", summary="Direct extraction bypass", tags=["Streaming"])
-async def stream_direct(url: str = Query(..., description="YouTube video URL or video ID")):
+@stream_sessions.track
+async def stream_direct(request: Request, url: str = Query(..., description="YouTube video URL or video ID")):
     """
     Most direct approach - extracts streaming URL from YouTube page source
     without using yt-dlp or external services.
@@ -1001,141 +1402,69 @@ async def stream_direct(url: str = Query(..., description="YouTube video URL or
     if not video_id:
         raise HTTPException(status_code=400, detail="Invalid YouTube URL or video ID")
     
+    reject_known_failure(video_id)
+    range_header = request.headers.get('range')
+    
+    cached = extraction_cache.lookup(video_id)
+    if cached:
+        return await stream_audio_direct(cached['url'], video_id, cached['method'] or "Cache", range_header)
+    
     # Method 1: Direct page source extraction
     try:
-        video_url = f"https://www.youtube.com/watch?v={video_id}"
-        
-        # Use headers that mimic a real browser visit
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1',
-            'Cache-Control': 'max-age=0'
-        }
-        
-        # Add a delay to avoid rate limiting
-        time.sleep(1)
+        # Add a delay to avoid rate limiting (only when we actually hit YouTube)
+        if not page_fetcher.is_cached(video_id, 'watch'):
+            await asyncio.sleep(1)
         
-        response = requests.get(video_url, headers=headers, timeout=15)
+        page = await blocking.run("http", page_fetcher.fetch, video_id, 'watch')
+        note_page_failure(page)
         
-        if response.status_code == 200:
-            page_content = response.text
-            
-            # Extract player response from page
-            patterns = [
-                r'var ytInitialPlayerResponse = ({.+?});',
-                r'"ytInitialPlayerResponse":({.+?}),"',
-                r'ytInitialPlayerResponse":\s*({.+?})\s*[,}]',
-                r'ytInitialPlayerResponse=({.+?});',
-            ]
+        if page.ok:
+            # Find best audio format in the parsed player response
+            audio_formats = page.audio_formats()
+            if audio_formats:
+                # Sort by bitrate and pick the best one
+                best_audio = max(audio_formats, key=lambda fmt: fmt.get('averageBitrate', fmt.get('bitrate', 0)))
+                audio = remember_audio(
+                    video_id, best_audio['url'], "Direct-Page-Extract",
+                    mime_type=best_audio.get('mimeType'),
+                    bitrate=best_audio.get('averageBitrate', best_audio.get('bitrate'))
+                )
+                
+                # Stream directly
+                return await stream_audio_direct(audio['url'], video_id, "Direct-Page-Extract", range_header)
             
-            for pattern in patterns:
-                matches = re.findall(pattern, page_content)
-                for match in matches:
-                    try:
-                        player_data = json.loads(match)
-                        streaming_data = player_data.get('streamingData', {})
-                        
-                        # Look for audio formats
-                        adaptive_formats = streaming_data.get('adaptiveFormats', [])
-                        
-                        # Find best audio format
-                        audio_formats = []
-                        for fmt in adaptive_formats:
-                            mime_type = fmt.get('mimeType', '')
-                            if 'audio' in mime_type and fmt.get('url'):
-                                audio_formats.append({
-                                    'url': fmt['url'],
-                                    'bitrate': fmt.get('averageBitrate', fmt.get('bitrate', 0)),
-                                    'mime': mime_type
-                                })
-                        
-                        if audio_formats:
-                            # Sort by bitrate and pick the best one
-                            best_audio = max(audio_formats, key=lambda x: x['bitrate'])
-                            audio_url = best_audio['url']
-                            
-                            # Stream directly
-                            return await stream_audio_direct(audio_url, video_id, "Direct-Page-Extract")
-                        
-                        # Also try regular formats if no adaptive formats
-                        formats = streaming_data.get('formats', [])
-                        for fmt in formats:
-                            if fmt.get('url'):
-                                audio_url = fmt['url']
-                                return await stream_audio_direct(audio_url, video_id, "Direct-Format")
-                                
-                    except json.JSONDecodeError:
-                        continue
-                    except Exception as e:
-                        continue
+            # Also try regular formats if no adaptive formats
+            for fmt in page.progressive_formats():
+                audio = remember_audio(
+                    video_id, fmt['url'], "Direct-Format",
+                    mime_type=fmt.get('mimeType'),
+                    bitrate=fmt.get('bitrate')
+                )
+                return await stream_audio_direct(audio['url'], video_id, "Direct-Format", range_header)
                         
     except Exception as e:
         pass
     
     # Method 2: Try mobile page
     try:
-        mobile_url = f"https://m.youtube.com/watch?v={video_id}"
-        mobile_headers = {
-            'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 15_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.0 Mobile/15E148 Safari/604.1',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5'
-        }
+        page = await blocking.run("http", page_fetcher.fetch, video_id, 'mobile')
         
-        response = requests.get(mobile_url, headers=mobile_headers, timeout=10)
-        
-        if response.status_code == 200:
-            # Look for any streaming URLs in mobile page
-            streaming_patterns = [
-                r'"url":"([^"]*googlevideo\.com[^"]*)"',
-                r'googlevideo\.com[^"\']*',
-                r'"signatureCipher":"([^"]*)"'
-            ]
-            
-            for pattern in streaming_patterns:
-                matches = re.findall(pattern, response.text)
-                for match in matches:
-                    if 'googlevideo.com' in match:
-                        # Clean up the URL
-                        clean_url = match.replace('\\u0026', '&').replace('\/', '/')
-                        if 'mime=audio' in clean_url or 'itag=140' in clean_url:
-                            return await stream_audio_direct(clean_url, video_id, "Mobile-Extract")
+        # Look for any audio streaming URLs in mobile page
+        for stream_url in page.audio_stream_urls() if page.ok else []:
+            remember_audio(video_id, stream_url, "Mobile-Extract")
+            return await stream_audio_direct(stream_url, video_id, "Mobile-Extract", range_header)
                             
     except Exception as e:
         pass
     
     # Method 3: Try embed page
     try:
-        embed_url = f"https://www.youtube.com/embed/{video_id}"
-        embed_headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Referer': 'https://www.youtube.com/'
-        }
-        
-        response = requests.get(embed_url, headers=embed_headers, timeout=10)
+        page = await blocking.run("http", page_fetcher.fetch, video_id, 'embed')
         
-        if response.status_code == 200:
-            # Look for player config in embed
-            embed_patterns = [
-                r'"url":"([^"]*googlevideo\.com[^"]*audio[^"]*)"',
-                r'"url":"([^"]*itag=140[^"]*)"',  # itag 140 is audio
-                r'googlevideo\.com[^"\']*audio[^"\']*'
-            ]
-            
-            for pattern in embed_patterns:
-                matches = re.findall(pattern, response.text)
-                for match in matches:
-                    if 'googlevideo.com' in match:
-                        clean_url = match.replace('\\u0026', '&').replace('\/', '/')
-                        return await stream_audio_direct(clean_url, video_id, "Embed-Extract")
+        # Look for player config in embed
+        for stream_url in page.audio_stream_urls() if page.ok else []:
+            remember_audio(video_id, stream_url, "Embed-Extract")
+            return await stream_audio_direct(stream_url, video_id, "Embed-Extract", range_header)
                         
     except Exception as e:
         pass
@@ -1148,7 +1477,7 @@ async def stream_direct(url: str = Query(..., description="YouTube video URL or
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         
-        response = requests.get(info_url, headers=info_headers, timeout=10)
+        response = await blocking.run("http", requests.get, info_url, headers=info_headers, timeout=10)
         
         if response.status_code == 200:
             # Parse the response (it's URL encoded)
@@ -1164,18 +1493,24 @@ async def stream_direct(url: str = Query(..., description="YouTube video URL or
                 adaptive_formats = streaming_data.get('adaptiveFormats', [])
                 for fmt in adaptive_formats:
                     if 'audio' in fmt.get('mimeType', '') and fmt.get('url'):
-                        return await stream_audio_direct(fmt['url'], video_id, "VideoInfo-API")
+                        remember_audio(
+                            video_id, fmt['url'], "VideoInfo-API",
+                            mime_type=fmt.get('mimeType'),
+                            bitrate=fmt.get('bitrate')
+                        )
+                        return await stream_audio_direct(fmt['url'], video_id, "VideoInfo-API", range_header)
                         
     except Exception as e:
         pass
     
     # All direct methods failed
+    reject_known_failure(video_id)
     raise HTTPException(
         status_code=503,
         detail=f"All direct extraction methods failed for video {video_id}. The video exists but audio streams are not accessible through direct methods."
     )
 
-async def stream_audio_direct(audio_url: str, video_id: str, method: str):
+async def stream_audio_direct(audio_url: str, video_id: str, method: str, range_header: str = None):
     """Stream audio directly from extracted URL"""
     try:
         # Test if the URL is accessible
@@ -1184,24 +1519,14 @@ async def stream_audio_direct(audio_url: str, video_id: str, method: str):
             'Range': 'bytes=0-1023'
         }
         
-        test_response = requests.head(audio_url, headers=test_headers, timeout=5)
+        test_response = await blocking.run("http", requests.head, audio_url, headers=test_headers, timeout=5)
         
         if test_response.status_code in [200, 206, 416]:
-            # URL is accessible, stream directly
-            def generate_direct_audio():
-                try:
-                    stream_headers = {
-                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                    }
-                    
-                    with requests.get(audio_url, headers=stream_headers, stream=True, timeout=30) as r:
-                        r.raise_for_status()
-                        for chunk in r.iter_content(chunk_size=8192):
-                            if chunk:
-                                yield chunk
-                                
-                except Exception as e:
-                    print(f"Direct audio streaming error: {e}")
+            # URL is accessible, stream directly, passing the client's range through
+            stream_headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            }
+            upstream, relayed = await open_upstream_audio(audio_url, stream_headers, range_header)
             
             # Determine file type from URL or headers
             content_type = test_response.headers.get('content-type', '')
@@ -1216,38 +1541,24 @@ async def stream_audio_direct(audio_url: str, video_id: str, method: str):
                 filename = f"{video_id}_{method}.mp3"
             
             return StreamingResponse(
-                generate_direct_audio(),
+                iter_upstream(upstream, "Direct audio streaming"),
+                status_code=upstream.status_code,
                 media_type=media_type,
                 headers={
                     'Content-Disposition': f'inline; filename="{filename}"',
-                    'X-Extraction-Method': method
+                    'X-Extraction-Method': method,
+                    **relayed
                 }
             )
         
         else:
             # URL not directly accessible, try with FFmpeg
-            command = [
-                'ffmpeg', '-hide_banner', '-loglevel', 'error',
-                '-user_agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                '-i', audio_url,
-                '-f', 'mp3', '-ab', '128k', '-vn', 'pipe:1'
-            ]
-            
-            proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            
-            def generate_converted_audio():
-                try:
-                    while True:
-                        chunk = proc.stdout.read(4096)
-                        if not chunk:
-                            break
-                        yield chunk
-                finally:
-                    if proc.poll() is None:
-                        proc.terminate()
+            command = mp3_command(audio_url, DEFAULT_TRANSCODE_PROFILE, input_args=[
+                '-user_agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            ])
             
             return StreamingResponse(
-                generate_converted_audio(),
+                await start_transcode(command),
                 media_type="audio/mpeg",
                 headers={
                     'Content-Disposition': f'inline; filename="{video_id}_{method}.mp3"',
@@ -1255,11 +1566,14 @@ async def stream_audio_direct(audio_url: str, video_id: str, method: str):
                 }
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to stream via {method}: {str(e)}")
 
 @app.get("/simple_stream", summary="Simplest possible streaming", tags=["Streaming"])
-async def simple_stream(url: str = Query(..., description="YouTube video URL or video ID")):
+@stream_sessions.track
+async def simple_stream(request: Request, url: str = Query(..., description="YouTube video URL or video ID")):
     """
     Absolutely simplest streaming approach - just tries to get any working audio URL
     """
@@ -1268,48 +1582,33 @@ async def simple_stream(url: str = Query(..., description="YouTube video URL or
     if not video_id:
         raise HTTPException(status_code=400, detail="Invalid YouTube URL or video ID")
     
+    reject_known_failure(video_id)
+    
     # Super simple approach - just get the page and look for any audio URL
     try:
-        video_url = f"https://www.youtube.com/watch?v={video_id}"
-        
         # Minimal headers to avoid detection
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         
-        response = requests.get(video_url, headers=headers, timeout=10)
+        page = await blocking.run("http", page_fetcher.fetch, video_id, 'watch')
         
-        if response.status_code == 200:
-            # Look for any googlevideo.com URLs that contain audio
-            audio_patterns = [
-                r'(https://[^"\']*googlevideo\.com[^"\']*audio[^"\']*)',
-                r'(https://[^"\']*googlevideo\.com[^"\']*itag=140[^"\']*)',
-                r'(https://[^"\']*googlevideo\.com[^"\']*mime=audio[^"\']*)'
-            ]
-            
-            for pattern in audio_patterns:
-                matches = re.findall(pattern, response.text)
-                for match in matches:
-                    clean_url = match.replace('\\u0026', '&').replace('\/', '/')
+        # Look for any googlevideo.com URLs that contain audio
+        for clean_url in page.audio_stream_urls() if page.ok else []:
+            # Test if this URL works
+            try:
+                test_response = await blocking.run("http", requests.head, clean_url, headers=headers, timeout=3)
+                if test_response.status_code in [200, 206]:
+                    # This URL works, stream it
+                    upstream = await source_fetcher.open_stream(clean_url, headers)
                     
-                    # Test if this URL works
-                    try:
-                        test_response = requests.head(clean_url, headers=headers, timeout=3)
-                        if test_response.status_code in [200, 206]:
-                            # This URL works, stream it
-                            def simple_generate():
-                                with requests.get(clean_url, headers=headers, stream=True) as r:
-                                    for chunk in r.iter_content(chunk_size=8192):
-                                        if chunk:
-                                            yield chunk
-                            
-                            return StreamingResponse(
-                                simple_generate(),
-                                media_type="audio/mp4",
-                                headers={'Content-Disposition': f'inline; filename="{video_id}_simple.m4a"'}
-                            )
-                    except:
-                        continue
+                    return StreamingResponse(
+                        iter_upstream(upstream, "Simple streaming"),
+                        media_type="audio/mp4",
+                        headers={'Content-Disposition': f'inline; filename="{video_id}_simple.m4a"'}
+                    )
+            except:
+                continue
         
         # If direct extraction fails, return a helpful error
         raise HTTPException(
@@ -1329,45 +1628,143 @@ async def health_check():
         "service": "Music Stream API"
     }
 
+@app.get("/cache_stats", summary="In-process cache statistics", tags=["Debug"])
+async def cache_stats():
+    """Hit/miss counters and sizes for the in-process caches"""
+    return {
+        "extraction": extraction_cache.stats(),
+        "pages": page_fetcher.stats(),
+        "negative": negative_cache.stats(),
+        "coalescing": single_flight.stats(),
+        "prefetch": prefetcher.stats(),
+        "search": search_cache.stats(),
+        "transcodes": transcode_cache.stats(),
+        "broadcasts": broadcaster.stats(),
+    }
+
+@app.get("/instance_health", summary="Proxy instance health", tags=["Debug"])
+async def instance_health():
+    """Latency/error averages and circuit breaker state of the Invidious and Piped instances"""
+    return {"instances": instance_registry.stats()}
+
+@app.get("/strategy_ranking", summary="Current extraction method ranking", tags=["Debug"])
+async def strategy_ranking():
+    """
+    Success rate, average latency and current order of the extraction methods
+    used by /stream_mp3 and /stream_robust. Lower score goes first.
+    """
+    return strategy_ranker.rankings()
+
+@app.post("/strategy_ranking/pin", summary="Pin extraction method order", tags=["Debug"])
+async def pin_strategy_order(
+    group: str = Query(..., description="Method group: stream_mp3 or stream_robust"),
+    order: str = Query("", description="Comma-separated method names to try first, in order. Empty clears the pin")
+):
+    """
+    Force a method order for debugging. Methods not listed keep their ranked order after the pinned ones.
+    """
+    names = [name.strip() for name in order.split(',') if name.strip()]
+    strategy_ranker.pin(group, names)
+    return strategy_ranker.ranking(group)
+
+@app.get("/transcode_profiles", summary="Available transcode profiles", tags=["Debug"])
+async def transcode_profiles():
+    """The named FFmpeg profiles and quality levels the streaming endpoints accept"""
+    return {
+        "default": DEFAULT_TRANSCODE_PROFILE['name'],
+        "profiles": {
+            name: {'description': profile['description'], 'bitrate': profile['bitrate']}
+            for name, profile in PROFILES.items()
+        },
+        "qualities": QUALITIES,
+    }
+
+@app.get("/transcode_stats", summary="FFmpeg admission control statistics", tags=["Debug"])
+async def transcode_stats():
+    """Slots in use, queue depth, rejections and queue wait times of the transcode scheduler"""
+    return transcode_scheduler.stats()
+
+@app.get("/fetch_stats", summary="Transcode source download statistics", tags=["Debug"])
+async def fetch_stats():
+    """Bytes downloaded, range requests, retries and recent throughput of the source fetcher"""
+    return {"input": TRANSCODE_INPUT, **source_fetcher.stats()}
+
+@app.get("/stream_sessions", summary="Live and recent stream sessions", tags=["Debug"])
+async def stream_session_stats():
+    """Bytes sent, duration, time to first byte and encoder CPU time of live and recently finished streams"""
+    return stream_sessions.stats()
+
+@app.get("/executor_stats", summary="Blocking work pool statistics", tags=["Debug"])
+async def executor_stats():
+    """Worker counts, running and queued calls for each blocking work pool"""
+    return blocking.stats()
+
+# Search results per normalized query, pulled lazily and shared by repeated and continued searches
+search_cache = SearchCache(
+    max_entries=int(os.environ.get("SEARCH_CACHE_SIZE", "256")),
+    default_ttl=int(os.environ.get("SEARCH_CACHE_TTL", "900")),
+    max_live=int(os.environ.get("SEARCH_LIVE_SESSIONS", "16"))
+)
+
+def open_search_results(search_query):
+    """Iterate flat search results, fetching result pages only as they are consumed (blocking)"""
+    ydl_opts = get_ydl_opts(search=True)
+    ydl_opts.update({
+        'noplaylist': True,
+        'extract_flat': True,
+    })
+    # process=False leaves the entries as yt-dlp's lazy, page-by-page generator
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(f"ytsearch{search_cache.max_results}:{search_query}", download=False, process=False)
+        yield from info.get('entries') or []
+
 @app.get("/search_results", summary="Search for multiple tracks (songs only)", tags=["Search"])
 async def search_results(
     query: str = Query(..., description="Song or artist to search"),
     limit: int = Query(5, description="Number of results to return"),
     min_duration: int = Query(60, description="Minimum duration in seconds (default 60)"),
-    max_duration: int = Query(900, description="Maximum duration in seconds (default 900, 15min)")
+    max_duration: int = Query(900, description="Maximum duration in seconds (default 900, 15min)"),
+    cursor: str = Query(None, description="Continuation cursor from a previous response, to get the next page")
 ):
     """
     Search YouTube for a track and return a list of the top N results (title, channel, duration, video_id, url), filtered to likely music tracks only.
     Only results with duration between min_duration and max_duration are returned.
+    
+    Results are pulled from YouTube page by page only until `limit` tracks match.
+    `next_cursor` continues from where this page stopped; it is null when there are no more results.
     """
     # Add 'music' to query to bias results toward songs
     search_query = f"{query} music"
-    ydl_opts = get_ydl_opts(search=True)
-    ydl_opts.update({
-        'noplaylist': True,
-        'extract_flat': True,
-    })
+    
+    offset = 0
+    if cursor:
+        try:
+            offset = decode_cursor(cursor, search_query)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    
+    def is_song(entry):
+        # Only keep results with a reasonable song duration
+        duration = entry.get('duration')
+        return duration is not None and min_duration <= duration <= max_duration
     
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(f"ytsearch{limit*2}:{search_query}", download=False)
-            entries = info.get('entries', [])
+        # Repeated and continued searches reuse the results this query already pulled
+        entries, position, has_more = await blocking.run(
+            "extraction", search_cache.take,
+            search_query, offset, limit, is_song, lambda: open_search_results(search_query)
+        )
         results = []
         for entry in entries:
-            duration = entry.get('duration')
-            # Only keep results with a reasonable song duration
-            if duration is not None and min_duration <= duration <= max_duration:
-                results.append({
-                    'title': entry.get('title'),
-                    'channel': entry.get('uploader'),
-                    'duration': duration,
-                    'video_id': entry.get('id'),
-                    'url': f"https://www.youtube.com/watch?v={entry.get('id')}" if entry.get('id') else None,
-                    'thumbnail': entry.get('thumbnail') or f"https://img.youtube.com/vi/{entry.get('id')}/maxresdefault.jpg" if entry.get('id') else None
-                })
-            if len(results) >= limit:
-                break
-        return {"results": results}
+            results.append({
+                'title': entry.get('title'),
+                'channel': entry.get('uploader'),
+                'duration': entry.get('duration'),
+                'video_id': entry.get('id'),
+                'url': f"https://www.youtube.com/watch?v={entry.get('id')}" if entry.get('id') else None,
+                'thumbnail': entry.get('thumbnail') or f"https://img.youtube.com/vi/{entry.get('id')}/maxresdefault.jpg" if entry.get('id') else None
+            })
+        return {"results": results, "next_cursor": encode_cursor(search_query, position) if has_more else None}
         
     except Exception as e:
         error_msg = str(e)
@@ -1379,20 +1776,77 @@ async def search_results(
         else:
             raise HTTPException(status_code=500, detail=f"Search failed: {error_msg}")
 
+# Flat playlist extractions shared by /playlist_info, /save_playlist and /save_my_playlist
+playlist_cache = PlaylistCache(
+    max_entries=int(os.environ.get("PLAYLIST_CACHE_SIZE", "128")),
+    default_ttl=int(os.environ.get("PLAYLIST_CACHE_TTL", "600"))
+)
+
+async def load_playlist(url):
+    """Flat-extract a playlist at most once per TTL; returns the cache entry (info + etag)"""
+    key = playlist_id_from_url(url)
+    cached = playlist_cache.lookup(key)
+    if cached:
+        return cached
+    
+    async def extract():
+        ydl_opts = {
+            'extract_flat': True,
+            'quiet': True,
+            'no_warnings': True,
+            'force_generic_extractor': False,
+        }
+        info = await blocking.run("extraction", ydl_extract, ydl_opts, url)
+        return playlist_cache.store(key, info)
+    
+    return await single_flight.run(("playlist", key), extract)
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value matches `etag` (weak comparison)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+async def prefetch_audio(video_id):
+    """Resolve a track the client is likely to play next, the same way /stream_mp3 would"""
+    if extraction_cache.lookup(video_id) or negative_cache.lookup(video_id):
+        return
+    url = f"https://www.youtube.com/watch?v={video_id}"
+    await single_flight.run(("stream_mp3", video_id), lambda: resolve_mp3_audio(url))
+
+# Resolves upcoming playlist tracks, only while at least half the extraction workers are free
+prefetcher = Prefetcher(
+    prefetch_audio,
+    has_capacity=lambda: blocking.idle_workers("extraction") > blocking.limits["extraction"] // 2,
+    concurrency=int(os.environ.get("PREFETCH_WORKERS", "2")),
+    max_pending=int(os.environ.get("PREFETCH_BUDGET", "100"))
+)
+
 @app.get("/playlist_info", summary="Get YouTube Music playlist info", tags=["YouTube Music"])
-async def get_playlist_info(url: str = Query(..., description="YouTube Music playlist URL")):
+async def get_playlist_info(
+    request: Request,
+    url: str = Query(..., description="YouTube Music playlist URL"),
+    prefetch: int = Query(0, ge=0, le=25, description="Resolve the audio of the first N tracks in the background")
+):
     """
     Fetch playlist metadata and tracklist from a YouTube Music playlist URL.
     Returns playlist details and a list of tracks.
+    With `prefetch=N` the first N tracks are resolved in the background so
+    streaming them afterwards starts without extraction latency.
+    
+    Responses carry an ETag; a request with a matching If-None-Match gets
+    304 Not Modified (without re-extracting while the playlist is cached).
     """
-    ydl_opts = {
-        'extract_flat': True,
-        'quiet': True,
-        'no_warnings': True,
-        'force_generic_extractor': False,
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=False)
+    cached = await load_playlist(url)
+    info = cached['info']
+    headers = {'ETag': cached['etag']}
+    
+    if etag_matches(request.headers.get('if-none-match'), cached['etag']):
+        if prefetch:
+            prefetcher.schedule([entry.get('id') for entry in info['entries'][:prefetch]])
+        return Response(status_code=304, headers=headers)
+    
     playlist = {
         'id': info.get('id'),
         'title': info.get('title'),
@@ -1409,7 +1863,9 @@ async def get_playlist_info(url: str = Query(..., description="YouTube Music pla
             } for entry in info.get('entries', [])
         ]
     }
-    return JSONResponse(content=playlist)
+    if prefetch:
+        prefetcher.schedule([track['id'] for track in playlist['tracks'][:prefetch]])
+    return JSONResponse(content=playlist, headers=headers)
 
 @app.post("/save_playlist", summary="Save playlist and tracks to Supabase", tags=["Supabase"])
 async def save_playlist_to_supabase(url: str = Query(..., description="YouTube Music playlist URL")):
@@ -1417,14 +1873,7 @@ async def save_playlist_to_supabase(url: str = Query(..., description="YouTube M
     Fetch playlist and tracks from YouTube Music, then save metadata to Supabase tables `playlists` and `tracks`.
     Only metadata is saved, not audio files.
     """
-    ydl_opts = {
-        'extract_flat': True,
-        'quiet': True,
-        'no_warnings': True,
-        'force_generic_extractor': False,
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=False)
+    info = (await load_playlist(url))['info']
     playlist_data = {
         'id': info.get('id'),
         'title': info.get('title'),
@@ -1433,7 +1882,7 @@ async def save_playlist_to_supabase(url: str = Query(..., description="YouTube M
         'track_count': len(info.get('entries', [])),
     }
     # Save playlist
-    supabase.table("playlists").upsert(playlist_data).execute()
+    await blocking.run("supabase", supabase.table("playlists").upsert(playlist_data).execute)
     # Save tracks
     for entry in info.get('entries', []):
         track_data = {
@@ -1443,69 +1892,80 @@ async def save_playlist_to_supabase(url: str = Query(..., description="YouTube M
             'url': entry.get('url'),
             'duration': entry.get('duration'),
         }
-        supabase.table("tracks").upsert(track_data).execute()
+        await blocking.run("supabase", supabase.table("tracks").upsert(track_data).execute)
     return {"status": "success", "playlist_id": info.get('id')}
 
-@app.get("/stream_mp3", summary="Stream YouTube video as MP3", tags=["Streaming"])
-async def stream_mp3(url: str = Query(..., description="YouTube video URL")):
+async def resolve_mp3_audio(url):
     """
-    Stream the audio of a YouTube video as MP3 using yt-dlp and FFmpeg.
-    Uses multiple fallback methods to avoid bot detection.
+    Resolve an audio URL with the yt-dlp client configurations used by /stream_mp3,
+    fastest-succeeding method first. Raises HTTPException when every method fails.
     """
     
-    # Try multiple extraction methods
+    # Multiple extraction methods, reordered by their recent success rate and latency
     extraction_methods = [
-        # Method 1: Standard with Android client
+        # Standard with Android client
         {
-            **get_ydl_opts(search=False),
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['android'],
-                    'skip': ['dash'],
+            'name': 'android',
+            'opts': {
+                **get_ydl_opts(search=False),
+                'extractor_args': {
+                    'youtube': {
+                        'player_client': ['android'],
+                        'skip': ['dash'],
+                    }
                 }
             }
         },
-        # Method 2: Web client with different format
+        # Web client with different format
         {
-            **get_ydl_opts(search=False),
-            'format': 'bestaudio[ext=m4a]',
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['web'],
-                    'skip': ['dash'],
+            'name': 'web',
+            'opts': {
+                **get_ydl_opts(search=False),
+                'format': 'bestaudio[ext=m4a]',
+                'extractor_args': {
+                    'youtube': {
+                        'player_client': ['web'],
+                        'skip': ['dash'],
+                    }
                 }
             }
         },
-        # Method 3: iOS client
+        # iOS client
         {
-            **get_ydl_opts(search=False),
-            'extractor_args': {
-                'youtube': {
-                    'player_client': ['ios'],
-                    'skip': ['dash', 'hls'],
+            'name': 'ios',
+            'opts': {
+                **get_ydl_opts(search=False),
+                'extractor_args': {
+                    'youtube': {
+                        'player_client': ['ios'],
+                        'skip': ['dash', 'hls'],
+                    }
                 }
             }
         },
-        # Method 4: Basic extraction
+        # Basic extraction
         {
-            'quiet': True,
-            'format': 'worst[ext=m4a]/worst',
-            'user_agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_0 like Mac OS X) AppleWebKit/605.1.15',
+            'name': 'basic',
+            'opts': {
+                'quiet': True,
+                'format': 'worst[ext=m4a]/worst',
+                'user_agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_0 like Mac OS X) AppleWebKit/605.1.15',
+            }
         }
     ]
     
-    audio_url = None
+    video_id = extract_video_id(url)
     extraction_error = None
     
     # Try each method until one works
-    for i, ydl_opts in enumerate(extraction_methods):
+    for method in strategy_ranker.ordered("stream_mp3", extraction_methods):
+        started = time.monotonic()
+        audio_url = None
+        permanent = False
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                if not info:
-                    continue
-                    
+            info = await blocking.run("extraction", ydl_extract, method['opts'], url)
+            
+            if info:
                 # Get the best audio URL
                 audio_url = info.get('url')
                 if not audio_url:
@@ -1517,73 +1977,72 @@ async def stream_mp3(url: str = Query(..., description="YouTube video URL")):
                         audio_formats.sort(key=lambda x: x.get('abr', 0), reverse=True)
                         audio_url = audio_formats[0]['url']
                 
-                if audio_url:
-                    break  # Success! Exit the loop
-                    
         except Exception as e:
             extraction_error = str(e)
-            if i < len(extraction_methods) - 1:
-                # Not the last method, try next one
-                continue
-            else:
-                # Last method failed, handle error
-                break
-    
-    # If all methods failed, return appropriate error
-    if not audio_url:
-        if extraction_error:
-            if "Sign in to confirm you're not a bot" in extraction_error:
-                raise HTTPException(
-                    status_code=429, 
-                    detail="All extraction methods failed due to bot detection. Video may be restricted."
-                )
-            elif "Video unavailable" in extraction_error:
-                raise HTTPException(status_code=404, detail="Video is unavailable or private")
-            elif "Private video" in extraction_error:
-                raise HTTPException(status_code=403, detail="Cannot access private videos")
-            else:
-                raise HTTPException(status_code=500, detail=f"Failed to extract audio: {extraction_error}")
-        else:
-            raise HTTPException(status_code=404, detail="No audio stream found")
-
-    try:
-        command = [
-            'ffmpeg',
-            '-i', audio_url,
-            '-f', 'mp3',
-            '-vn',
-            '-ab', '128k',
-            '-ar', '44100',
-            'pipe:1'
-        ]
-        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=10**8)
+            permanent = negative_cache.note(video_id, extraction_error, final=False)
+        
+        strategy_ranker.record("stream_mp3", method['name'], bool(audio_url), time.monotonic() - started)
+        if audio_url:
+            return remember_ydl_audio(video_id, info, audio_url, f"yt-dlp-{method['name']}")
+        if permanent:
+            # Private/removed/blocked for one client means the same for the others
+            break
+    
+    # All methods failed, return appropriate error (recognised failures were cached above)
+    if extraction_error:
+        negative_cache.note(video_id, extraction_error)
+        reject_known_failure(video_id)
+        raise HTTPException(status_code=500, detail=f"Failed to extract audio: {extraction_error}")
+    else:
+        raise HTTPException(status_code=404, detail="No audio stream found")
 
-        def generate():
-            try:
-                while True:
-                    chunk = proc.stdout.read(4096)
-                    if not chunk:
-                        break
-                    yield chunk
-            finally:
-                proc.stdout.close()
-                proc.terminate()
-                proc.wait()
+@app.get("/stream_mp3", summary="Stream YouTube video as MP3", tags=["Streaming"])
+@stream_sessions.track
+async def stream_mp3(
+    request: Request,
+    url: str = Query(..., description="YouTube video URL"),
+    format: str = Query(None, description="mp3, m4a, aac, webm, ogg, or auto for whatever costs least. Defaults to MP3 unless the Accept header names another audio type"),
+    profile: str = Query(None, description="Transcode profile: standard, low_latency (fastest first byte) or economy"),
+    quality: str = Query(None, description="MP3 bitrate: low, medium, high, max or e.g. 160k")
+):
+    """
+    Stream the audio of a YouTube video as MP3 using yt-dlp and FFmpeg.
+    Uses multiple fallback methods to avoid bot detection.
+    
+    Clients that can play the source codec (AAC or Opus) can ask for it with
+    `format=` or their Accept header and get the source passed through or
+    remuxed without re-encoding.
+    """
+    
+    video_id = extract_video_id(url)
+    requested = requested_format(format)
+    settings = requested_profile(profile, quality)
+    
+    # Tracks played before are served from disk without extraction or encoding
+    if accepts_mp3(requested, request.headers.get('accept')):
+        cached = cached_mp3_response(video_id, "stream.mp3", request.headers.get('range'), settings['bitrate'])
+        if cached:
+            cached.headers['Vary'] = 'Accept'
+            return cached
+    
+    reject_known_failure(video_id)
+    
+    # Reuse the audio URL if any endpoint resolved this video recently
+    audio = extraction_cache.lookup(video_id) or await single_flight.run(
+        ("stream_mp3", video_id or url), lambda: resolve_mp3_audio(url)
+    )
 
-        headers = {
-            'Content-Disposition': 'inline; filename="stream.mp3"',
-        }
-        return StreamingResponse(generate(), media_type="audio/mpeg", headers=headers)
+    try:
+        return await stream_negotiated(request, audio, requested, "stream", video_id, settings)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process audio: {str(e)}")
 
-@app.get("/stream_robust", summary="Robust streaming with multiple fallbacks", tags=["Streaming"])
-async def stream_robust(url: str = Query(..., description="YouTube video URL")):
-    """
-    More robust streaming endpoint that tries multiple extraction methods
-    and different audio qualities to bypass restrictions.
-    """
+async def resolve_robust_audio(url):
+    """Resolve an audio URL by trying several yt-dlp client configurations, best-ranked first"""
+    video_id = extract_video_id(url)
     
     # Multiple strategies with different priorities
     strategies = [
@@ -1626,102 +2085,256 @@ async def stream_robust(url: str = Query(..., description="YouTube video URL")):
         }
     ]
     
-    for strategy in strategies:
+    for strategy in strategy_ranker.ordered("stream_robust", strategies):
+        started = time.monotonic()
+        info = None
         try:
-            with yt_dlp.YoutubeDL(strategy['opts']) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if info and info.get('url'):
-                    audio_url = info['url']
-                    
-                    # Stream with simple FFmpeg conversion
-                    command = [
-                        'ffmpeg', '-hide_banner', '-loglevel', 'error',
-                        '-i', audio_url,
-                        '-f', 'mp3', '-ab', '128k', '-ar', '44100',
-                        '-vn', 'pipe:1'
-                    ]
-                    
-                    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                    
-                    def generate():
-                        try:
-                            while True:
-                                chunk = proc.stdout.read(8192)
-                                if not chunk:
-                                    break
-                                yield chunk
-                        finally:
-                            proc.terminate()
-                    
-                    return StreamingResponse(
-                        generate(), 
-                        media_type="audio/mpeg",
-                        headers={'Content-Disposition': f'inline; filename="audio.mp3"'}
-                    )
-                    
+            info = await blocking.run("extraction", ydl_extract, strategy['opts'], url)
         except Exception as e:
-            # Try next strategy
-            continue
+            negative_cache.note(video_id, e, final=False)  # Try next strategy
+        
+        succeeded = bool(info and info.get('url'))
+        strategy_ranker.record("stream_robust", strategy['name'], succeeded, time.monotonic() - started)
+        if succeeded:
+            return remember_ydl_audio(video_id, info, info['url'], f"yt-dlp-{strategy['name']}")
     
-    # All strategies failed
-    raise HTTPException(
-        status_code=503, 
-        detail="All streaming methods failed. Video may be restricted or unavailable."
+    return None
+
+@app.get("/stream_robust", summary="Robust streaming with multiple fallbacks", tags=["Streaming"])
+@stream_sessions.track
+async def stream_robust(
+    request: Request,
+    url: str = Query(..., description="YouTube video URL"),
+    format: str = Query(None, description="mp3, m4a, aac, webm, ogg, or auto for whatever costs least. Defaults to MP3 unless the Accept header names another audio type"),
+    profile: str = Query(None, description="Transcode profile: standard, low_latency (fastest first byte) or economy"),
+    quality: str = Query(None, description="MP3 bitrate: low, medium, high, max or e.g. 160k")
+):
+    """
+    More robust streaming endpoint that tries multiple extraction methods
+    and different audio qualities to bypass restrictions. Negotiates the
+    output format like /stream_mp3.
+    """
+    
+    video_id = extract_video_id(url)
+    requested = requested_format(format)
+    settings = requested_profile(profile, quality)
+    
+    if accepts_mp3(requested, request.headers.get('accept')):
+        cached = cached_mp3_response(video_id, "audio.mp3", request.headers.get('range'), settings['bitrate'])
+        if cached:
+            cached.headers['Vary'] = 'Accept'
+            return cached
+    
+    reject_known_failure(video_id)
+    
+    # Reuse the audio URL if any endpoint resolved this video recently
+    audio = extraction_cache.lookup(video_id) or await single_flight.run(
+        ("stream_robust", video_id or url), lambda: resolve_robust_audio(url)
     )
+    
+    if not audio:
+        reject_known_failure(video_id)
+        # All strategies failed
+        raise HTTPException(
+            status_code=503, 
+            detail="All streaming methods failed. Video may be restricted or unavailable."
+        )
+    
+    # Pass through or remux when the client can play the source, otherwise encode to MP3
+    return await stream_negotiated(request, audio, requested, "audio", video_id, settings)
+
+# HLS segment length in seconds and the codec playlists use when the request names none
+HLS_SEGMENT_SECONDS = float(os.environ.get("HLS_SEGMENT_SECONDS", "6"))
+HLS_CODEC = os.environ.get("HLS_CODEC", "aac")
+
+# A segment URL names its codec, bitrate and length, so its bytes never change and
+# players and CDNs may keep it for good
+HLS_SEGMENT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def hls_video_id(video_id):
+    """Validate the video ID in an HLS path"""
+    if not re.fullmatch(r'[a-zA-Z0-9_-]{11}', video_id):
+        raise HTTPException(status_code=400, detail="Invalid video ID")
+    return video_id
+
+def hls_segment_key(video_id, codec, bitrate, segment_seconds, index):
+    """Transcode cache key of a segment, as specific as its URL"""
+    return video_id, f"hls-{codec}", bitrate, f"{segment_seconds:g}s/{index}"
+
+def cached_hls_segment(key, index, range_header=None):
+    """A segment from the transcode cache, honouring Range, or None if it isn't there"""
+    path = transcode_cache.lookup(*key)
+    if not path:
+        return None
+    try:
+        response = serve_cached_file(path, SEGMENT_MEDIA_TYPE, f"{index}.ts", range_header)
+    except OSError:
+        return None
+    response.headers['Cache-Control'] = HLS_SEGMENT_CACHE_CONTROL
+    return response
+
+def hls_segment_from_memory(data, index, range_header=None):
+    """A just-encoded segment the cache didn't keep, honouring Range like serve_cached_file()"""
+    try:
+        byte_range = parse_range_header(range_header, len(data))
+    except RangeNotSatisfiable:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={'Content-Range': f'bytes */{len(data)}'})
+    
+    start, end = byte_range or (0, len(data) - 1)
+    headers = {
+        'Content-Disposition': f'inline; filename="{index}.ts"',
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': HLS_SEGMENT_CACHE_CONTROL,
+        'X-Transcode-Cache': 'hit'
+    }
+    if byte_range:
+        headers['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+    return Response(data[start:end + 1], status_code=206 if byte_range else 200, media_type=SEGMENT_MEDIA_TYPE, headers=headers)
+
+async def resolve_hls_source(video_id):
+    """Resolved audio for a video plus its duration, from extraction, the URL's dur= or ffprobe"""
+    reject_known_failure(video_id)
+    audio = extraction_cache.lookup(video_id) or await single_flight.run(
+        ("stream_mp3", video_id), lambda: resolve_mp3_audio(f"https://www.youtube.com/watch?v={video_id}")
+    )
+    
+    duration = audio.get('duration') or duration_hint(audio['url'])
+    if not duration:
+        duration = await single_flight.run(("hls_duration", audio['url']), lambda: probe_duration(audio['url']))
+        if not duration:
+            raise HTTPException(status_code=502, detail="Could not determine the track's duration")
+        # Kept with the cached URL so the playlist's segments don't probe again
+        audio['duration'] = duration
+    return audio, duration
+
+async def produce_hls_segment(video_id, codec, bitrate, segment_seconds, index):
+    """Encode one segment, publish it to the transcode cache and return its bytes"""
+    audio, duration = await resolve_hls_source(video_id)
+    try:
+        start, length = segment_bounds(index, duration, segment_seconds)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Segment out of range")
+    
+    output = await start_transcode(segment_command(audio['url'], start, length, codec, bitrate))
+    writer = transcode_cache.open_writer(*hls_segment_key(video_id, codec, bitrate, segment_seconds, index))
+    chunks = []
+    try:
+        async for chunk in output:
+            chunks.append(chunk)
+            if writer:
+                writer.write(chunk)
+    finally:
+        await output.aclose()
+    
+    # Once the output ended the relay let FFmpeg exit on its own, so this is its real exit status
+    if output.proc.returncode != 0 or not chunks:
+        if writer:
+            writer.abort()
+        raise HTTPException(status_code=502, detail=f"Failed to encode segment {index}")
+    if writer:
+        # Publishing fsyncs the file, keep that off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, writer.commit)
+    return b''.join(chunks)
+
+@app.get("/hls/{video_id}/index.m3u8", summary="HLS playlist of a track", tags=["Streaming"])
+async def hls_playlist(
+    video_id: str,
+    codec: str = Query(None, description="Segment codec: aac or mp3"),
+    quality: str = Query(None, description="Bitrate: low, medium, high, max or e.g. 160k")
+):
+    """
+    HLS playlist for a track, cut into fixed-duration MPEG-TS segments. Segments
+    are encoded only when a player asks for them and cached one by one, so seeking
+    or resuming a long mix costs just the segments actually played.
+    """
+    video_id = hls_video_id(video_id)
+    codec = (codec or HLS_CODEC).strip().lower()
+    if codec not in SEGMENT_CODECS:
+        raise HTTPException(status_code=400, detail=f"Unknown codec '{codec}', expected one of: {', '.join(SEGMENT_CODECS)}")
+    try:
+        bitrate = parse_bitrate(quality) if quality else DEFAULT_TRANSCODE_PROFILE['bitrate']
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    _, duration = await resolve_hls_source(video_id)
+    return Response(
+        build_playlist(duration, HLS_SEGMENT_SECONDS, codec, bitrate),
+        media_type=PLAYLIST_MEDIA_TYPE,
+        headers={'Cache-Control': 'public, max-age=3600'}
+    )
+
+@app.get("/hls/{video_id}/{variant}/{index}.ts", summary="One HLS segment", tags=["Streaming"])
+async def hls_segment(request: Request, video_id: str, variant: str, index: int):
+    """A segment from the transcode cache, or encoded now (once, however many players ask at the same time)"""
+    video_id = hls_video_id(video_id)
+    try:
+        # Cut at the length the URL names, which the playlist fixed when it was built
+        codec, bitrate, segment_seconds = parse_variant(variant)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    key = hls_segment_key(video_id, codec, bitrate, segment_seconds, index)
+    range_header = request.headers.get('range')
+    response = cached_hls_segment(key, index, range_header)
+    if response:
+        return response
+    
+    # Shared, so a player that gives up on a segment still leaves it encoded and cached
+    flight = ("hls", video_id, codec, bitrate, segment_seconds, index)
+    started = not single_flight.in_flight(flight)
+    data = await single_flight.run(
+        flight, lambda: produce_hls_segment(video_id, codec, bitrate, segment_seconds, index)
+    )
+    
+    # Served like a hit once published, so Range works the same either way
+    response = cached_hls_segment(key, index, range_header) or hls_segment_from_memory(data, index, range_header)
+    if started:
+        response.headers['X-Transcode-Cache'] = 'miss'
+    else:
+        # Waited on another request's encode of this segment
+        response.headers['X-Transcode-Shared'] = 'joined'
+    return response
 
 @app.get("/search", summary="Search and stream music as MP3", tags=["Search", "Streaming"])
-def search_and_stream(query: str = Query(..., description="Song or artist to search")):
+@stream_sessions.track
+async def search_and_stream(
+    request: Request,
+    query: str = Query(..., description="Song or artist to search"),
+    profile: str = Query(None, description="Transcode profile: standard, low_latency (fastest first byte) or economy"),
+    quality: str = Query(None, description="MP3 bitrate: low, medium, high, max or e.g. 160k")
+):
     """
     Search YouTube and YouTube Music for a track and stream the first result as MP3.
     """
-    ydl_opts = {
-        'format': 'bestaudio',
-        'quiet': True,
-        'no_warnings': True,
-        'default_search': 'ytsearch',
-        'noplaylist': True,
-        'extract_flat': False,
-    }
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(f"ytsearch1:{query}", download=False)
-        if 'entries' in info and info['entries']:
-            track = info['entries'][0]
-        else:
-            return JSONResponse(content={"error": "No results found."}, status_code=404)
-        audio_url = track['url']
-
-    command = [
-        'ffmpeg',
-        '-i', audio_url,
-        '-f', 'mp3',
-        '-vn',
-        '-ab', '128k',
-        '-ar', '44100',
-        'pipe:1'
-    ]
-    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=10**8)
-
-    def generate():
-        try:
-            while True:
-                chunk = proc.stdout.read(4096)
-                if not chunk:
-                    break
-                yield chunk
-        finally:
-            proc.stdout.close()
-            proc.terminate()
-            proc.wait()
+    settings = requested_profile(profile, quality)
+    
+    # Phase 1: a flat search (cached per query) only needs to find the video ID
+    entries, _, _ = await blocking.run(
+        "extraction", search_cache.take,
+        query, 0, 1, lambda entry: bool(entry.get('id')), lambda: open_search_results(query)
+    )
+    if entries:
+        track = entries[0]
+    else:
+        return JSONResponse(content={"error": "No results found."}, status_code=404)
+    video_id = track['id']
 
     # Sanitize filename to ASCII only
-    raw_title = track.get('title', 'stream')
+    raw_title = track.get('title') or 'stream'
     safe_title = re.sub(r'[^a-zA-Z0-9_\-\. ]', '', raw_title)
     if not safe_title:
         safe_title = 'stream'
-    headers = {
-        'Content-Disposition': f'inline; filename="{safe_title}.mp3"',
-    }
-    return StreamingResponse(generate(), media_type="audio/mpeg", headers=headers)
+    
+    cached = cached_mp3_response(video_id, f"{safe_title}.mp3", request.headers.get('range'), settings['bitrate'])
+    if cached:
+        return cached
+    
+    # Phase 2: resolve the audio exactly like /stream_mp3, sharing its caches and in-flight work
+    reject_known_failure(video_id)
+    audio = extraction_cache.lookup(video_id) or await single_flight.run(
+        ("stream_mp3", video_id), lambda: resolve_mp3_audio(f"https://www.youtube.com/watch?v={video_id}")
+    )
+    return await stream_mp3_from_url(audio['url'], f"{safe_title}.mp3", video_id, settings)
 
 # User Authentication Endpoints
 @app.post("/register", summary="Register a new user", tags=["Authentication"])
@@ -1731,7 +2344,7 @@ async def register_user(username: str = Query(...), email: str = Query(...), pas
     """
     try:
         # Check if user already exists
-        existing = supabase.table("users").select("*").eq("email", email).execute()
+        existing = await blocking.run("supabase", supabase.table("users").select("*").eq("email", email).execute)
         if existing.data:
             raise HTTPException(status_code=400, detail="User already exists")
         
@@ -1742,7 +2355,7 @@ async def register_user(username: str = Query(...), email: str = Query(...), pas
             "password_hash": password,  # In production, hash this!
             "created_at": datetime.now().isoformat()
         }
-        result = supabase.table("users").insert(user_data).execute()
+        result = await blocking.run("supabase", supabase.table("users").insert(user_data).execute)
         user_id = result.data[0]["id"]
         
         # Generate JWT token
@@ -1763,7 +2376,7 @@ async def login_user(email: str = Query(...), password: str = Query(...)):
     """
     try:
         # Find user
-        result = supabase.table("users").select("*").eq("email", email).eq("password_hash", password).execute()
+        result = await blocking.run("supabase", supabase.table("users").select("*").eq("email", email).eq("password_hash", password).execute)
         if not result.data:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
@@ -1787,14 +2400,7 @@ async def save_my_playlist(url: str = Query(...), user_id: str = Depends(get_cur
     Save a YouTube Music playlist to the current user's library.
     """
     try:
-        ydl_opts = {
-            'extract_flat': True,
-            'quiet': True,
-            'no_warnings': True,
-            'force_generic_extractor': False,
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        info = (await load_playlist(url))['info']
         
         playlist_data = {
             'id': info.get('id'),
@@ -1806,7 +2412,7 @@ async def save_my_playlist(url: str = Query(...), user_id: str = Depends(get_cur
             'thumbnail': info.get('thumbnail'),
             'created_at': datetime.now().isoformat()
         }
-        supabase.table("user_playlists").upsert(playlist_data).execute()
+        await blocking.run("supabase", supabase.table("user_playlists").upsert(playlist_data).execute)
         
         # Save tracks with user association
         for entry in info.get('entries', []):
@@ -1819,7 +2425,7 @@ async def save_my_playlist(url: str = Query(...), user_id: str = Depends(get_cur
                 'duration': entry.get('duration'),
                 'thumbnail': entry.get('thumbnail') or f"https://img.youtube.com/vi/{entry.get('id')}/maxresdefault.jpg" if entry.get('id') else None
             }
-            supabase.table("user_tracks").upsert(track_data).execute()
+            await blocking.run("supabase", supabase.table("user_tracks").upsert(track_data).execute)
         
         return {"status": "success", "playlist_id": info.get('id'), "message": "Playlist saved to your library"}
     except Exception as e:
@@ -1831,23 +2437,30 @@ async def get_my_playlists(user_id: str = Depends(get_current_user)):
     Get all playlists saved by the current user.
     """
     try:
-        result = supabase.table("user_playlists").select("*").eq("user_id", user_id).execute()
+        result = await blocking.run("supabase", supabase.table("user_playlists").select("*").eq("user_id", user_id).execute)
         return {"playlists": result.data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/my_playlist_tracks", summary="Get tracks from user's playlist", tags=["User Playlists"])
-async def get_my_playlist_tracks(playlist_id: str = Query(...), user_id: str = Depends(get_current_user)):
+async def get_my_playlist_tracks(
+    playlist_id: str = Query(...),
+    prefetch: int = Query(0, ge=0, le=25, description="Resolve the audio of the first N tracks in the background"),
+    user_id: str = Depends(get_current_user)
+):
     """
     Get all tracks from a specific playlist in user's library.
+    With `prefetch=N` the first N tracks are resolved in the background.
     """
     try:
         # Verify playlist belongs to user
-        playlist_check = supabase.table("user_playlists").select("*").eq("id", playlist_id).eq("user_id", user_id).execute()
+        playlist_check = await blocking.run("supabase", supabase.table("user_playlists").select("*").eq("id", playlist_id).eq("user_id", user_id).execute)
         if not playlist_check.data:
             raise HTTPException(status_code=404, detail="Playlist not found or access denied")
         
-        tracks = supabase.table("user_tracks").select("*").eq("playlist_id", playlist_id).eq("user_id", user_id).execute()
+        tracks = await blocking.run("supabase", supabase.table("user_tracks").select("*").eq("playlist_id", playlist_id).eq("user_id", user_id).execute)
+        if prefetch:
+            prefetcher.schedule([track.get('id') for track in tracks.data[:prefetch]])
         return {"tracks": tracks.data}
     except HTTPException:
         raise
@@ -0,0 +1,134 @@
+# Negative extraction cache
+# Classifies why a video could not be resolved and remembers it, so repeat
+# requests for a dead video are rejected without running any extraction
+
+import time
+
+from cache import ExpiringLRUCache
+
+# Failure classes, checked in this order; the first matching phrase wins.
+# Permanent problems are remembered for long, transient ones only briefly.
+FAILURE_CLASSES = {
+    'bot_check': {
+        'phrases': ("confirm you're not a bot", "confirm you’re not a bot"),
+        'status_code': 429,
+        'detail': "All extraction methods failed due to bot detection. Video may be restricted.",
+        'ttl': 30,
+        # Another client or method may still get through, so only a final failure counts
+        'transient': True,
+    },
+    'private': {
+        'phrases': ("private video", "this video is private"),
+        'status_code': 403,
+        'detail': "Cannot access private videos",
+        'ttl': 3600,
+    },
+    'region_blocked': {
+        'phrases': ("available in your country", "blocked it in your country", "not available in your region"),
+        'status_code': 403,
+        'detail': "Video is not available in this region",
+        'ttl': 1800,
+    },
+    'age_restricted': {
+        'phrases': ("confirm your age", "age-restricted", "inappropriate for some users"),
+        'status_code': 403,
+        'detail': "Video is age-restricted",
+        'ttl': 1800,
+    },
+    'unavailable': {
+        'phrases': ("video unavailable", "this video is unavailable", "this video has been removed",
+                    "video is no longer available"),
+        'status_code': 404,
+        'detail': "Video is unavailable or private",
+        'ttl': 3600,
+    },
+}
+
+
+def classify_failure(message):
+    """Return the failure class for an extraction error message, or None if it isn't recognised"""
+    if not message:
+        return None
+
+    lowered = str(message).lower()
+    for failure_class, spec in FAILURE_CLASSES.items():
+        if any(phrase in lowered for phrase in spec['phrases']):
+            return failure_class
+    return None
+
+
+def classify_playability(playability_status):
+    """Return the failure class for a player response's playabilityStatus, or None if playable"""
+    if not playability_status:
+        return None
+
+    status = playability_status.get('status')
+    if status in (None, 'OK', 'LIVE_STREAM_OFFLINE'):
+        return None
+
+    text = ' '.join([playability_status.get('reason') or ''] + list(playability_status.get('messages') or []))
+    failure_class = classify_failure(text)
+    if failure_class is None and status == 'ERROR':
+        # ERROR is only used for removed/nonexistent videos
+        failure_class = 'unavailable'
+    return failure_class
+
+
+class NegativeCache(ExpiringLRUCache):
+    """Known-bad video IDs with the reason and HTTP status to fail with"""
+
+    def __init__(self, max_entries=1024, ttls=None):
+        super().__init__(max_entries=max_entries, default_ttl=60)
+        self.ttls = {failure_class: spec['ttl'] for failure_class, spec in FAILURE_CLASSES.items()}
+        self.ttls.update(ttls or {})
+
+    def record(self, video_id, failure_class, reason=None):
+        """Remember that `video_id` failed with `failure_class`; returns the stored entry"""
+        if not video_id or failure_class not in FAILURE_CLASSES:
+            return None
+
+        now = time.time()
+        expires_at = now + self.ttls[failure_class]
+
+        # A transient failure must not shorten what we already know to be permanent
+        existing = self.get(video_id)
+        if existing is not None and existing['expires_at'] >= expires_at:
+            return existing
+
+        spec = FAILURE_CLASSES[failure_class]
+        entry = {
+            'class': failure_class,
+            'status_code': spec['status_code'],
+            'detail': spec['detail'],
+            'reason': str(reason)[:300] if reason else None,
+            'recorded_at': now,
+            'expires_at': expires_at,
+        }
+        self.set(video_id, entry, expires_at=expires_at)
+        return entry
+
+    def _note(self, video_id, failure_class, reason, final):
+        if failure_class is None:
+            return None
+        if not final and FAILURE_CLASSES[failure_class].get('transient'):
+            return None
+        return self.record(video_id, failure_class, reason)
+
+    def note(self, video_id, message, final=True):
+        """
+        Classify an error message and record it if recognised. With final=False
+        (one method failed but others may still run) transient classes are ignored.
+        """
+        return self._note(video_id, classify_failure(message), message, final)
+
+    def note_playability(self, video_id, playability_status, final=False):
+        """Classify a playabilityStatus and record it if the video is not playable"""
+        failure_class = classify_playability(playability_status)
+        reason = playability_status.get('reason') if playability_status else None
+        return self._note(video_id, failure_class, reason, final)
+
+    def lookup(self, video_id):
+        """Return the cached failure for a video, or None"""
+        if not video_id:
+            return None
+        return self.get(video_id)
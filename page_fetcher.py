@@ -0,0 +1,184 @@
+# YouTube page fetcher
+# Downloads watch/mobile/embed pages once per video within a short TTL and
+# parses them once for every scraping code path
+
+import re
+import threading
+
+import requests
+
+from cache import ExpiringLRUCache
+from player_response import PlayerResponseScanner, find_player_response
+
+# Page variants and the headers each one is requested with
+PAGE_VARIANTS = {
+    'watch': {
+        'url': "https://www.youtube.com/watch?v={video_id}",
+        'headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept-Encoding': 'gzip, deflate',
+            'DNT': '1',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+            'Sec-Fetch-Dest': 'document',
+            'Sec-Fetch-Mode': 'navigate',
+            'Sec-Fetch-Site': 'none',
+            'Sec-Fetch-User': '?1',
+            'Cache-Control': 'max-age=0'
+        },
+    },
+    'mobile': {
+        'url': "https://m.youtube.com/watch?v={video_id}",
+        'headers': {
+            'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 15_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.0 Mobile/15E148 Safari/604.1',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.5'
+        },
+    },
+    'embed': {
+        'url': "https://www.youtube.com/embed/{video_id}",
+        'headers': {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Referer': 'https://www.youtube.com/',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+        },
+    },
+}
+
+# Any googlevideo stream URL, JSON-escaped or not
+GOOGLEVIDEO_URL_PATTERN = re.compile(r'https:(?:\\?/){2}[^"\'\s]*?googlevideo\.com[^"\'\s]*')
+
+AUDIO_ITAGS = ('itag=139', 'itag=140', 'itag=141', 'itag=249', 'itag=250', 'itag=251')
+
+
+def unescape_url(url):
+    """Undo the JSON escaping of URLs embedded in page source"""
+    return url.replace('\\u0026', '&').replace('\\/', '/')
+
+
+class YouTubePage:
+    """A fetched page, parsed once into the pieces the scrapers need"""
+
+    def __init__(self, video_id, variant, status_code, text, player_response=None):
+        self.video_id = video_id
+        self.variant = variant
+        self.status_code = status_code
+
+        if player_response is None and status_code == 200:
+            player_response = find_player_response(text)
+        self.player_response = player_response
+        self.streaming_data = (self.player_response or {}).get('streamingData', {})
+        self.playability_status = (self.player_response or {}).get('playabilityStatus', {})
+
+        # Raw googlevideo URLs for the scrapers that don't rely on the player JSON
+        urls = []
+        for match in GOOGLEVIDEO_URL_PATTERN.findall(text):
+            url = unescape_url(match)
+            if url not in urls:
+                urls.append(url)
+        self.stream_urls = urls
+
+        # Availability notices, so callers don't need to keep the whole page around
+        lowered = text.lower()
+        self.unavailable = "Video unavailable" in text
+        self.private = "Private video" in text
+        self.age_restricted = "age-restricted" in lowered
+
+    @property
+    def ok(self):
+        return self.status_code == 200
+
+    def audio_formats(self):
+        """Adaptive audio formats from the player response that carry a direct URL"""
+        return [
+            fmt for fmt in self.streaming_data.get('adaptiveFormats', [])
+            if 'audio' in fmt.get('mimeType', '') and fmt.get('url')
+        ]
+
+    def progressive_formats(self):
+        """Muxed formats from the player response that carry a direct URL"""
+        return [fmt for fmt in self.streaming_data.get('formats', []) if fmt.get('url')]
+
+    def audio_stream_urls(self):
+        """Scraped googlevideo URLs that look like audio-only streams"""
+        return [
+            url for url in self.stream_urls
+            if 'mime=audio' in url or any(itag in url for itag in AUDIO_ITAGS)
+        ]
+
+
+class PageFetcher:
+    """Fetches each (video, page variant) once per TTL; concurrent callers share the download"""
+
+    def __init__(self, ttl=60, max_entries=64, timeout=10, chunk_size=64 * 1024, error_ttl=5):
+        # Error pages (429, 5xx, ...) are only kept long enough for concurrent callers to share them
+        self.error_ttl = error_ttl
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        self._pages = ExpiringLRUCache(max_entries=max_entries, default_ttl=ttl)
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.fetches = 0
+        self.bytes_downloaded = 0
+
+    def fetch(self, video_id, variant='watch'):
+        """Return the parsed page (blocking, call through the http executor)"""
+        key = (video_id, variant)
+        page = self._pages.get(key)
+        if page is not None:
+            return page
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        try:
+            with key_lock:
+                # Another thread may have fetched it while we waited
+                if key in self._pages:
+                    return self._pages.get(key)
+
+                page = self._download(video_id, variant)
+                self._pages.set(key, page, ttl=None if page.ok else self.error_ttl)
+                return page
+        finally:
+            with self._lock:
+                if not key_lock.locked():
+                    self._key_locks.pop(key, None)
+
+    def _download(self, video_id, variant):
+        """Stream the page, stopping as soon as the player response object has closed"""
+        config = PAGE_VARIANTS[variant]
+        scanner = PlayerResponseScanner()
+        chunks = []
+
+        with self.session.get(
+            config['url'].format(video_id=video_id),
+            headers=config['headers'],
+            timeout=self.timeout,
+            stream=True
+        ) as response:
+            self.fetches += 1
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                chunks.append(chunk)
+                if response.status_code == 200 and scanner.feed(chunk) is not None:
+                    break
+            status_code = response.status_code
+
+        # The googlevideo URLs and availability notices live inside the player response,
+        # so the part of the page read so far is all the scrapers need
+        self.bytes_downloaded += sum(len(chunk) for chunk in chunks)
+        text = b''.join(chunks).decode('utf-8', errors='replace')
+        # An empty dict tells YouTubePage the page was already scanned without finding the object
+        return YouTubePage(video_id, variant, status_code, text, player_response=scanner.close() or {})
+
+    def is_cached(self, video_id, variant='watch'):
+        return (video_id, variant) in self._pages
+
+    def stats(self):
+        stats = self._pages.stats()
+        stats['upstream_fetches'] = self.fetches
+        stats['bytes_downloaded'] = self.bytes_downloaded
+        return stats
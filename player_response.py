@@ -0,0 +1,207 @@
+# ytInitialPlayerResponse extractor
+# Scans page bytes as they arrive and stops as soon as the player object
+# closes: candidate ends (`};`) are tried with the JSON parser first, and
+# braces are matched while respecting JSON strings when those don't decode
+
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library parser
+    orjson = None
+
+MARKER = b'ytInitialPlayerResponse'
+
+# After the marker: `= {`, `":{` (JSON-embedded) or `" : {`
+ASSIGNMENT = re.compile(rb'"?\s*[=:]\s*')
+
+# A brace, or a whole string in one match (group 1 is its closing quote, missing
+# when the string runs past the end of the buffer)
+TOKEN = re.compile(rb'[{}]|"[^"\\]*(?:\\.[^"\\]*)*(")?')
+QUOTE, OPEN_BRACE = ord('"'), ord('{')
+
+# How `var ytInitialPlayerResponse = {...};` ends, and how many such candidates are
+# decoded before falling back to brace matching (each one inside a string costs a parse)
+OBJECT_END = b'};'
+FAST_PATH_ATTEMPTS = 4
+
+
+def decode_json(data):
+    """Decode JSON bytes with orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class PlayerResponseScanner:
+    """
+    Incremental extractor for ytInitialPlayerResponse.
+
+    feed() page chunks in order; it returns the decoded dict once the object
+    closes (and keeps returning it afterwards), or None while more input is needed.
+    Call close() at the end of the input to get a result the fast path missed.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.result = None
+        self.bytes_scanned = 0
+        self._buffer = bytearray()
+        self._searching = True
+        self._pos = 0
+        self._depth = 0
+        # Fast path state: `};` candidates tried so far and where to look for the next
+        self._attempts = FAST_PATH_ATTEMPTS
+        self._candidate_from = 0
+
+    @property
+    def done(self):
+        return self.result is not None
+
+    def feed(self, chunk):
+        if self.result is not None or not chunk:
+            return self.result
+
+        self.bytes_scanned += len(chunk)
+        self._buffer += chunk
+
+        while self.result is None:
+            if self._searching:
+                if not self._find_start():
+                    break
+            elif not self._scan_object():
+                break
+
+        if self.result is None and len(self._buffer) > self.max_bytes:
+            # Runaway object (or garbage); give up on this candidate and keep looking
+            self._restart(len(self._buffer))
+
+        return self.result
+
+    def close(self):
+        """End of input: match braces over whatever the fast path was still waiting on"""
+        if self.result is None and not self._searching and self._attempts < FAST_PATH_ATTEMPTS:
+            self._attempts = FAST_PATH_ATTEMPTS
+            while self.result is None and (self._find_start() if self._searching else self._scan_object()):
+                pass
+        return self.result
+
+    def _find_start(self):
+        """Locate `ytInitialPlayerResponse = {`; returns False when more input is needed"""
+        index = self._buffer.find(MARKER)
+        if index < 0:
+            # Keep a tail in case the marker straddles two chunks
+            del self._buffer[:max(0, len(self._buffer) - len(MARKER))]
+            return False
+
+        after = index + len(MARKER)
+        match = ASSIGNMENT.match(self._buffer, after)
+        if match is None or match.end() >= len(self._buffer):
+            if len(self._buffer) - after < 16:
+                # Not enough bytes yet to tell what follows the marker
+                del self._buffer[:index]
+                return False
+            del self._buffer[:after]
+            return True
+
+        if self._buffer[match.end():match.end() + 1] != b'{':
+            # e.g. `window["ytInitialPlayerResponse"] = null`, keep searching
+            del self._buffer[:after]
+            return True
+
+        # Only the JavaScript assignment form is known to end in `};`
+        self._attempts = 0 if b'=' in match.group() else FAST_PATH_ATTEMPTS
+        self._candidate_from = 0
+        del self._buffer[:match.end()]
+        self._searching = False
+        self._pos = 0
+        self._depth = 0
+        return True
+
+    def _try_candidates(self):
+        """
+        Fast path: decode the object up to each `};` in turn. A prefix only decodes
+        when it ends exactly where the object does (one cut inside a string leaves that
+        string unterminated), so success is exact. Returns False when more input is needed.
+        """
+        while self._attempts < FAST_PATH_ATTEMPTS:
+            end = self._buffer.find(OBJECT_END, self._candidate_from)
+            if end < 0:
+                # A `};` may straddle two chunks
+                self._candidate_from = max(0, len(self._buffer) - 1)
+                return False
+            self._attempts += 1
+            self._candidate_from = end + 1
+            try:
+                data = decode_json(bytes(self._buffer[:end + 1]))
+            except ValueError:
+                continue
+            if isinstance(data, dict):
+                self.result = data
+                self._buffer = bytearray()
+                return True
+        # Too many `};` inside strings: match braces from the start of the object instead
+        return True
+
+    def _scan_object(self):
+        """Advance brace matching; returns False when more input is needed"""
+        if self._attempts < FAST_PATH_ATTEMPTS:
+            return self._try_candidates()
+
+        buffer = self._buffer
+        pos = self._pos
+
+        while True:
+            match = TOKEN.search(buffer, pos)
+            if match is None:
+                self._pos = len(buffer)
+                return False
+
+            char = buffer[match.start()]
+            pos = match.end()
+            if char == QUOTE:
+                if match.start(1) < 0:
+                    # String split across chunks, rescan it from its opening quote
+                    self._pos = match.start()
+                    return False
+            elif char == OPEN_BRACE:
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        data = decode_json(bytes(buffer[:pos]))
+                    except ValueError:
+                        self._restart(1)
+                        return True
+                    if isinstance(data, dict):
+                        self.result = data
+                        self._buffer = bytearray()
+                        return True
+                    self._restart(pos)
+                    return True
+
+    def _restart(self, offset):
+        del self._buffer[:offset]
+        self._searching = True
+        self._pos = 0
+        self._depth = 0
+
+
+def extract_player_response(chunks):
+    """Run the scanner over an iterable of byte chunks, stopping early once the object closes"""
+    scanner = PlayerResponseScanner()
+    for chunk in chunks:
+        if scanner.feed(chunk) is not None:
+            break
+    return scanner.close()
+
+
+def find_player_response(text):
+    """Extract ytInitialPlayerResponse from a complete page (str or bytes)"""
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    scanner = PlayerResponseScanner(max_bytes=max(len(text) + 1, 8 * 1024 * 1024))
+    scanner.feed(text)
+    return scanner.close()
@@ -0,0 +1,51 @@
+# Playlist metadata cache
+# Flat playlist extractions keyed by playlist ID, with an ETag per version
+# so polling clients can be answered with 304 Not Modified
+
+import hashlib
+import json
+import time
+from urllib.parse import urlparse, parse_qs
+
+from cache import ExpiringLRUCache
+
+# The only playlist/entry fields the endpoints use
+PLAYLIST_FIELDS = ('id', 'title', 'uploader', 'webpage_url', 'thumbnail')
+ENTRY_FIELDS = ('id', 'title', 'url', 'duration', 'thumbnail')
+
+
+def playlist_id_from_url(url):
+    """Return the `list=` ID of a playlist URL (or the input itself if it has none)"""
+    try:
+        playlist_ids = parse_qs(urlparse(url).query).get('list')
+    except ValueError:
+        playlist_ids = None
+    return playlist_ids[0] if playlist_ids else url
+
+
+class PlaylistCache(ExpiringLRUCache):
+    """Slimmed-down flat playlist extractions, keyed by playlist ID"""
+
+    def __init__(self, max_entries=128, default_ttl=600):
+        super().__init__(max_entries=max_entries, default_ttl=default_ttl)
+
+    def store(self, key, info):
+        """Cache the fields of a yt-dlp flat extraction the endpoints need; returns the entry"""
+        slim = {field: info.get(field) for field in PLAYLIST_FIELDS}
+        slim['entries'] = [
+            {field: entry.get(field) for field in ENTRY_FIELDS}
+            for entry in (info.get('entries') or []) if entry
+        ]
+
+        digest = hashlib.sha1(json.dumps(slim, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        entry = {
+            'info': slim,
+            'etag': f'"{digest}"',
+            'fetched_at': time.time(),
+        }
+        self.set(key, entry)
+        return entry
+
+    def lookup(self, key):
+        """Return the cached entry for a playlist, or None"""
+        return self.get(key)
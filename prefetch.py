@@ -0,0 +1,80 @@
+# Background prefetching
+# Resolves the audio URLs of tracks a client is about to play, using only
+# spare extraction capacity and a bounded global budget
+
+import asyncio
+from collections import OrderedDict
+
+
+class Prefetcher:
+    """Low-priority queue of video IDs to resolve ahead of playback"""
+
+    def __init__(self, resolve, has_capacity=None, concurrency=2, max_pending=100, poll_interval=0.5):
+        # resolve(video_id) is a coroutine that caches the result; its return value is ignored
+        self.resolve = resolve
+        # Checked before each item; while it returns False foreground work has the pools to itself
+        self.has_capacity = has_capacity or (lambda: True)
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self._pending = OrderedDict()
+        self._workers = set()
+        self.active = 0
+        self.scheduled = 0
+        self.dropped = 0
+        self.resolved = 0
+        self.failed = 0
+
+    def schedule(self, video_ids):
+        """Queue `video_ids` in order; returns how many were accepted within the budget"""
+        accepted = 0
+        for video_id in video_ids:
+            if not video_id or video_id in self._pending:
+                continue
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                continue
+            self._pending[video_id] = True
+            accepted += 1
+
+        self.scheduled += accepted
+        if accepted:
+            self._start_workers()
+        return accepted
+
+    def _start_workers(self):
+        while len(self._workers) < self.concurrency:
+            worker = asyncio.ensure_future(self._work())
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+
+    async def _work(self):
+        while self._pending:
+            # Yield to foreground requests: only take an item when there is spare capacity
+            if not self.has_capacity():
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            video_id, _ = self._pending.popitem(last=False)
+            self.active += 1
+            try:
+                await self.resolve(video_id)
+                self.resolved += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+            finally:
+                self.active -= 1
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'active': self.active,
+            'workers': len(self._workers),
+            'max_pending': self.max_pending,
+            'scheduled': self.scheduled,
+            'dropped': self.dropped,
+            'resolved': self.resolved,
+            'failed': self.failed,
+        }
@@ -0,0 +1,162 @@
+# Subprocess output relay
+# Streams a child process's stdout with native asyncio pipes: large reads,
+# no thread hop per chunk, and the child is killed and reaped on the way out.
+# The child's stdin can be fed from an async byte source at the same time
+
+import asyncio
+import os
+import time
+
+READ_SIZE = 64 * 1024
+
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+
+
+def process_cpu_seconds(pid):
+    """User + system CPU time a child has used so far, from /proc (None where unavailable)"""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            # Fields after the parenthesised command name; utime and stime are the 12th and 13th
+            fields = f.read().rsplit(b')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+async def feed_stdin(proc, source):
+    """Write an async iterable of bytes to the child's stdin, then close it"""
+    try:
+        async for chunk in source:
+            proc.stdin.write(chunk)
+            await proc.stdin.drain()
+        proc.stdin.close()
+    except (BrokenPipeError, ConnectionResetError):
+        # The child stopped reading (finished early or was killed): nothing left to feed
+        pass
+    except Exception as e:
+        print(f"Input feed error: {e}")
+        # A truncated input must not end in what looks like a complete, successful encode
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+    finally:
+        aclose = getattr(source, 'aclose', None)
+        if aclose:
+            await aclose()
+
+
+async def spawn(command, feed=None):
+    """Start `command` with stdout piped; with `feed`, a task writes that source to its stdin"""
+    proc = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE if feed is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+    feeder = asyncio.ensure_future(feed_stdin(proc, feed)) if feed is not None else None
+    return proc, feeder
+
+
+async def stop_process(proc, feeder=None, grace=0):
+    """
+    Kill a child process that is still running (after up to `grace` seconds for it
+    to exit on its own), stop feeding it and wait for it to be reaped
+    """
+    try:
+        if proc.returncode is None and grace:
+            try:
+                await asyncio.wait_for(proc.wait(), grace)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        if feeder is not None and not feeder.done():
+            feeder.cancel()
+        # Shielded so a cancelled caller still leaves no zombie, open pipe or open download behind
+        await asyncio.shield(asyncio.gather(proc.wait(), *([feeder] if feeder else []), return_exceptions=True))
+
+
+async def start_relay(command, read_size=READ_SIZE, slot=None, feed=None):
+    """
+    Start `command` and return a ProcessRelay over its stdout. Spawning
+    happens here, so a missing binary fails before any response is sent.
+    `slot` (anything with release()) is released once the process is gone.
+    """
+    try:
+        proc, feeder = await spawn(command, feed)
+    except BaseException:
+        if slot:
+            slot.release()
+        raise
+    return ProcessRelay(proc, read_size, slot, feeder)
+
+
+class ProcessRelay:
+    """
+    Async iterator over a child's stdout. Once the output ends the child is left
+    to exit on its own (killed after EXIT_GRACE seconds) and reaped; once the
+    relay is closed (even before it was ever iterated) it is killed and reaped.
+    Either way its feed is stopped and its slot released.
+    """
+
+    # Seconds between CPU time samples while relaying
+    SAMPLE_INTERVAL = 1.0
+    # Seconds a child that closed its stdout gets to exit by itself, so its exit status is the real one
+    EXIT_GRACE = 5.0
+
+    def __init__(self, proc, read_size=READ_SIZE, slot=None, feeder=None):
+        self.proc = proc
+        self.read_size = read_size
+        self.slot = slot
+        self.feeder = feeder
+        # CPU seconds the child had used when last sampled (the final sample is taken as it exits)
+        self.cpu_seconds = None
+        self._sampled_at = 0.0
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+        try:
+            chunk = await self.proc.stdout.read(self.read_size)
+        except BaseException:
+            await self.aclose()
+            raise
+        if not chunk:
+            await self._stop(self.EXIT_GRACE)
+            raise StopAsyncIteration
+        if time.monotonic() - self._sampled_at >= self.SAMPLE_INTERVAL:
+            self._sample()
+        return chunk
+
+    def _sample(self):
+        cpu_seconds = process_cpu_seconds(self.proc.pid)
+        if cpu_seconds is not None:
+            self.cpu_seconds = cpu_seconds
+        self._sampled_at = time.monotonic()
+
+    async def aclose(self):
+        await self._stop()
+
+    async def _stop(self, grace=0):
+        if self._closed:
+            return
+        self._closed = True
+        self._sample()
+        try:
+            await stop_process(self.proc, self.feeder, grace)
+        finally:
+            if self.slot:
+                self.slot.release()
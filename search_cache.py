@@ -0,0 +1,215 @@
+# Search result cache
+# Lazily consumed search sessions keyed by the normalized query: results are
+# pulled from YouTube page by page only as far as requests need them, and
+# repeated or continued searches reuse what was already pulled
+
+import base64
+import itertools
+import json
+import re
+import threading
+from collections import OrderedDict
+
+from cache import ExpiringLRUCache
+
+# The only entry fields the search endpoints use
+ENTRY_FIELDS = ('id', 'title', 'uploader', 'duration', 'thumbnail')
+
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a search query"""
+    return re.sub(r'\s+', ' ', query or '').strip().casefold()
+
+
+def encode_cursor(query, position):
+    """Opaque continuation cursor for the raw result position reached in a query"""
+    payload = json.dumps({'q': normalize_query(query), 'o': position}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, query):
+    """Return the position stored in `cursor`; raises ValueError if it is malformed or for another query"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        position = int(payload['o'])
+        cursor_query = payload['q']
+    except (ValueError, TypeError, KeyError, UnicodeError) as e:
+        raise ValueError("Malformed cursor") from e
+
+    if cursor_query != normalize_query(query) or position < 0:
+        raise ValueError("Cursor does not belong to this query")
+    return position
+
+
+class SearchSession:
+    """One query's results, pulled from a lazy yt-dlp search only as far as anyone has needed"""
+
+    def __init__(self, open_search, max_results):
+        # open_search() returns an iterator of flat entries that fetches pages as it is consumed
+        self._open_search = open_search
+        self._search = None
+        self._iterator = None
+        self._consumed = 0
+        self._release_pending = False
+        self.max_results = max_results
+        self.entries = []
+        self.exhausted = False
+        self._lock = threading.Lock()
+
+    @property
+    def live(self):
+        """Whether an upstream search (and its YoutubeDL) is open"""
+        return self._search is not None
+
+    def _pull(self):
+        """Pull one more entry from upstream"""
+        if self._iterator is None:
+            # After an upstream error or a release, reopen and skip what was already pulled
+            self._search = iter(self._open_search())
+            self._iterator = itertools.islice(self._search, self._consumed, None)
+        try:
+            entry = next(self._iterator)
+        except StopIteration:
+            entry = None
+            self.exhausted = True
+        except Exception:
+            self._close_search()
+            raise
+
+        self._consumed += 1
+        if entry:
+            self.entries.append({field: entry.get(field) for field in ENTRY_FIELDS})
+        if len(self.entries) >= self.max_results:
+            self.exhausted = True
+        if self.exhausted:
+            self._close_search()
+
+    def _close_search(self):
+        # Closing the generator exits its `with YoutubeDL` now rather than at garbage collection
+        search, self._search, self._iterator = self._search, None, None
+        close = getattr(search, 'close', None)
+        if close is not None:
+            close()
+
+    def release(self):
+        """
+        Close the upstream search, keeping the entries pulled so far (a later pull
+        reopens it). A session busy in take() is closed as that call finishes.
+        """
+        self._release_pending = True
+        if self._lock.acquire(blocking=False):
+            try:
+                self._release_pending = False
+                self._close_search()
+            finally:
+                self._lock.release()
+
+    def take(self, offset, limit, predicate):
+        """
+        Blocking. Walk the results from raw position `offset`, pulling more from
+        upstream only when needed, until `limit` entries satisfy `predicate`.
+        Returns (matches, next_position, pulled) where pulled counts upstream entries fetched.
+        """
+        matches = []
+        position = offset
+        pulled = 0
+
+        with self._lock:
+            while len(matches) < limit:
+                if position >= len(self.entries):
+                    if self.exhausted:
+                        break
+                    self._pull()
+                    pulled += 1
+                    continue
+
+                entry = self.entries[position]
+                position += 1
+                if predicate(entry):
+                    matches.append(entry)
+
+        # Checked after unlocking, so a release() that found the lock taken is never missed
+        if self._release_pending:
+            self.release()
+        return matches, position, pulled
+
+    def has_more(self, position):
+        return position < len(self.entries) or not self.exhausted
+
+
+class SearchCache(ExpiringLRUCache):
+    """
+    Search sessions per normalized query, bounded in queries and in results per query.
+    At most `max_live` sessions keep an upstream search open between requests; the
+    least recently used beyond that, and any evicted session, are released.
+    """
+
+    def __init__(self, max_entries=256, default_ttl=900, max_results=200, max_live=16):
+        super().__init__(max_entries=max_entries, default_ttl=default_ttl)
+        self.max_results = max_results
+        self.max_live = max_live
+        self._open_lock = threading.Lock()
+        self._live = OrderedDict()
+        self.released = 0
+        # Requests answered without any upstream fetch, and entries fetched for the rest
+        self.served_from_cache = 0
+        self.entries_pulled = 0
+
+    def session(self, query, open_search):
+        """Return the live session for `query`, creating it (without any I/O) if needed"""
+        key = normalize_query(query)
+        session = self.get(key)
+        if session is None:
+            with self._open_lock:
+                if key in self:
+                    return self.get(key)
+                session = SearchSession(open_search, self.max_results)
+                self.set(key, session)
+        return session
+
+    def take(self, query, offset, limit, predicate, open_search):
+        """Blocking. Up to `limit` matching entries from `offset`, plus the position to continue from"""
+        session = self.session(query, open_search)
+        matches, position, pulled = session.take(offset, limit, predicate)
+
+        idle = []
+        with self._lock:
+            if pulled:
+                self.entries_pulled += pulled
+            else:
+                self.served_from_cache += 1
+
+            if session.live:
+                self._live[session] = True
+                self._live.move_to_end(session)
+            else:
+                self._live.pop(session, None)
+            while len(self._live) > self.max_live:
+                idle.append(self._live.popitem(last=False)[0])
+
+        for stale in idle:
+            self._release(stale)
+        return matches, position, session.has_more(position)
+
+    def on_evict(self, session):
+        with self._lock:
+            self._live.pop(session, None)
+        self._release(session)
+
+    def _release(self, session):
+        if session.live:
+            session.release()
+            with self._lock:
+                self.released += 1
+
+    def stats(self):
+        stats = super().stats()
+        stats['max_results'] = self.max_results
+        stats['served_from_cache'] = self.served_from_cache
+        stats['entries_pulled'] = self.entries_pulled
+        with self._lock:
+            stats['live_sessions'] = len(self._live)
+        stats['max_live'] = self.max_live
+        stats['released'] = self.released
+        return stats
@@ -0,0 +1,49 @@
+# Single-flight request coalescing
+# Concurrent callers asking for the same key share one in-flight coroutine
+# instead of each starting their own extraction
+
+import asyncio
+
+
+class SingleFlight:
+    """Runs at most one task per key; everyone who asks meanwhile awaits that task"""
+
+    def __init__(self):
+        self._inflight = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key, factory):
+        """
+        Await the result of `factory()` for `key`, starting it only if no call
+        for the same key is already running. Exceptions reach every waiter, and a
+        waiter that is cancelled (e.g. its client disconnected) leaves the shared
+        task running for the others.
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self, key):
+        return key in self._inflight
+
+    def stats(self):
+        return {
+            'in_flight': len(self._inflight),
+            'started': self.started,
+            'coalesced': self.coalesced,
+        }
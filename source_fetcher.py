@@ -0,0 +1,379 @@
+# Source fetcher
+# Downloads source audio with a pooled async HTTP client in range-sized
+# requests, resuming and retrying on its own, so FFmpeg can be fed over
+# stdin instead of doing its own single long-lived (and throttled) request
+
+import asyncio
+import os
+import tempfile
+import time
+from collections import deque
+from urllib.parse import urlparse, parse_qs
+
+import httpx
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+}
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+# How much of a spooled download is read back per chunk handed downstream
+SPOOL_READ_SIZE = 64 * 1024
+
+
+def content_length_hint(url):
+    """The source size googlevideo URLs carry in their `clen=` parameter, or None"""
+    try:
+        clen = parse_qs(urlparse(url).query).get('clen', [None])[0]
+        return int(clen) if clen else None
+    except (ValueError, TypeError):
+        return None
+
+
+class SourceFetchError(Exception):
+    """A source download failed for good, or one request failed (`retryable` says whether to try again)"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class RangeIgnored(SourceFetchError):
+    """The server answered a request for part of the source with the whole body"""
+
+
+class SourceFetcher:
+    """Shared connection pool plus download, throughput and retry accounting"""
+
+    def __init__(self, chunk_size=2 * 1024 * 1024, max_connections=32, retries=3,
+                 retry_backoff=0.5, timeout=20.0, window=100):
+        # googlevideo serves ranged requests of a few MB at full speed but throttles long ones
+        self.chunk_size = chunk_size
+        self.max_connections = max_connections
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self._client = None
+        self.active = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.parallel = 0
+        self.segments = 0
+        self.requests = 0
+        self.retried = 0
+        self.bytes_fetched = 0
+        # (bytes, seconds) of recently finished downloads, for throughput
+        self._recent = deque(maxlen=window)
+
+    @property
+    def client(self):
+        # Created lazily so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers=DEFAULT_HEADERS,
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    async def iter_source(self, url, headers=None):
+        """
+        Yield the body of `url` chunk by chunk, fetched as consecutive range requests.
+        A failed request resumes from the last byte received. Raises SourceFetchError.
+        """
+        self.active += 1
+        self.started += 1
+        started = time.monotonic()
+        offset = 0
+        total = None
+        try:
+            while True:
+                end = offset + self.chunk_size - 1
+                if total is not None:
+                    end = min(end, total - 1)
+
+                range_start = offset
+                async for chunk, size in self._iter_range(url, headers, offset, end):
+                    if size is not None:
+                        total = size
+                    offset += len(chunk)
+                    yield chunk
+
+                if offset == range_start:
+                    break
+                if total is not None:
+                    if offset >= total:
+                        break
+                elif offset != end + 1:
+                    # Unknown size and not a full range: the server sent the whole (rest of the) body
+                    break
+
+            self.completed += 1
+        except (GeneratorExit, asyncio.CancelledError):
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.active -= 1
+            self._recent.append((offset, time.monotonic() - started))
+
+    async def iter_source_parallel(self, url, headers=None, size=None, connections=4, spool_dir=None):
+        """
+        Yield the body of `url` in order while `connections` requests download its
+        chunk_size segments concurrently into a preallocated spool file. The size
+        comes from `size`, the URL's clen= parameter or a first range request;
+        sources of unknown size or a single segment fall back to iter_source().
+        """
+        size = size or content_length_hint(url) or await self._probe_size(url, headers)
+        if not size or size <= self.chunk_size or connections < 2:
+            async for chunk in self.iter_source(url, headers):
+                yield chunk
+            return
+
+        segments = [(start, min(start + self.chunk_size, size) - 1) for start in range(0, size, self.chunk_size)]
+        # Bytes written so far at the start of each segment (each segment fills front to back)
+        filled = [0] * len(segments)
+        pending = iter(range(len(segments)))
+        changed = [asyncio.Event()]
+
+        def notify():
+            changed[0].set()
+            changed[0] = asyncio.Event()
+
+        spool = tempfile.TemporaryFile(dir=spool_dir)
+        fd = spool.fileno()
+
+        async def download():
+            try:
+                # Workers share one iterator, so each segment is claimed exactly once, lowest first
+                for index in pending:
+                    start, end = segments[index]
+                    # A response may end short of the range without failing: ask again for the rest
+                    while start + filled[index] <= end:
+                        offset = start + filled[index]
+                        ranges = self._iter_range(url, headers, offset, end)
+                        try:
+                            async for chunk, _ in ranges:
+                                # A server that ignores Range sends more than the segment
+                                chunk = chunk[:end - start + 1 - filled[index]]
+                                # Page cache writes of a few KB; not worth a thread hop each
+                                os.pwrite(fd, chunk, start + filled[index])
+                                filled[index] += len(chunk)
+                                notify()
+                                if start + filled[index] > end:
+                                    break
+                        finally:
+                            await ranges.aclose()
+                        if start + filled[index] == offset:
+                            raise SourceFetchError(f"Source ended at byte {offset} of {size}")
+                    self.segments += 1
+            finally:
+                # Wake the reader on failure too, so it sees the error instead of waiting forever
+                notify()
+
+        self.active += 1
+        self.started += 1
+        self.parallel += 1
+        started = time.monotonic()
+        sent = 0
+        workers = []
+        range_ignored = False
+        try:
+            # Reserve the whole file up front so segments land in place without growing it
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, size)
+            workers = [asyncio.ensure_future(download()) for _ in range(min(connections, len(segments)))]
+
+            for index, (start, end) in enumerate(segments):
+                position = 0
+                length = end - start + 1
+                while position < length:
+                    if filled[index] > position:
+                        chunk = os.pread(fd, min(SPOOL_READ_SIZE, filled[index] - position), start + position)
+                        position += len(chunk)
+                        sent += len(chunk)
+                        yield chunk
+                        continue
+
+                    error = next((worker.exception() for worker in workers if worker.done() and worker.exception()), None)
+                    if isinstance(error, RangeIgnored):
+                        range_ignored = True
+                        break
+                    if error:
+                        raise error
+                    if all(worker.done() for worker in workers):
+                        raise SourceFetchError(f"Source ended at byte {start + filled[index]} of {size}")
+                    await changed[0].wait()
+                if range_ignored:
+                    break
+
+            if range_ignored:
+                # Every range comes back as the whole body: read it once, past what was already sent
+                for worker in workers:
+                    worker.cancel()
+                skip = sent
+                async for chunk, _ in self._iter_range(url, headers, 0, size - 1):
+                    if skip:
+                        dropped = min(skip, len(chunk))
+                        chunk = chunk[dropped:]
+                        skip -= dropped
+                    if chunk:
+                        sent += len(chunk)
+                        yield chunk
+
+            self.completed += 1
+        except (GeneratorExit, asyncio.CancelledError):
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            spool.close()
+            self.active -= 1
+            self._recent.append((sent, time.monotonic() - started))
+
+    async def _probe_size(self, url, headers):
+        """Total size from the Content-Range of a one-byte request, or None"""
+        probe = self._fetch_range(url, headers, 0, 0)
+        try:
+            async for _, size in probe:
+                return size
+        except (httpx.HTTPError, SourceFetchError):
+            pass
+        finally:
+            await probe.aclose()
+        return None
+
+    async def _iter_range(self, url, headers, start, end):
+        """
+        Yield (chunk, total_size) for bytes start..end, resuming a broken request from
+        the last byte received and retrying failed ones. Raises SourceFetchError.
+        """
+        offset = start
+        attempt = 0
+        while True:
+            attempt_start = offset
+            try:
+                async for chunk, size in self._fetch_range(url, headers, offset, end):
+                    offset += len(chunk)
+                    self.bytes_fetched += len(chunk)
+                    yield chunk, size
+                return
+            except RangeIgnored:
+                raise
+            except (httpx.TransportError, SourceFetchError) as e:
+                retryable = getattr(e, 'retryable', True)
+                # Progress resets the budget: only consecutive fruitless attempts count
+                attempt = 0 if offset > attempt_start else attempt + 1
+                if not retryable or attempt > self.retries:
+                    raise SourceFetchError(f"Source download failed at byte {offset}: {e}") from e
+                self.retried += 1
+                await asyncio.sleep(self.retry_backoff * attempt)
+
+    async def _fetch_range(self, url, headers, start, end):
+        """Yield (chunk, total_size) for one range request; total_size comes with the first chunk"""
+        request_headers = dict(headers or {}, Range=f"bytes={start}-{end}")
+        self.requests += 1
+        async with self.client.stream('GET', url, headers=request_headers) as response:
+            if response.status_code == 416:
+                # Asked for a range starting at the end: nothing left
+                return
+            if response.status_code not in (200, 206):
+                raise SourceFetchError(
+                    f"HTTP {response.status_code}", retryable=response.status_code in RETRYABLE_STATUS
+                )
+
+            total = None
+            if response.status_code == 206:
+                size = response.headers.get('Content-Range', '').rpartition('/')[2]
+                total = int(size) if size.isdigit() else None
+            elif start:
+                # A full response to a resumed request would repeat bytes already sent
+                raise RangeIgnored("Server ignored the range of a resumed download")
+
+            async for chunk in response.aiter_bytes():
+                yield chunk, total
+                total = None
+
+    async def open_stream(self, url, headers=None):
+        """Send a GET on the shared pool and return the response with its body unread (close it with aclose())"""
+        request = self.client.build_request('GET', url, headers=headers)
+        return await self.client.send(request, stream=True)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self):
+        recent_bytes = sum(size for size, _ in self._recent)
+        recent_seconds = sum(seconds for _, seconds in self._recent)
+        return {
+            'chunk_size': self.chunk_size,
+            'max_connections': self.max_connections,
+            'active': self.active,
+            'started': self.started,
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+            'parallel_downloads': self.parallel,
+            'segments': self.segments,
+            'requests': self.requests,
+            'retries': self.retried,
+            'bytes_fetched': self.bytes_fetched,
+            'recent_throughput_kbps': round(recent_bytes * 8 / 1000 / recent_seconds, 1) if recent_seconds else None,
+        }
+
+
+class ResponseRelay:
+    """
+    Async iterator over an open streaming response's body. The connection is
+    closed once the body ends or the relay is closed, even if it was never iterated.
+    """
+
+    def __init__(self, response, label):
+        self.response = response
+        self.label = label
+        self._chunks = response.aiter_bytes()
+        self._closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed:
+            raise StopAsyncIteration
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            await self.aclose()
+            raise
+        except httpx.HTTPError as e:
+            # The client already has the headers, so a broken upstream just ends the body early
+            print(f"{self.label} error: {e}")
+            await self.aclose()
+            raise StopAsyncIteration
+        except BaseException:
+            await self.aclose()
+            raise
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            # Usually runs in a task being cancelled (client gone), where the pool lock's await would be cut short
+            await asyncio.shield(self.response.aclose())
@@ -0,0 +1,144 @@
+# Strategy racing
+# Runs several async resolution strategies concurrently (optionally hedged)
+# and keeps the first one that succeeds
+
+import asyncio
+import contextvars
+import threading
+import time
+
+# Seconds between checks for pool headroom when a hedge is due but can't start yet
+HEADROOM_POLL = 0.25
+
+# Inside a racing strategy: an Event that is set once the strategy has lost
+_race_lost = contextvars.ContextVar('race_lost', default=None)
+
+
+def in_race():
+    """Whether the current code runs as part of a race (also true in worker threads it submitted to)"""
+    return _race_lost.get() is not None
+
+
+def race_lost():
+    """
+    Whether the strategy running in this context has already lost. Cancelling a
+    loser only stops its coroutine; blocking work it handed to a thread runs on,
+    and checks this before starting anything long.
+    """
+    lost = _race_lost.get()
+    return lost is not None and lost.is_set()
+
+
+async def race_strategies(strategies, hedge_delay=0.0, can_start=None):
+    """
+    Race `strategies`, a list of (name, coroutine_factory) pairs.
+
+    With hedge_delay == 0 every strategy starts at once. Otherwise the next
+    strategy starts when the running ones have not succeeded within
+    `hedge_delay` seconds, or as soon as one of them fails. hedge_delay=None
+    runs the strategies strictly one after another. `can_start()`, when given,
+    must also return True before a strategy starts alongside running ones
+    (e.g. only while the worker pool has headroom).
+
+    Returns (winner_name, result, timings, errors). A strategy succeeds when it
+    returns something truthy; the losers are cancelled before returning.
+    winner_name is None when every strategy failed.
+    """
+    timings = {name: {'strategy': name, 'status': 'not_started', 'elapsed_ms': None} for name, _ in strategies}
+    errors = {}
+    started_at = {}
+    waiting = list(strategies)
+    running = set()
+    lost_flags = {}
+
+    async def attempt(name, factory, lost):
+        if hedge_delay is not None:
+            # Set in this task's own context, and copied from there into the threads it submits work to
+            _race_lost.set(lost)
+        started_at[name] = time.perf_counter()
+        timings[name]['status'] = 'running'
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            result = None
+            errors[name] = getattr(e, 'detail', None) or str(e) or type(e).__name__
+
+        timings[name]['elapsed_ms'] = round((time.perf_counter() - started_at[name]) * 1000)
+        if result:
+            timings[name]['status'] = 'succeeded'
+        else:
+            timings[name]['status'] = 'failed'
+            errors.setdefault(name, "No audio URL found")
+        return name, result
+
+    def start_next():
+        name, factory = waiting.pop(0)
+        lost = threading.Event()
+        task = asyncio.create_task(attempt(name, factory, lost))
+        lost_flags[task] = lost
+        running.add(task)
+
+    def may_start():
+        # Without headroom a hedge would only queue behind the pool: wait for a running strategy instead
+        return not running or can_start is None or can_start()
+
+    winner, winner_result = None, None
+    try:
+        if hedge_delay is not None and hedge_delay <= 0:
+            while waiting and may_start():
+                start_next()
+        else:
+            start_next()
+
+        while running or waiting:
+            if not running:
+                start_next()
+                continue
+
+            timeout = None
+            if waiting and hedge_delay is not None:
+                timeout = hedge_delay or HEADROOM_POLL
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            running.difference_update(done)
+
+            for task in done:
+                name, result = task.result()
+                if result:
+                    winner, winner_result = name, result
+                    break
+
+            if winner:
+                break
+
+            # Hedge: nothing succeeded in time, or something failed, so start the next one
+            if waiting and may_start():
+                start_next()
+    finally:
+        for task in running:
+            lost_flags[task].set()
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+        now = time.perf_counter()
+        for name, timing in timings.items():
+            if timing['status'] == 'running':
+                timing['status'] = 'cancelled'
+                timing['elapsed_ms'] = round((now - started_at[name]) * 1000)
+
+    if winner:
+        timings[winner]['status'] = 'won'
+
+    return winner, winner_result, [timings[name] for name, _ in strategies], errors
+
+
+def format_timings(timings):
+    """Render race timings compactly for a response header"""
+    parts = []
+    for timing in timings:
+        if timing['elapsed_ms'] is None:
+            parts.append(f"{timing['strategy']}={timing['status']}")
+        else:
+            parts.append(f"{timing['strategy']}={timing['status']}/{timing['elapsed_ms']}ms")
+    return "; ".join(parts)
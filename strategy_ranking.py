@@ -0,0 +1,90 @@
+# Strategy ranking
+# Tracks success rate and latency of each extraction method over a sliding
+# window and orders methods so the one most likely to succeed fastest goes first
+
+import threading
+import time
+from collections import deque
+
+
+class StrategyRanker:
+    """Self-tuning ordering of named strategies, grouped per endpoint"""
+
+    def __init__(self, window=50, max_age=1800, default_latency=5.0, min_latency=0.1):
+        self.window = window
+        # Old samples are forgotten so a demoted method gets another chance once YouTube fixes it
+        self.max_age = max_age
+        self.default_latency = default_latency
+        # Floor so near-instant failures don't outrank methods that actually work
+        self.min_latency = min_latency
+        self._samples = {}
+        self._known = {}
+        self._pinned = {}
+        self._lock = threading.Lock()
+
+    def record(self, group, name, success, latency):
+        """Record one attempt of `name` in `group`"""
+        with self._lock:
+            samples = self._samples.setdefault((group, name), deque(maxlen=self.window))
+            samples.append((time.time(), bool(success), float(latency)))
+
+    def _stats(self, group, name, now):
+        samples = self._samples.get((group, name), deque())
+        while samples and now - samples[0][0] > self.max_age:
+            samples.popleft()
+
+        attempts = len(samples)
+        successes = sum(1 for _, success, _ in samples if success)
+        # Laplace smoothing keeps untried methods at an optimistic 50%
+        success_rate = (successes + 1) / (attempts + 2)
+        avg_latency = (sum(latency for _, _, latency in samples) / attempts) if attempts else self.default_latency
+
+        return {
+            'name': name,
+            'attempts': attempts,
+            'successes': successes,
+            'success_rate': round(success_rate, 3),
+            'avg_latency_ms': round(avg_latency * 1000),
+            # Expected seconds spent before this method produces a result
+            'score': round(max(avg_latency, self.min_latency) / success_rate, 3),
+        }
+
+    def ordered(self, group, strategies):
+        """Return `strategies` (dicts with a 'name') best-first, honouring any pin"""
+        names = [strategy['name'] for strategy in strategies]
+        ranked = [entry['name'] for entry in self.ranking(group, names)['methods']]
+        by_name = {strategy['name']: strategy for strategy in strategies}
+        return [by_name[name] for name in ranked if name in by_name]
+
+    def ranking(self, group, names=None):
+        """Current order and statistics for one group"""
+        now = time.time()
+        with self._lock:
+            known = self._known.setdefault(group, [])
+            for name in names or []:
+                if name not in known:
+                    known.append(name)
+
+            stats = [self._stats(group, name, now) for name in known]
+            pinned = self._pinned.get(group)
+
+        # Ties keep the declared order, so the original priority wins until data says otherwise
+        stats.sort(key=lambda entry: entry['score'])
+        if pinned:
+            position = {name: i for i, name in enumerate(pinned)}
+            stats.sort(key=lambda entry: position.get(entry['name'], len(pinned)))
+
+        return {'pinned': list(pinned) if pinned else None, 'methods': stats}
+
+    def rankings(self):
+        with self._lock:
+            groups = list(self._known)
+        return {group: self.ranking(group) for group in groups}
+
+    def pin(self, group, names):
+        """Force an order for `group`; an empty list removes the pin"""
+        with self._lock:
+            if names:
+                self._pinned[group] = list(names)
+            else:
+                self._pinned.pop(group, None)
@@ -0,0 +1,190 @@
+# Stream sessions
+# Every streamed response runs as a session: a watcher polls for the client
+# going away and tears the body down (FFmpeg killed and reaped, upstream
+# connection closed) within a bounded time, and each session's bytes sent,
+# duration and encoder CPU time are recorded
+
+import asyncio
+import functools
+import itertools
+import time
+from collections import deque
+
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+
+class StreamSession:
+    """One client stream: relays the response body and accounts for what it cost"""
+
+    def __init__(self, registry, session_id, label, request, body, poll_interval):
+        self.registry = registry
+        self.id = session_id
+        self.label = label
+        self.path = request.url.path
+        self.target = request.query_params.get('url') or request.query_params.get('query')
+        self.request = request
+        self.body = body
+        self.poll_interval = poll_interval
+        self.started = time.monotonic()
+        self.first_byte_at = None
+        self.finished_at = None
+        self.bytes_sent = 0
+        self.outcome = None
+        self._reading = False
+        self._closed = False
+        self._recorded = False
+        # Started right away so a client that leaves before the first byte is noticed too
+        self._watcher = asyncio.ensure_future(self._watch())
+
+    @property
+    def cpu_seconds(self):
+        # Bodies backed by an encoder (a ProcessRelay, or a broadcast Listener's share) say what it cost
+        return getattr(self.body, 'cpu_seconds', None)
+
+    async def relay(self):
+        pending = None
+        try:
+            while not self._closed:
+                pending = asyncio.ensure_future(self.body.__anext__())
+                self._reading = True
+                try:
+                    await asyncio.wait({pending, self._watcher}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    self._reading = False
+                if not pending.done():
+                    # The watcher saw the client go while we were waiting for output
+                    break
+                try:
+                    chunk = pending.result()
+                except StopAsyncIteration:
+                    break
+                pending = None
+
+                if self.first_byte_at is None:
+                    self.first_byte_at = time.monotonic()
+                self.bytes_sent += len(chunk)
+                yield chunk
+
+            if self.outcome is None:
+                self.outcome = 'disconnected' if self._watcher.done() else 'completed'
+        except (GeneratorExit, asyncio.CancelledError):
+            self.outcome = self.outcome or 'disconnected'
+            raise
+        except Exception:
+            self.outcome = self.outcome or 'failed'
+            raise
+        finally:
+            # Shielded: the response task is usually being cancelled here, and cancelling the
+            # read a second time would cut the body's own cleanup (closing its connection) short
+            await asyncio.shield(self._shutdown(pending))
+
+    async def _shutdown(self, pending):
+        if pending is not None and not pending.done():
+            pending.cancel()
+            await asyncio.wait({pending})
+        await self.close()
+
+    async def _watch(self):
+        """Return once the client has disconnected"""
+        while not await self.request.is_disconnected():
+            await asyncio.sleep(self.poll_interval)
+        self.outcome = self.outcome or 'disconnected'
+        if not self._reading:
+            # The relay is idle (parked on a slow send, or never started): tear down from here
+            await self.close()
+
+    async def close(self):
+        """Stop the body (killing its process or closing its connection) and record the session"""
+        if not self._closed:
+            self._closed = True
+            if asyncio.current_task() is not self._watcher:
+                self._watcher.cancel()
+            aclose = getattr(self.body, 'aclose', None)
+            if aclose:
+                try:
+                    await aclose()
+                except Exception as e:
+                    print(f"Stream teardown error: {e}")
+        if not self._recorded:
+            self._recorded = True
+            self.finished_at = time.monotonic()
+            self.registry._finish(self)
+
+    def to_dict(self):
+        end = self.finished_at or time.monotonic()
+        return {
+            'id': self.id,
+            'endpoint': self.label,
+            'target': self.target,
+            'outcome': self.outcome or 'streaming',
+            'bytes_sent': self.bytes_sent,
+            'duration_ms': round((end - self.started) * 1000),
+            'ttfb_ms': round((self.first_byte_at - self.started) * 1000) if self.first_byte_at else None,
+            'cpu_seconds': self.cpu_seconds,
+        }
+
+
+class StreamSessions:
+    """Registry of live stream sessions plus totals and a window of finished ones"""
+
+    def __init__(self, poll_interval=1.0, history=100):
+        # Upper bound (plus teardown) on how long an abandoned stream keeps running
+        self.poll_interval = poll_interval
+        self._ids = itertools.count(1)
+        self._active = {}
+        self._recent = deque(maxlen=history)
+        self.outcomes = {}
+        self.bytes_sent = 0
+        self.cpu_seconds = 0.0
+
+    def watch(self, request, response, label):
+        """Run a streaming response's body as a session (responses already being watched are left alone)"""
+        if isinstance(response.body_iterator, SessionBody):
+            return response
+        session = StreamSession(
+            self, next(self._ids), label, request, response.body_iterator, self.poll_interval
+        )
+        self._active[session.id] = session
+        response.body_iterator = SessionBody(session)
+        return response
+
+    def track(self, endpoint):
+        """Decorator for endpoints that take `request`: streaming responses they return become sessions"""
+        @functools.wraps(endpoint)
+        async def tracked(*args, **kwargs):
+            response = await endpoint(*args, **kwargs)
+            request = kwargs.get('request') or next((arg for arg in args if isinstance(arg, Request)), None)
+            if request is not None and isinstance(response, StreamingResponse):
+                return self.watch(request, response, endpoint.__name__)
+            return response
+        return tracked
+
+    def _finish(self, session):
+        self._active.pop(session.id, None)
+        self.outcomes[session.outcome] = self.outcomes.get(session.outcome, 0) + 1
+        self.bytes_sent += session.bytes_sent
+        self.cpu_seconds += session.cpu_seconds or 0.0
+        self._recent.append(session.to_dict())
+
+    def stats(self):
+        return {
+            'poll_interval': self.poll_interval,
+            'active': len(self._active),
+            'outcomes': dict(self.outcomes),
+            'bytes_sent': self.bytes_sent,
+            'cpu_seconds': round(self.cpu_seconds, 2),
+            'streams': [session.to_dict() for session in self._active.values()],
+            'recent': list(self._recent),
+        }
+
+
+class SessionBody:
+    """A session's relay as a response body"""
+
+    def __init__(self, session):
+        self.session = session
+        self._chunks = session.relay()
+
+    def __aiter__(self):
+        return self._chunks
@@ -0,0 +1,38 @@
+# Test support
+# Settings main.py insists on at import time, plus small local servers the
+# tests point the HTTP code paths at
+
+import http.server
+import os
+import tempfile
+import threading
+
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+# Any JWT-shaped key: the client validates the format, tests never reach Supabase
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.test")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("TRANSCODE_CACHE_DIR", tempfile.mkdtemp(prefix="transcode-cache-test-"))
+
+
+def load_main():
+    """Import the app module once the settings it requires are in place"""
+    import main
+    return main
+
+
+class LocalServer:
+    """A threaded HTTP server on a free local port, stopped with close()"""
+
+    def __init__(self, handler):
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def url(self, path='/'):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}{path}"
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,61 @@
+import http.server
+import json
+import unittest
+
+from alternative_services import AlternativeServices
+from instance_registry import InstanceRegistry
+from tests.support import LocalServer
+
+
+class InstanceServer(http.server.BaseHTTPRequestHandler):
+    # (status, content type, body) for the next request
+    reply = (200, 'application/json', b'{}')
+
+    def do_GET(self):
+        status, content_type, body = InstanceServer.reply
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class InstanceHealthTest(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalServer(InstanceServer)
+        self.addCleanup(self.server.close)
+        self.registry = InstanceRegistry()
+        self.services = AlternativeServices(registry=self.registry)
+        self.instance = self.server.url('').rstrip('/')
+
+    def query(self, status, body, content_type='application/json'):
+        InstanceServer.reply = (status, content_type, body if isinstance(body, bytes) else json.dumps(body).encode())
+        data = self.services._get_instance_json(self.instance, self.server.url('/api/v1/videos/abcdefghijk'))
+        health = next(entry for entry in self.registry.stats() if entry['url'] == self.instance)
+        return data, health['successes'], health['failures']
+
+    def test_video_data_counts_as_success(self):
+        self.assertEqual(self.query(200, {'adaptiveFormats': []}), ({'adaptiveFormats': []}, 1, 0))
+
+    def test_api_error_about_the_video_counts_as_success(self):
+        self.assertEqual(self.query(404, {'error': 'Video unavailable'}), ({}, 1, 0))
+        self.assertEqual(self.query(400, {'error': 'Invalid video id'}), ({}, 2, 0))
+
+    def test_refusals_and_broken_routes_count_as_failures(self):
+        replies = [
+            (403, b'<html>Attention Required! | Cloudflare</html>', 'text/html'),
+            (401, {'error': 'Unauthorized'}, 'application/json'),
+            (404, b'<html>Not Found</html>', 'text/html'),
+            (200, b'<html>maintenance</html>', 'text/html'),
+            (429, {'error': 'Too many requests'}, 'application/json'),
+        ]
+        for failures, (status, body, content_type) in enumerate(replies, start=1):
+            with self.subTest(status=status):
+                self.assertEqual(self.query(status, body, content_type), (None, 0, failures))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import asyncio
+import sys
+import unittest
+from unittest import mock
+
+from broadcaster import Broadcaster
+
+# Writes a little output, then runs until killed
+LONG_RUNNING = [sys.executable, '-c', 'import sys, time; sys.stdout.buffer.write(b"x" * 1000); sys.stdout.flush(); time.sleep(30)']
+SHORT = [sys.executable, '-c', 'import sys; sys.stdout.buffer.write(b"y" * 5000)']
+
+
+class BroadcasterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_listener_counts_as_soon_as_it_is_handed_out(self):
+        broadcaster = Broadcaster()
+        first = await broadcaster.start('key', LONG_RUNNING)
+        second = broadcaster.join('key')
+        broadcast = first.broadcast
+
+        self.assertEqual(broadcast.listeners, 2)
+        await first.aclose()
+        await second.aclose()
+        await second.aclose()
+        self.assertEqual(broadcast.listeners, 0)
+
+        # Closing never-iterated listeners still stops the process
+        await asyncio.wait_for(self._finished(broadcast), 5)
+        self.assertTrue(broadcast.done)
+        self.assertEqual(broadcaster.stats()['active'], 0)
+
+    async def test_listener_reads_everything_and_leaves_at_the_end(self):
+        broadcaster = Broadcaster()
+        listener = await broadcaster.start('key', SHORT)
+
+        chunks = [chunk async for chunk in listener]
+
+        self.assertEqual(b''.join(chunks), b'y' * 5000)
+        self.assertEqual(listener.broadcast.listeners, 0)
+        self.assertEqual(listener.broadcast.returncode, 0)
+        self.assertEqual(broadcaster.stats()['active'], 0)
+
+    async def test_failed_spawn_raises_before_anything_is_served(self):
+        broadcaster = Broadcaster()
+        slot, writer = mock.Mock(), mock.Mock()
+
+        with self.assertRaises(OSError):
+            await broadcaster.start('key', ['/nonexistent/ffmpeg'], writer=writer, slot=slot)
+
+        slot.release.assert_called_once_with()
+        writer.abort.assert_called_once_with()
+        self.assertIsNone(broadcaster.join('key'))
+        self.assertEqual(broadcaster.stats()['started'], 0)
+
+    async def _finished(self, broadcast):
+        while not broadcast.done:
+            await asyncio.sleep(0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
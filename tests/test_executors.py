@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import unittest
+
+from executors import BlockingExecutors
+
+
+class BlockingExecutorsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.pools = BlockingExecutors({'extraction': 2})
+        self.release = threading.Event()
+
+    async def asyncTearDown(self):
+        self.release.set()
+        self.pools.shutdown(wait=True)
+
+    async def test_cancelled_queued_call_is_not_counted_as_busy(self):
+        running = [asyncio.ensure_future(self.pools.run('extraction', self.release.wait, 5)) for _ in range(2)]
+        queued = asyncio.ensure_future(self.pools.run('extraction', lambda: 'never'))
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.pools.stats()['extraction']['queued'], 1)
+
+        # The caller gives up (race loser, disconnect, wait_for timeout) before a worker frees up
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        self.release.set()
+        await asyncio.gather(*running)
+
+        stats = self.pools.stats()['extraction']
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['running'], 0)
+        self.assertEqual(stats['completed'], 2)
+        self.assertEqual(stats['cancelled'], 1)
+        self.assertEqual(self.pools.idle_workers('extraction'), 2)
+
+    async def test_cancelled_running_call_is_counted_once_it_finishes(self):
+        call = asyncio.ensure_future(self.pools.run('extraction', self.release.wait, 5))
+        await asyncio.sleep(0.05)
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        # Still occupying its thread until the blocking function returns
+        self.assertEqual(self.pools.idle_workers('extraction'), 1)
+
+        self.release.set()
+        for _ in range(100):
+            if self.pools.idle_workers('extraction') == 2:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.pools.idle_workers('extraction'), 2)
+        self.assertEqual(self.pools.stats()['extraction']['completed'], 1)
+
+    async def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            await self.pools.run('video', print)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+import httpx
+
+from executors import BlockingExecutors
+from tests.support import load_main
+
+IN_FLIGHT = 20
+
+
+class HealthUnderLoadTest(unittest.IsolatedAsyncioTestCase):
+    async def test_health_answers_while_extractions_are_in_flight(self):
+        main = load_main()
+        release = threading.Event()
+        lock = threading.Lock()
+        started = []
+
+        def stuck_extract(ydl_opts, url):
+            # Stands in for a yt-dlp extraction that blocks its thread until released
+            with lock:
+                started.append(url)
+            release.wait(10)
+            return None
+
+        pools = BlockingExecutors({'extraction': IN_FLIGHT, 'http': 4, 'supabase': 1})
+        with mock.patch.object(main, 'blocking', pools), mock.patch.object(main, 'ydl_extract', stuck_extract):
+            async with httpx.AsyncClient(app=main.app, base_url='http://test') as client:
+                streams = [
+                    asyncio.ensure_future(client.get('/stream_mp3', params={'url': f"load{n:07d}"}))
+                    for n in range(IN_FLIGHT)
+                ]
+                try:
+                    deadline = time.monotonic() + 5
+                    while len(started) < IN_FLIGHT and time.monotonic() < deadline:
+                        await asyncio.sleep(0.01)
+                    self.assertEqual(len(started), IN_FLIGHT)
+
+                    began = time.monotonic()
+                    response = await asyncio.wait_for(client.get('/health'), 1.0)
+                    elapsed = time.monotonic() - began
+                finally:
+                    release.set()
+                    await asyncio.gather(*streams, return_exceptions=True)
+                    pools.shutdown(wait=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'healthy')
+        self.assertLess(elapsed, 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import httpx
+
+from hls import build_playlist, parse_variant, variant_name
+from tests.support import load_main
+
+SEGMENT = bytes(range(256)) * 40
+
+
+class VariantTest(unittest.TestCase):
+    def test_playlist_segment_urls_name_the_segment_length(self):
+        playlist = build_playlist(20, 6, 'aac', '128k')
+
+        segments = [line for line in playlist.splitlines() if line.endswith('.ts')]
+        self.assertEqual(segments, [f'aac-128k-6s/{index}.ts' for index in range(4)])
+        self.assertEqual(parse_variant('aac-128k-6s'), ('aac', '128k', 6.0))
+
+    def test_fractional_length_round_trips(self):
+        self.assertEqual(variant_name('mp3', '192k', 2.5), 'mp3-192k-2.5s')
+        self.assertEqual(parse_variant('mp3-192k-2.5s'), ('mp3', '192k', 2.5))
+
+    def test_unknown_or_non_canonical_variants_are_rejected(self):
+        for variant in ('aac-128k', 'aac-128k-6', 'aac-128k-6.0s', 'aac-128k-600s', 'aac-128k-nans',
+                        'flac-128k-6s', 'aac-127k-6s', 'aac-128k-6s-x'):
+            with self.subTest(variant=variant):
+                with self.assertRaises(ValueError):
+                    parse_variant(variant)
+
+
+class SegmentEndpointTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.main = load_main()
+        self.encodes = 0
+
+    async def fake_produce(self, video_id, codec, bitrate, segment_seconds, index, cache=True):
+        self.encodes += 1
+        await asyncio.sleep(0.1)
+        if cache:
+            writer = self.main.transcode_cache.open_writer(
+                *self.main.hls_segment_key(video_id, codec, bitrate, segment_seconds, index)
+            )
+            writer.write(SEGMENT)
+            writer.commit()
+        return SEGMENT
+
+    async def get_concurrently(self, path, *ranges):
+        async with httpx.AsyncClient(app=self.main.app, base_url='http://test') as client:
+            return await asyncio.gather(*(
+                client.get(path, headers={'Range': byte_range} if byte_range else {}) for byte_range in ranges
+            ))
+
+    async def test_only_the_request_that_encodes_reports_a_miss(self):
+        with mock.patch.object(self.main, 'produce_hls_segment', self.fake_produce):
+            whole, part = await self.get_concurrently('/hls/hlsmiss0001/aac-128k-6s/0.ts', None, 'bytes=100-199')
+
+        self.assertEqual(self.encodes, 1)
+        self.assertEqual((whole.status_code, whole.content), (200, SEGMENT))
+        self.assertEqual((part.status_code, part.content), (206, SEGMENT[100:200]))
+        # Whichever request started the encode is the one miss; the other waited on it
+        cache_headers = sorted(response.headers['X-Transcode-Cache'] for response in (whole, part))
+        self.assertEqual(cache_headers, ['hit', 'miss'])
+        self.assertEqual(sum('X-Transcode-Shared' in response.headers for response in (whole, part)), 1)
+
+    async def test_range_is_honoured_when_the_cache_kept_nothing(self):
+        produce = lambda *args: self.fake_produce(*args, cache=False)
+        with mock.patch.object(self.main, 'produce_hls_segment', produce):
+            response, = await self.get_concurrently('/hls/hlsmiss0002/aac-128k-6s/0.ts', 'bytes=-50')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, SEGMENT[-50:])
+        self.assertEqual(response.headers['Content-Range'], f'bytes {len(SEGMENT) - 50}-{len(SEGMENT) - 1}/{len(SEGMENT)}')
+        self.assertEqual(response.headers['X-Transcode-Cache'], 'miss')
+
+
+if __name__ == '__main__':
+    unittest.main()
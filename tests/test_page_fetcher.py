@@ -0,0 +1,65 @@
+import http.server
+import time
+import unittest
+from unittest import mock
+
+import page_fetcher
+from page_fetcher import PageFetcher
+from tests.support import LocalServer
+
+PAGE = b'<script>var ytInitialPlayerResponse = {"playabilityStatus": {"status": "OK"}};</script>'
+
+
+class PageServer(http.server.BaseHTTPRequestHandler):
+    # Status codes to answer with, in order; 200 once they run out
+    statuses = []
+    requests = 0
+
+    def do_GET(self):
+        PageServer.requests += 1
+        status = PageServer.statuses.pop(0) if PageServer.statuses else 200
+        body = PAGE if status == 200 else b'busy'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PageFetcherTest(unittest.TestCase):
+    def setUp(self):
+        PageServer.statuses = []
+        PageServer.requests = 0
+        self.server = LocalServer(PageServer)
+        variants = {'watch': {'url': self.server.url('/watch?v={video_id}'), 'headers': {}}}
+        patcher = mock.patch.dict(page_fetcher.PAGE_VARIANTS, variants)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.server.close)
+
+    def test_successful_pages_are_cached_for_the_ttl(self):
+        fetcher = PageFetcher(ttl=60, error_ttl=0.2)
+        first = fetcher.fetch('aaaaaaaaaaa')
+        second = fetcher.fetch('aaaaaaaaaaa')
+        self.assertTrue(first.ok)
+        self.assertEqual(first.playability_status, {'status': 'OK'})
+        self.assertIs(second, first)
+        self.assertEqual(PageServer.requests, 1)
+
+    def test_error_pages_expire_after_the_error_ttl(self):
+        PageServer.statuses = [429]
+        fetcher = PageFetcher(ttl=60, error_ttl=0.2)
+        self.assertEqual(fetcher.fetch('aaaaaaaaaaa').status_code, 429)
+        # Callers inside the short window share the error instead of hammering upstream
+        self.assertEqual(fetcher.fetch('aaaaaaaaaaa').status_code, 429)
+        self.assertEqual(PageServer.requests, 1)
+
+        time.sleep(0.3)
+        self.assertTrue(fetcher.fetch('aaaaaaaaaaa').ok)
+        self.assertEqual(PageServer.requests, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import json
+import unittest
+
+from benchmarks.page_fixtures import FIXTURES, build_page
+from player_response import FAST_PATH_ATTEMPTS, PlayerResponseScanner, extract_player_response, find_player_response
+
+PLAYER = {'playabilityStatus': {'status': 'OK'}, 'videoDetails': {'shortDescription': 'x'}}
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class PlayerResponseTest(unittest.TestCase):
+    def test_fixtures_decode_whole_and_chunked(self):
+        for name in FIXTURES:
+            page = build_page(name)
+            expected = find_player_response(page)
+            self.assertEqual(expected['videoDetails']['videoId'], 'dQw4w9WgXcQ', name)
+            for size in (1, 7, 4096, 64 * 1024):
+                if size == 1 and len(page) > 200000:
+                    continue
+                self.assertEqual(extract_player_response(chunked(page, size)), expected, (name, size))
+
+    def test_object_end_inside_strings(self):
+        for count in (1, FAST_PATH_ATTEMPTS, FAST_PATH_ATTEMPTS + 3):
+            player = dict(PLAYER, videoDetails={'shortDescription': 'f(){return {"a":1};}; \\ "};" ' * count})
+            page = f'<script>var ytInitialPlayerResponse = {json.dumps(player)};var x = 1;</script>'.encode()
+            self.assertEqual(find_player_response(page), player, count)
+            self.assertEqual(extract_player_response(chunked(page, 5)), player, count)
+
+    def test_end_of_input_falls_back_to_brace_matching(self):
+        # No `};` after the object at all: only close() can finish it
+        player = dict(PLAYER, videoDetails={'shortDescription': '};'})
+        page = f'var ytInitialPlayerResponse = {json.dumps(player)}\n</script>'.encode()
+        scanner = PlayerResponseScanner()
+        self.assertIsNone(scanner.feed(page))
+        self.assertEqual(scanner.close(), player)
+
+    def test_json_embedded_form(self):
+        page = ('{"args": {"ytInitialPlayerResponse": ' + json.dumps(PLAYER) + '}}').encode()
+        self.assertEqual(find_player_response(page), PLAYER)
+
+    def test_skips_non_object_assignments(self):
+        page = ('window["ytInitialPlayerResponse"] = null; var ytInitialPlayerResponse = ' + json.dumps(PLAYER) + ';').encode()
+        self.assertEqual(find_player_response(page), PLAYER)
+
+    def test_missing(self):
+        self.assertIsNone(find_player_response(b'<html>nothing here</html>'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import sys
+import time
+import unittest
+
+from process_relay import ProcessRelay, start_relay
+
+
+def child(code):
+    return [sys.executable, '-c', code]
+
+
+# Writes its output and closes stdout a moment before exiting, as FFmpeg does while finalizing
+FINISHES_CLEANLY = child('import os, sys, time\nsys.stdout.buffer.write(b"x" * 100000); sys.stdout.flush(); os.close(1); time.sleep(0.2)')
+FINISHES_WITH_ERROR = child('import os, sys, time\nsys.stdout.buffer.write(b"x" * 10); sys.stdout.flush(); os.close(1); time.sleep(0.2); sys.exit(3)')
+NEVER_EXITS = child('import os, sys, time\nsys.stdout.buffer.write(b"x" * 10); sys.stdout.flush(); os.close(1); time.sleep(30)')
+
+
+class ProcessRelayTest(unittest.IsolatedAsyncioTestCase):
+    async def read_all(self, relay):
+        return b''.join([chunk async for chunk in relay])
+
+    async def test_end_of_output_waits_for_the_real_exit_status(self):
+        relay = await start_relay(FINISHES_CLEANLY)
+        self.assertEqual(len(await self.read_all(relay)), 100000)
+        self.assertEqual(relay.proc.returncode, 0)
+
+        relay = await start_relay(FINISHES_WITH_ERROR)
+        await self.read_all(relay)
+        self.assertEqual(relay.proc.returncode, 3)
+
+    async def test_child_that_does_not_exit_is_killed_after_the_grace_period(self):
+        relay = await start_relay(NEVER_EXITS)
+        relay.EXIT_GRACE = 0.2
+        started = time.monotonic()
+        await self.read_all(relay)
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertLess(relay.proc.returncode, 0)
+
+    async def test_close_kills_without_waiting(self):
+        relay = await start_relay(NEVER_EXITS)
+        started = time.monotonic()
+        await relay.aclose()
+
+        self.assertLess(time.monotonic() - started, ProcessRelay.EXIT_GRACE)
+        self.assertLess(relay.proc.returncode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
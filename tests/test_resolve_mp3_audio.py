@@ -0,0 +1,48 @@
+import unittest
+from unittest import mock
+
+from fastapi import HTTPException
+
+from executors import BlockingExecutors
+from strategy_ranking import StrategyRanker
+from tests.support import load_main
+
+
+class ResolveMp3AudioTest(unittest.IsolatedAsyncioTestCase):
+    async def resolve_private(self, video_id):
+        """Run resolve_mp3_audio with every method failing as a private video; returns (ranker, methods tried)"""
+        main = load_main()
+        tried = []
+
+        def private_extract(ydl_opts, url):
+            tried.append(ydl_opts)
+            raise Exception(f"ERROR: [youtube] {video_id}: Private video. Sign in if you've been granted access")
+
+        ranker = StrategyRanker()
+        pools = BlockingExecutors({'extraction': 2, 'http': 2, 'supabase': 1})
+        with mock.patch.object(main, 'blocking', pools), \
+                mock.patch.object(main, 'strategy_ranker', ranker), \
+                mock.patch.object(main, 'ydl_extract', private_extract):
+            with self.assertRaises(HTTPException):
+                await main.resolve_mp3_audio(f"https://www.youtube.com/watch?v={video_id}")
+        pools.shutdown()
+        return ranker, tried
+
+    async def test_permanent_failure_stops_after_one_method(self):
+        ranker, tried = await self.resolve_private("prvt0000001")
+
+        # Private for one client means private for the others
+        self.assertEqual(len(tried), 1)
+        methods = ranker.ranking("stream_mp3")['methods']
+        self.assertEqual(sum(method['attempts'] for method in methods), 1)
+
+    async def test_permanent_failure_is_recorded_against_the_method(self):
+        ranker, _ = await self.resolve_private("prvt0000002")
+
+        attempted = [method for method in ranker.ranking("stream_mp3")['methods'] if method['attempts']]
+        self.assertEqual(len(attempted), 1)
+        self.assertEqual(attempted[0]['successes'], 0)
+        self.assertEqual(attempted[0]['success_rate'], round(1 / 3, 3))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+
+from search_cache import SearchCache
+
+
+class FakeSearch:
+    """Counts open upstream searches the way open_search_results' `with YoutubeDL` would"""
+
+    def __init__(self, results=50):
+        self.results = results
+        self.open = 0
+
+    def __call__(self):
+        self.open += 1
+        try:
+            for n in range(self.results):
+                yield {'id': f"vid{n:08d}", 'title': f"Track {n}", 'duration': 200}
+        finally:
+            self.open -= 1
+
+
+def any_entry(entry):
+    return True
+
+
+class SearchCacheTest(unittest.TestCase):
+    def test_search_closes_once_max_results_are_pulled(self):
+        cache = SearchCache(max_results=5)
+        search = FakeSearch()
+
+        entries, position, has_more = cache.take('query', 0, 10, any_entry, search)
+
+        self.assertEqual(len(entries), 5)
+        self.assertFalse(has_more)
+        self.assertEqual(search.open, 0)
+
+    def test_live_sessions_beyond_the_cap_are_released_and_resume(self):
+        cache = SearchCache(max_live=2)
+        searches = {query: FakeSearch() for query in ('a', 'b', 'c')}
+
+        for query, search in searches.items():
+            cache.take(query, 0, 3, any_entry, search)
+
+        self.assertEqual(searches['a'].open, 0)
+        self.assertEqual(searches['b'].open + searches['c'].open, 2)
+        self.assertEqual(cache.stats()['live_sessions'], 2)
+
+        # Continuing a released query reopens it past what was already pulled
+        entries, position, _ = cache.take('a', 3, 2, any_entry, searches['a'])
+        self.assertEqual([entry['id'] for entry in entries], ['vid00000003', 'vid00000004'])
+        self.assertEqual(position, 5)
+        self.assertEqual(searches['a'].open, 1)
+        self.assertEqual(searches['b'].open, 0)
+
+    def test_evicted_session_closes_its_search(self):
+        cache = SearchCache(max_entries=1)
+        first, second = FakeSearch(), FakeSearch()
+
+        cache.take('first', 0, 2, any_entry, first)
+        self.assertEqual(first.open, 1)
+        cache.take('second', 0, 2, any_entry, second)
+
+        self.assertEqual(first.open, 0)
+        self.assertEqual(second.open, 1)
+
+    def test_release_of_a_busy_session_waits_for_its_take(self):
+        cache = SearchCache()
+        search = FakeSearch()
+        session = cache.session('busy', search)
+
+        def releasing(entry):
+            # Released from "another request" while this take holds the session
+            session.release()
+            return True
+
+        cache.take('busy', 0, 2, releasing, search)
+        self.assertFalse(session.live)
+        self.assertEqual(search.open, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import http.server
+import random
+import re
+import unittest
+
+from source_fetcher import SourceFetcher, SourceFetchError
+from tests.support import LocalServer
+
+SOURCE = random.Random(23).randbytes(10_000)
+CHUNK_SIZE = 1024
+
+
+class RangeServer(http.server.BaseHTTPRequestHandler):
+    # Answer every request with the whole body, as if Range weren't supported
+    ignore_range = False
+    # Most bytes one response carries (a shorter 206 than asked for)
+    max_response = None
+    # Status codes to fail requests starting at a byte offset with, in order
+    failures = {}
+    ranges = []
+
+    def do_GET(self):
+        match = re.fullmatch(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if self.ignore_range or not match:
+            self.send_body(200, SOURCE)
+            return
+
+        start, end = int(match.group(1)), min(int(match.group(2)), len(SOURCE) - 1)
+        RangeServer.ranges.append((start, end))
+        statuses = RangeServer.failures.get(start)
+        if statuses:
+            self.send_body(statuses.pop(0), b'nope')
+            return
+        if self.max_response:
+            end = min(end, start + self.max_response - 1)
+        self.send_body(206, SOURCE[start:end + 1], f"bytes {start}-{end}/{len(SOURCE)}")
+
+    def send_body(self, status, body, content_range=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ParallelSourceTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        RangeServer.ignore_range = False
+        RangeServer.max_response = None
+        RangeServer.failures = {}
+        RangeServer.ranges = []
+        self.server = LocalServer(RangeServer)
+        self.addCleanup(self.server.close)
+        self.fetcher = SourceFetcher(chunk_size=CHUNK_SIZE, retry_backoff=0)
+        # clen= gives the size up front, the way googlevideo URLs do
+        self.url = self.server.url(f'/videoplayback?clen={len(SOURCE)}')
+
+    async def asyncTearDown(self):
+        await self.fetcher.close()
+
+    async def download(self, connections=4):
+        return b''.join([chunk async for chunk in self.fetcher.iter_source_parallel(self.url, connections=connections)])
+
+    async def test_segments_split_the_source_at_chunk_boundaries(self):
+        self.assertEqual(await self.download(), SOURCE)
+
+        expected = [(start, min(start + CHUNK_SIZE, len(SOURCE)) - 1) for start in range(0, len(SOURCE), CHUNK_SIZE)]
+        self.assertEqual(sorted(RangeServer.ranges), expected)
+        self.assertEqual(self.fetcher.segments, len(expected))
+        self.assertEqual(self.fetcher.completed, 1)
+
+    async def test_short_responses_are_completed_with_further_requests(self):
+        RangeServer.max_response = 300
+
+        self.assertEqual(await self.download(), SOURCE)
+        self.assertGreater(len(RangeServer.ranges), self.fetcher.segments)
+
+    async def test_failed_range_is_retried(self):
+        RangeServer.failures = {3 * CHUNK_SIZE: [503]}
+
+        self.assertEqual(await self.download(), SOURCE)
+        self.assertEqual(self.fetcher.retried, 1)
+
+    async def test_range_that_keeps_failing_fails_the_download(self):
+        RangeServer.failures = {3 * CHUNK_SIZE: [404]}
+
+        with self.assertRaises(SourceFetchError):
+            await self.download()
+        self.assertEqual(self.fetcher.failed, 1)
+        self.assertEqual(self.fetcher.active, 0)
+
+    async def test_server_ignoring_range_is_read_once_sequentially(self):
+        RangeServer.ignore_range = True
+
+        self.assertEqual(await self.download(), SOURCE)
+        self.assertEqual(self.fetcher.completed, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
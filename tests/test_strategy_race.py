@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import unittest
+
+from executors import BlockingExecutors
+from strategy_race import in_race, race_lost, race_strategies
+
+
+class RaceStrategiesTest(unittest.IsolatedAsyncioTestCase):
+    async def test_first_success_wins_and_losers_are_flagged(self):
+        pools = BlockingExecutors({'extraction': 4})
+        release = threading.Event()
+        seen_in_thread = {}
+
+        def slow_blocking(name):
+            release.wait(5)
+            # What a blocking extraction would check before starting its next long step
+            seen_in_thread[name] = (in_race(), race_lost())
+
+        async def slow():
+            await pools.run('extraction', slow_blocking, 'slow')
+
+        async def fast():
+            await asyncio.sleep(0.01)
+            return {'url': 'http://audio'}
+
+        winner, result, timings, _ = await race_strategies([('slow', slow), ('fast', fast)], hedge_delay=0)
+        release.set()
+        pools.shutdown(wait=True)
+
+        self.assertEqual(winner, 'fast')
+        self.assertEqual(result, {'url': 'http://audio'})
+        self.assertEqual({t['strategy']: t['status'] for t in timings}, {'slow': 'cancelled', 'fast': 'won'})
+        # The loser's thread outlived its cancelled coroutine, and could tell it had lost
+        self.assertEqual(seen_in_thread['slow'], (True, True))
+
+    async def test_hedges_wait_for_headroom(self):
+        started = []
+        running = [0, 0]  # now, peak
+        headroom = [False]
+
+        def strategy(name, result):
+            async def run():
+                started.append(name)
+                running[0] += 1
+                running[1] = max(running)
+                try:
+                    await asyncio.sleep(0.05)
+                finally:
+                    running[0] -= 1
+                return result
+            return run
+
+        winner, _, _, _ = await race_strategies(
+            [('a', strategy('a', None)), ('b', strategy('b', None)), ('c', strategy('c', 'ok'))],
+            hedge_delay=0,
+            can_start=lambda: headroom[0]
+        )
+        # Without headroom nothing ran alongside anything else: each started only once the previous failed
+        self.assertEqual(started, ['a', 'b', 'c'])
+        self.assertEqual(running[1], 1)
+        self.assertEqual(winner, 'c')
+
+    async def test_sequential_runs_are_not_races(self):
+        async def check():
+            return in_race() or 'not racing'
+
+        winner, result, _, _ = await race_strategies([('only', check)], hedge_delay=None)
+        self.assertEqual((winner, result), ('only', 'not racing'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+from unittest import mock
+
+import httpx
+
+from broadcaster import Broadcaster
+from tests.support import load_main
+
+
+class StreamMp3SpawnTest(unittest.IsolatedAsyncioTestCase):
+    async def test_missing_encoder_is_a_500_not_an_empty_stream(self):
+        main = load_main()
+        audio = {'url': 'http://127.0.0.1:9/videoplayback.webm', 'mime_type': 'audio/webm', 'method': 'test'}
+        admitted = main.transcode_scheduler.stats()['admitted']
+
+        with mock.patch.object(main, 'broadcaster', Broadcaster()), \
+                mock.patch.object(main.extraction_cache, 'lookup', return_value=audio), \
+                mock.patch.object(main, 'mp3_command', lambda source, profile: ['/nonexistent/ffmpeg', '-i', source]):
+            async with httpx.AsyncClient(app=main.app, base_url='http://test') as client:
+                response = await client.get('/stream_mp3', params={'url': 'https://www.youtube.com/watch?v=nospawn0001'})
+
+        self.assertEqual(response.status_code, 500)
+        stats = main.transcode_scheduler.stats()
+        self.assertEqual(stats['admitted'], admitted + 1)
+        # The slot went back with the failed spawn
+        self.assertEqual(stats['active'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import asyncio
+import http.server
+import sys
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+import anyio
+from starlette.responses import StreamingResponse
+
+from broadcaster import Broadcaster
+from process_relay import start_relay
+from source_fetcher import ResponseRelay, SourceFetcher
+from stream_session import StreamSessions
+from tests.support import LocalServer
+
+# An encoder that never finishes: a little output every 10 ms until killed
+ENDLESS = [sys.executable, '-c', 'import sys, time\nwhile True:\n    sys.stdout.buffer.write(b"x" * 1000); sys.stdout.flush(); time.sleep(0.01)']
+
+
+class Client:
+    """The request side of a session: the client leaves when `disconnected` is set"""
+
+    def __init__(self):
+        self.url = SimpleNamespace(path='/stream_mp3')
+        self.query_params = {'url': 'abcdefghijk'}
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+class EndlessUpstream(http.server.BaseHTTPRequestHandler):
+    """Streams a body forever; `closed` is set once the client has hung up"""
+    closed = threading.Event()
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/webm')
+        self.end_headers()
+        try:
+            while True:
+                self.wfile.write(b'a' * 1000)
+                self.wfile.flush()
+                time.sleep(0.01)
+        except (BrokenPipeError, ConnectionResetError):
+            EndlessUpstream.closed.set()
+
+    def log_message(self, *args):
+        pass
+
+
+class StreamSessionTeardownTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.sessions = StreamSessions(poll_interval=0.05)
+        self.client = Client()
+
+    def watch(self, body):
+        return self.sessions.watch(self.client, StreamingResponse(body), 'stream_mp3').body_iterator
+
+    async def test_disconnect_kills_and_reaps_the_encoder(self):
+        relay = await start_relay(ENDLESS)
+        body = self.watch(relay).__aiter__()
+        self.assertTrue(await body.__anext__())
+
+        self.client.disconnected = True
+        started = time.monotonic()
+        async for _ in body:
+            pass
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertIsNotNone(relay.proc.returncode)
+        stats = self.sessions.stats()
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(stats['outcomes'], {'disconnected': 1})
+        self.assertGreater(stats['bytes_sent'], 0)
+
+    async def test_cancelled_relay_closes_the_upstream_connection(self):
+        EndlessUpstream.closed.clear()
+        server = LocalServer(EndlessUpstream)
+        self.addCleanup(server.close)
+        fetcher = SourceFetcher()
+        try:
+            response = await fetcher.open_stream(server.url('/videoplayback'))
+            body = self.watch(ResponseRelay(response, 'test'))
+            reading = asyncio.Event()
+
+            async def send_body():
+                async for _ in body:
+                    reading.set()
+
+            # As Starlette does once the client's http.disconnect arrives: cancel the
+            # scope the body is sent in, which cancels every await inside it again
+            async with anyio.create_task_group() as group:
+                group.start_soon(send_body)
+                await reading.wait()
+                group.cancel_scope.cancel()
+
+            self.assertTrue(await asyncio.to_thread(EndlessUpstream.closed.wait, 5))
+            self.assertEqual(self.sessions.stats()['outcomes'], {'disconnected': 1})
+        finally:
+            await fetcher.close()
+
+    async def test_body_never_read_is_released_when_the_client_leaves(self):
+        broadcaster = Broadcaster()
+        listener = await broadcaster.start('key', ENDLESS)
+        self.watch(listener)
+
+        self.client.disconnected = True
+        deadline = time.monotonic() + 5
+        while not listener.broadcast.done and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+
+        self.assertTrue(listener.broadcast.done)
+        self.assertEqual(listener.broadcast.listeners, 0)
+        self.assertEqual(self.sessions.stats()['outcomes'], {'disconnected': 1})
+
+    async def test_broadcast_sessions_are_charged_the_encoder_cpu(self):
+        broadcaster = Broadcaster()
+        # Busy enough to register CPU time, then closes its output shortly before exiting, as FFmpeg does
+        busy = [sys.executable, '-c', 'import os, sys, time\nend = time.process_time() + 0.3\nwhile time.process_time() < end: pass\nsys.stdout.buffer.write(b"x" * 1000); sys.stdout.flush(); os.close(1); time.sleep(0.2)']
+        listener = await broadcaster.start('key', busy)
+        joined = Client()
+        joined_body = self.sessions.watch(joined, StreamingResponse(broadcaster.join('key')), 'stream_mp3').body_iterator
+        first_body = self.watch(listener)
+
+        first = b''.join([chunk async for chunk in first_body])
+        second = b''.join([chunk async for chunk in joined_body])
+
+        self.assertEqual(first, second)
+        broadcast = listener.broadcast
+        self.assertGreater(broadcast.cpu_seconds, 0.2)
+        stats = self.sessions.stats()
+        self.assertEqual(stats['outcomes'], {'completed': 2})
+        # Split between the two sessions, together the whole encode
+        self.assertAlmostEqual(stats['cpu_seconds'], round(broadcast.cpu_seconds, 2), places=2)
+        self.assertEqual(sum(session['cpu_seconds'] for session in stats['recent']), broadcast.cpu_seconds)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+# Transcode cache
+# Finished transcodes on disk keyed by (video_id, codec, bitrate), or by
+# (video_id, codec, bitrate, segment) for HLS segments: the first play tees
+# its encoder output into a part file that is atomically published when
+# complete, later plays are read straight from disk
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+INDEX_FILE = 'index.json'
+PART_SUFFIX = '.part'
+
+
+def cache_name(video_id, codec, bitrate, segment=None):
+    """File name for a transcode (or one HLS segment of it), derived from its key"""
+    key = f"{video_id}:{codec}:{bitrate}" if segment is None else f"{video_id}:{codec}:{bitrate}:{segment}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return f"{digest}.{codec}"
+
+
+class CacheWriter:
+    """A transcode being written; commit() publishes it, abort() throws it away"""
+
+    def __init__(self, cache, name, meta, part_path):
+        self.cache = cache
+        self.name = name
+        self.meta = meta
+        self.part_path = part_path
+        self.size = 0
+        self.closed = False
+        self._file = open(part_path, 'wb')
+
+    def write(self, chunk):
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        """Publish the file under its final name; returns the final path or None"""
+        if self.closed:
+            return None
+        self.closed = True
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            if not self.size:
+                raise ValueError("Empty transcode")
+            return self.cache._publish(self)
+        except Exception:
+            self._discard()
+            return None
+
+    def abort(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._file.close()
+        self._discard()
+
+    def _discard(self):
+        try:
+            os.remove(self.part_path)
+        except OSError:
+            pass
+        self.cache._release(self.name)
+
+
+class TranscodeCache:
+    """Size-bounded LRU of transcoded files with an index that survives restarts"""
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3, index_save_interval=30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Last-used times are only flushed to disk this often (publishes and evictions save at once)
+        self.index_save_interval = index_save_interval
+        self._lock = threading.Lock()
+        self._index = {}
+        self._writing = set()
+        self._index_saved_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.published = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _recover(self):
+        """Load the index and reconcile it with what is actually on disk"""
+        try:
+            with open(self._path(INDEX_FILE), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+
+        on_disk = set(os.listdir(self.directory))
+        for filename in on_disk:
+            if filename == INDEX_FILE:
+                continue
+            # Part files are leftovers of transcodes interrupted by a crash or restart,
+            # and files missing from the index were never fully registered
+            if filename.endswith(PART_SUFFIX) or filename not in index:
+                try:
+                    os.remove(self._path(filename))
+                except OSError:
+                    pass
+
+        self._index = {
+            name: meta for name, meta in index.items()
+            if name in on_disk and isinstance(meta, dict) and 'size' in meta
+        }
+        with self._lock:
+            self._evict()
+            self._save_index()
+
+    def _save_index(self):
+        """Atomically rewrite the index (caller holds the lock)"""
+        temp_path = self._path(f"{INDEX_FILE}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f)
+            os.replace(temp_path, self._path(INDEX_FILE))
+            self._index_saved_at = time.time()
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Drop least recently used files until the cache fits (caller holds the lock)"""
+        total = sum(meta['size'] for meta in self._index.values())
+        for name in sorted(self._index, key=lambda name: self._index[name].get('last_used', 0)):
+            if total <= self.max_bytes:
+                break
+            total -= self._index.pop(name)['size']
+            self.evictions += 1
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+
+    def lookup(self, video_id, codec, bitrate, segment=None):
+        """Return the path of a finished transcode (or segment), or None"""
+        name = cache_name(video_id, codec, bitrate, segment)
+        now = time.time()
+        with self._lock:
+            meta = self._index.get(name)
+            if meta is None or not os.path.exists(self._path(name)):
+                self._index.pop(name, None)
+                self.misses += 1
+                return None
+            meta['last_used'] = now
+            self.hits += 1
+            if now - self._index_saved_at > self.index_save_interval:
+                self._save_index()
+        return self._path(name)
+
+    def open_writer(self, video_id, codec, bitrate, segment=None):
+        """Start caching a transcode (or segment); None if it is already cached or being written"""
+        name = cache_name(video_id, codec, bitrate, segment)
+        with self._lock:
+            if name in self._index or name in self._writing:
+                return None
+            self._writing.add(name)
+
+        meta = {'video_id': video_id, 'codec': codec, 'bitrate': bitrate}
+        if segment is not None:
+            meta['segment'] = segment
+        part_path = self._path(f"{name}.{uuid.uuid4().hex}{PART_SUFFIX}")
+        try:
+            return CacheWriter(self, name, meta, part_path)
+        except OSError:
+            self._release(name)
+            return None
+
+    def _publish(self, writer):
+        now = time.time()
+        with self._lock:
+            self._writing.discard(writer.name)
+            if writer.size > self.max_bytes:
+                os.remove(writer.part_path)
+                return None
+            os.replace(writer.part_path, self._path(writer.name))
+            self._index[writer.name] = dict(writer.meta, size=writer.size, created=now, last_used=now)
+            self.published += 1
+            self._evict()
+            self._save_index()
+        return self._path(writer.name)
+
+    def _release(self, name):
+        with self._lock:
+            self._writing.discard(name)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'files': len(self._index),
+                'bytes': sum(meta['size'] for meta in self._index.values()),
+                'max_bytes': self.max_bytes,
+                'writing': len(self._writing),
+                'hits': self.hits,
+                'misses': self.misses,
+                'published': self.published,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
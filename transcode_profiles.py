@@ -0,0 +1,77 @@
+# Transcode profiles
+# Named FFmpeg settings for MP3 encodes: how much input to probe before the
+# first output, how eagerly output is flushed, and the bitrate (`quality`)
+
+# Bitrates an encode may be asked for; the bitrate is part of the transcode cache key
+BITRATES = ('64k', '96k', '128k', '160k', '192k', '256k', '320k')
+
+QUALITIES = {
+    'low': '96k',
+    'medium': '128k',
+    'high': '192k',
+    'max': '320k',
+}
+
+PROFILES = {
+    'standard': {
+        'description': "FFmpeg's default probing, 128k",
+        'bitrate': '128k',
+        'input_args': [],
+        'output_args': [],
+    },
+    'low_latency': {
+        'description': "Minimal probing and no buffering, for the shortest time to first byte",
+        'bitrate': '128k',
+        # YouTube audio is a single known stream, so a few KB of probing is enough to start decoding
+        'input_args': ['-probesize', '32768', '-analyzeduration', '0', '-fflags', '+nobuffer'],
+        # Hand every encoded packet to the pipe straight away instead of filling the muxer's buffer
+        'output_args': ['-flush_packets', '1'],
+    },
+    'economy': {
+        'description': "Default probing at 96k, for cheap conversions",
+        'bitrate': '96k',
+        'input_args': [],
+        'output_args': [],
+    },
+}
+
+
+def parse_bitrate(quality):
+    """A quality name ('high') or bitrate ('192k', '192') as one of BITRATES; raises ValueError"""
+    value = quality.strip().lower()
+    if value in QUALITIES:
+        return QUALITIES[value]
+    if value.isdigit():
+        value = f"{value}k"
+    if value not in BITRATES:
+        raise ValueError(
+            f"Unknown quality '{quality}', expected one of: {', '.join(QUALITIES)} or a bitrate in {', '.join(BITRATES)}"
+        )
+    return value
+
+
+def resolve_profile(profile=None, quality=None, default='standard'):
+    """
+    Return the settings for `profile` (or `default`) with the bitrate overridden
+    by `quality` when given. Raises ValueError for unknown names.
+    """
+    name = (profile or default).strip().lower()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown profile '{profile}', expected one of: {', '.join(PROFILES)}")
+
+    settings = dict(PROFILES[name], name=name)
+    if quality:
+        settings['bitrate'] = parse_bitrate(quality)
+    return settings
+
+
+def mp3_command(audio_url, profile, input_args=()):
+    """FFmpeg command that encodes `audio_url` to MP3 on stdout with a profile's settings"""
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        *profile['input_args'], *input_args,
+        '-i', audio_url,
+        '-vn', '-f', 'mp3', '-ab', profile['bitrate'], '-ar', '44100',
+        *profile['output_args'],
+        'pipe:1'
+    ]
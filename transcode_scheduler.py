@@ -0,0 +1,121 @@
+# Transcode scheduler
+# Caps how many FFmpeg processes run at once: a fixed number of slots, a
+# bounded FIFO queue of requests waiting for one, and rejection beyond that
+
+import asyncio
+import os
+import time
+from collections import deque
+
+
+class SchedulerFull(Exception):
+    """No slot is free and the wait queue is full (or the wait took too long)"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TranscodeSlot:
+    """A granted slot; release() hands it to the next waiter (safe to call twice)"""
+
+    def __init__(self, scheduler, waited):
+        self._scheduler = scheduler
+        self.waited = waited
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._scheduler._release()
+
+
+class TranscodeScheduler:
+    """Admission control for transcodes, shared by every endpoint that starts FFmpeg"""
+
+    def __init__(self, slots=None, max_queue=None, queue_timeout=30.0, retry_after=5, window=200):
+        self.slots = max(1, slots or os.cpu_count() or 1)
+        self.max_queue = max(0, max_queue if max_queue is not None else self.slots * 4)
+        # None waits for a slot however long it takes
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._active = 0
+        self._waiters = deque()
+        # Recent queue waits in seconds, for the stats
+        self._waits = deque(maxlen=window)
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.peak_active = 0
+        self.peak_queued = 0
+
+    async def acquire(self):
+        """Wait for a free slot; raises SchedulerFull when the queue is full or the wait times out"""
+        if self._active < self.slots and not self._waiters:
+            self._active += 1
+            return self._grant(0.0)
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerFull("Too many transcodes in progress, try again shortly", self.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, len(self._waiters))
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as we gave up: pass it on
+                self._release()
+            else:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.timed_out += 1
+                raise SchedulerFull("Timed out waiting for a transcode slot", self.retry_after) from None
+            raise
+
+        # The releasing transcode's slot was transferred to us, so _active is unchanged
+        return self._grant(time.monotonic() - started)
+
+    def _grant(self, waited):
+        self.admitted += 1
+        self.peak_active = max(self.peak_active, self._active)
+        self._waits.append(waited)
+        return TranscodeSlot(self, waited)
+
+    def _release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self):
+        waits = sorted(self._waits)
+        return {
+            'slots': self.slots,
+            'active': self._active,
+            'queue_depth': len(self._waiters),
+            'max_queue': self.max_queue,
+            'queue_timeout': self.queue_timeout,
+            'peak_active': self.peak_active,
+            'peak_queued': self.peak_queued,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'wait_ms': {
+                'avg': round(sum(waits) / len(waits) * 1000, 1) if waits else None,
+                'p95': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else None,
+                'max': round(waits[-1] * 1000, 1) if waits else None,
+            },
+        }